@@ -1,7 +1,17 @@
 // Configuration
 const SERVER_URL = 'localhost:8001';
-const WS_URL = `ws://${SERVER_URL}/ws`;
-const HTTP_URL = `http://${SERVER_URL}/data`;
+// Symbol to display, e.g. index.html?symbol=MSFT (server default otherwise)
+const SYMBOL = (new URLSearchParams(window.location.search).get('symbol') || '').toUpperCase();
+// Most bars wanted per snapshot, about one per pixel of chart width; the server
+// downsamples longer sessions to this, keeping each bucket's highs and lows
+const MAX_POINTS = Math.max(256, Math.round((window.innerWidth || 1024) * (window.devicePixelRatio || 1)));
+const WS_URL = `ws://${SERVER_URL}/ws?max_points=${MAX_POINTS}` + (SYMBOL ? `&symbols=${SYMBOL}` : '');
+const HTTP_URL = `http://${SERVER_URL}/data?max_points=${MAX_POINTS}` + (SYMBOL ? `&symbol=${SYMBOL}` : '');
+// Bar resolution for the price and volume charts, e.g. index.html?resolution=1s
+// (one of 1s, 5s, 1m, 5m, 1h); indicators always use minute bars
+const RESOLUTION = new URLSearchParams(window.location.search).get('resolution') || '5s';
+// How often end-to-end lag is reported back to the server's /latency stats
+const LATENCY_REPORT_INTERVAL_MS = 5000;
 
 // DOM Elements
 const connectionIndicator = document.getElementById('connection-indicator');
@@ -13,6 +23,7 @@ const dayLowElement = document.getElementById('day-low');
 const totalVolumeElement = document.getElementById('total-volume');
 const tradeCountElement = document.getElementById('trade-count');
 const lastUpdateTimeElement = document.getElementById('last-update-time');
+const latencyTextElement = document.getElementById('latency-text');
 
 // Chart toggle buttons
 const candlestickToggleBtn = document.getElementById('candlestick-toggle');
@@ -35,6 +46,12 @@ let chartType = 'line';
 let lastData = null;
 let processedDataPoints = new Set();
 let rawTradeData = []; // To store raw trades for higher resolution
+let lastSeq = null; // Sequence number of the last applied server update
+let serverState = null; // Full state rebuilt from the snapshot plus deltas
+let resyncRequested = false;
+let resolutionBars = null; // { start, bars }: bars from series index `start` onwards
+let barsSeq = null; // Sequence number of the last applied bar update
+let lastLatencyReport = 0;
 
 // Charts
 let priceChart = null;
@@ -392,7 +409,7 @@ function connectToServer() {
         })
         .then(data => {
             console.log("Initial data received:", data);
-            processData(data);
+            handleServerMessage(data);
         })
         .catch(error => {
             console.error('Error fetching initial data:', error);
@@ -414,13 +431,15 @@ function connectWebSocket() {
     }
     
     // Create new WebSocket connection
-    socket = new WebSocket(WS_URL);
+    socket = new WebSocket(webSocketUrl());
     
     // WebSocket event handlers
     socket.onopen = () => {
         console.log('WebSocket connection established');
         updateConnectionStatus('connected');
         reconnectAttempts = 0;
+        resyncRequested = false;
+        subscribeBars();
         
         // Clear any pending reconnect timeout
         if (reconnectTimeout) {
@@ -437,16 +456,31 @@ function connectWebSocket() {
     };
     
     socket.onmessage = (event) => {
+        const receivedAt = Date.now() / 1000;
         try {
             const data = JSON.parse(event.data);
             
+            if (data.origin) {
+                trackLatency(data.origin, receivedAt);
+            }
+            
             // Handle pong message
             if (data.type === 'pong') {
                 return;
             }
             
-            // Process data update
-            processData(data);
+            if (data.type === 'bars') {
+                handleBarsMessage(data);
+                return;
+            }
+            
+            if (data.type === 'error') {
+                console.error('Server error:', data.message);
+                return;
+            }
+            
+            // Apply snapshot or delta update
+            handleServerMessage(data);
         } catch (error) {
             console.error('Error processing message:', error);
         }
@@ -477,6 +511,35 @@ function connectWebSocket() {
     };
 }
 
+// Show how long ago the simulator emitted the oldest batch in an update,
+// and periodically tell the server for its per-stage latency stats
+function trackLatency(origin, receivedAt) {
+    latencyTextElement.textContent = `Lag: ${Math.round((receivedAt - origin.emitted_at) * 1000)} ms`;
+    
+    if (receivedAt * 1000 - lastLatencyReport >= LATENCY_REPORT_INTERVAL_MS &&
+            socket.readyState === WebSocket.OPEN) {
+        lastLatencyReport = receivedAt * 1000;
+        socket.send(JSON.stringify({ type: 'latency', origin: origin, received_at: receivedAt }));
+    }
+}
+
+// WebSocket URL; after a reconnect only bars from our last one onwards are needed
+function webSocketUrl() {
+    const since = resumeIndex();
+    if (since === null) {
+        return WS_URL;
+    }
+    return WS_URL + `&since=${since}`;
+}
+
+// Index of the newest bar we hold (it may have changed since), or null
+function resumeIndex() {
+    if (serverState === null || serverState.minute_aggregates.length === 0) {
+        return null;
+    }
+    return serverState.minute_aggregates.length - 1;
+}
+
 // Update connection status UI
 function updateConnectionStatus(status) {
     connectionIndicator.className = status;
@@ -496,6 +559,191 @@ function updateConnectionStatus(status) {
     }
 }
 
+// Apply a sequenced snapshot or delta from the server
+function handleServerMessage(data) {
+    if (SYMBOL && data.symbol && data.symbol !== SYMBOL) {
+        return;
+    }
+    
+    if (data.type === 'delta') {
+        if (serverState === null) {
+            requestResync(); // The initial snapshot was lost
+            return;
+        }
+        if (data.seq <= lastSeq) {
+            return; // Already applied
+        }
+        if (data.seq !== lastSeq + 1) {
+            requestResync();
+            return;
+        }
+        applyDelta(data);
+        lastSeq = data.seq;
+    } else if (data.start > 0) {
+        // Snapshot of the bars from `start` onwards, merged into what we hold
+        if (serverState === null || data.start > serverState.minute_aggregates.length) {
+            serverState = null;
+            resyncRequested = false;
+            requestResync(true);
+            return;
+        }
+        applySnapshotRange(data);
+        lastSeq = data.seq !== undefined ? data.seq : null;
+    } else {
+        // Snapshot (also the legacy full-state payload without a type)
+        serverState = {
+            minute_aggregates: placeBars([], data),
+            summary: data.summary,
+            moving_averages: data.moving_averages || {},
+            macd: data.macd || {}
+        };
+        lastSeq = data.seq !== undefined ? data.seq : null;
+    }
+    resyncRequested = false;
+    
+    processData(serverState);
+}
+
+// Merge changed bars and indicator points into the local state
+function applyDelta(delta) {
+    // Bars from `start` onwards are replaced
+    serverState.minute_aggregates.splice(delta.start);
+    delta.minute_aggregates.forEach(bar => serverState.minute_aggregates.push(bar));
+    serverState.summary = delta.summary;
+    
+    Object.entries(delta.moving_averages || {}).forEach(([name, update]) => {
+        const series = serverState.moving_averages[name] || {};
+        truncateSeries(series, update.from);
+        Object.assign(series, update.values);
+        serverState.moving_averages[name] = series;
+    });
+    
+    if (delta.macd && delta.macd.from !== undefined) {
+        ['macd_line', 'signal_line', 'histogram'].forEach(name => {
+            const series = serverState.macd[name] || {};
+            truncateSeries(series, delta.macd.from);
+            Object.assign(series, delta.macd[name]);
+            serverState.macd[name] = series;
+        });
+    }
+}
+
+// Subscribe to bars at the chosen resolution; also used to resync them
+function subscribeBars() {
+    if (RESOLUTION === '1m' || !socket || socket.readyState !== WebSocket.OPEN) {
+        return; // Minute bars already arrive with every snapshot and delta
+    }
+    const request = { type: 'subscribe_bars', resolution: RESOLUTION, max_points: MAX_POINTS };
+    if (SYMBOL) {
+        request.symbol = SYMBOL;
+    }
+    barsSeq = null;
+    socket.send(JSON.stringify(request));
+}
+
+// Apply a bar snapshot or update for the subscribed resolution
+function handleBarsMessage(data) {
+    if ((SYMBOL && data.symbol !== SYMBOL) || data.resolution !== RESOLUTION) {
+        return;
+    }
+    
+    if (data.snapshot) {
+        // Bars are held at their series index minus `start`
+        resolutionBars = {
+            start: data.start,
+            bars: placeBars([], { bars: data.bars, index: data.index && data.index.map(i => i - data.start) }, 'bars')
+        };
+    } else {
+        if (resolutionBars === null || barsSeq === null) {
+            return; // Waiting for the snapshot
+        }
+        if (data.seq <= barsSeq) {
+            return;
+        }
+        const offset = data.start - resolutionBars.start;
+        if (data.seq !== barsSeq + 1 || offset < 0 || offset > resolutionBars.bars.length) {
+            subscribeBars(); // Missed an update, start over from a fresh snapshot
+            return;
+        }
+        resolutionBars.bars.splice(offset);
+        data.bars.forEach(bar => resolutionBars.bars.push(bar));
+    }
+    barsSeq = data.seq;
+    
+    if (serverState) {
+        processData(serverState);
+    }
+}
+
+// Replace bars from `start` onwards and the indicator points that belong to them
+function applySnapshotRange(snapshot) {
+    placeBars(serverState.minute_aggregates, snapshot);
+    serverState.summary = snapshot.summary;
+    
+    const mergeSeries = (target, name, values) => {
+        const keys = Object.keys(values || {}).map(Number);
+        const series = target[name] || {};
+        if (keys.length > 0) {
+            truncateSeries(series, Math.min(...keys));
+            Object.assign(series, values);
+        }
+        target[name] = series;
+    };
+    Object.entries(snapshot.moving_averages || {}).forEach(([name, values]) => {
+        mergeSeries(serverState.moving_averages, name, values);
+    });
+    ['macd_line', 'signal_line', 'histogram'].forEach(name => {
+        if (snapshot.macd && snapshot.macd[name]) {
+            mergeSeries(serverState.macd, name, snapshot.macd[name]);
+        }
+    });
+}
+
+// Put a snapshot's bars at their indices from `start` on, replacing what
+// was there. A downsampled snapshot lists each bar's index in `index` and
+// leaves holes for the bars it skipped.
+function placeBars(target, snapshot, key = 'minute_aggregates') {
+    const start = snapshot.start || 0;
+    target.splice(start);
+    (snapshot[key] || []).forEach((bar, i) => {
+        target[snapshot.index ? snapshot.index[i] : start + i] = bar;
+    });
+    return target;
+}
+
+// Drop index-keyed points at or after `from`, including any past a hole
+// left by a downsampled snapshot
+function truncateSeries(series, from) {
+    Object.keys(series).forEach(key => {
+        if (Number(key) >= from) {
+            delete series[key];
+        }
+    });
+}
+
+// Ask the server to replay the updates missed after lastSeq; if it can't,
+// it sends the bars from our newest one onwards (everything with fullState)
+function requestResync(fullState = false) {
+    if (resyncRequested) {
+        return;
+    }
+    if (socket && socket.readyState === WebSocket.OPEN) {
+        resyncRequested = true;
+        const request = { type: 'resync', max_points: MAX_POINTS };
+        if (SYMBOL) {
+            request.symbol = SYMBOL;
+        }
+        if (lastSeq !== null && !fullState) {
+            request.from_seq = lastSeq;
+        }
+        const since = resumeIndex();
+        if (since !== null && !fullState) {
+            request.since = since;
+        }
+        socket.send(JSON.stringify(request));
+    }
+}
+
 // Process data received from the server
 function processData(data) {
     if (!data) {
@@ -519,11 +767,8 @@ function processData(data) {
         // Store the data
         lastData = data;
         
-        // Process the raw data to get a higher time resolution (10-second intervals)
-        const enhancedData = enhanceTimeResolution(minuteData);
-        
-        // Update charts with enhanced data
-        updateRealCharts(data, enhancedData);
+        // Update charts with the subscribed bar resolution
+        updateRealCharts(data, resolutionChartData());
     } else {
         console.log("No minute data in response or empty array");
     }
@@ -537,59 +782,12 @@ function processData(data) {
     lastUpdateTimeElement.textContent = new Date().toLocaleTimeString();
 }
 
-// Enhance time resolution by creating intermediate points between minute data
-function enhanceTimeResolution(minuteData) {
-    if (!minuteData || minuteData.length < 2) return minuteData;
-    
-    const result = [];
-    
-    // Process each minute data point
-    for (let i = 0; i < minuteData.length - 1; i++) {
-        const current = minuteData[i];
-        const next = minuteData[i + 1];
-        
-        // Add the current point
-        result.push(current);
-        
-        // Get the dates
-        const currentDate = new Date(current.minute);
-        const nextDate = new Date(next.minute);
-        
-        // Calculate time difference in milliseconds
-        const timeDiff = nextDate.getTime() - currentDate.getTime();
-        
-        // If time difference is greater than 10 seconds, create intermediate points
-        if (timeDiff > 10000) { // 10 seconds in milliseconds
-            const steps = Math.floor(timeDiff / 10000); // Number of 10-second intervals
-            
-            // Calculate price step per interval
-            const priceStep = (next.close_price - current.close_price) / steps;
-            const volumeStep = (next.volume - current.volume) / steps;
-            
-            // Create intermediate points
-            for (let j = 1; j < steps; j++) {
-                const intermediateTime = new Date(currentDate.getTime() + j * 10000);
-                const intermediatePrice = parseFloat(current.close_price) + j * priceStep;
-                const intermediateVolume = Math.round(parseInt(current.volume) + j * volumeStep);
-                
-                result.push({
-                    minute: intermediateTime.toISOString(),
-                    min_price: intermediatePrice - (Math.random() * 0.05), // Add slight variation
-                    max_price: intermediatePrice + (Math.random() * 0.05),
-                    open_price: intermediatePrice - (Math.random() * 0.03),
-                    close_price: intermediatePrice,
-                    volume: intermediateVolume,
-                    trade_count: Math.round(current.trade_count / steps),
-                    vwap: intermediatePrice + (Math.random() * 0.02 - 0.01) // Slight variation
-                });
-            }
-        }
+// Bars at the subscribed resolution, keyed by `minute` like the chart helpers expect
+function resolutionChartData() {
+    if (!resolutionBars || resolutionBars.bars.length === 0) {
+        return null;
     }
-    
-    // Add the last point
-    result.push(minuteData[minuteData.length - 1]);
-    
-    return result;
+    return resolutionBars.bars.map(bar => Object.assign({ minute: bar.time }, bar));
 }
 
 // Update summary statistics
@@ -846,11 +1044,11 @@ function aggregateCandlestickData(dataToUse, timeInterval = 5) {
     return aggregatedData;
 }
 
-// Update charts with real data and enhanced resolution
-function updateRealCharts(data, enhancedData) {
+// Update charts; price and volume use the subscribed bar resolution when available
+function updateRealCharts(data, barData) {
     try {
-        // Use enhanced data if available, otherwise use regular minute data
-        const dataToUse = enhancedData || minuteData;
+        // Use bars at the chosen resolution if available, otherwise minute data
+        const dataToUse = barData || minuteData;
         
         if (!dataToUse || dataToUse.length === 0) {
             console.log("No data to display");
@@ -1010,45 +1208,21 @@ function updateRealCharts(data, enhancedData) {
                 if (data.moving_averages.MA10) {
                     const ma10Data = [];
                     
-                    // Create interpolated MA10 data to match enhanced resolution
-                    if (enhancedData) {
-                        // For each enhanced data point, find or interpolate MA10 value
-                        enhancedData.forEach((item, index) => {
-                            const dateObj = new Date(item.minute);
-                            const hour = dateObj.getHours();
+                    // Indicators are computed on minute bars, so they are plotted at minute times
+                    Object.entries(data.moving_averages.MA10).forEach(([index, value]) => {
+                        const dateIndex = parseInt(index);
+                        if (minuteData[dateIndex]) { // holes are bars left out of a downsample
+                            const date = new Date(minuteData[dateIndex].minute);
+                            const hour = date.getHours();
                             
                             if (hour >= 4 && hour <= 16) {
-                                // Find closest minute data point
-                                const minuteIndex = minuteData.findIndex(m => {
-                                    const mDate = new Date(m.minute);
-                                    return mDate >= dateObj;
+                                ma10Data.push({
+                                    x: date,
+                                    y: parseFloat(value)
                                 });
-                                
-                                if (minuteIndex >= 0 && data.moving_averages.MA10[minuteIndex]) {
-                                    ma10Data.push({
-                                        x: dateObj,
-                                        y: parseFloat(data.moving_averages.MA10[minuteIndex])
-                                    });
-                                }
-                            }
-                        });
-                    } else {
-                        // Use regular MA10 data
-                        Object.entries(data.moving_averages.MA10).forEach(([index, value]) => {
-                            const dateIndex = parseInt(index);
-                            if (dateIndex < minuteData.length) {
-                                const date = new Date(minuteData[dateIndex].minute);
-                                const hour = date.getHours();
-                                
-                                if (hour >= 4 && hour <= 16) {
-                                    ma10Data.push({
-                                        x: date,
-                                        y: parseFloat(value)
-                                    });
-                                }
                             }
-                        });
-                    }
+                        }
+                    });
                     
                     if (ma10Data.length > 0) {
                         ma10Data.sort((a, b) => a.x - b.x);
@@ -1069,42 +1243,21 @@ function updateRealCharts(data, enhancedData) {
                 if (data.moving_averages.MA20) {
                     const ma20Data = [];
                     
-                    // Create interpolated MA20 data to match enhanced resolution
-                    if (enhancedData) {
-                        enhancedData.forEach((item, index) => {
-                            const dateObj = new Date(item.minute);
-                            const hour = dateObj.getHours();
+                    // Indicators are computed on minute bars, so they are plotted at minute times
+                    Object.entries(data.moving_averages.MA20).forEach(([index, value]) => {
+                        const dateIndex = parseInt(index);
+                        if (minuteData[dateIndex]) { // holes are bars left out of a downsample
+                            const date = new Date(minuteData[dateIndex].minute);
+                            const hour = date.getHours();
                             
                             if (hour >= 4 && hour <= 16) {
-                                const minuteIndex = minuteData.findIndex(m => {
-                                    const mDate = new Date(m.minute);
-                                    return mDate >= dateObj;
+                                ma20Data.push({
+                                    x: date,
+                                    y: parseFloat(value)
                                 });
-                                
-                                if (minuteIndex >= 0 && data.moving_averages.MA20[minuteIndex]) {
-                                    ma20Data.push({
-                                        x: dateObj,
-                                        y: parseFloat(data.moving_averages.MA20[minuteIndex])
-                                    });
-                                }
                             }
-                        });
-                    } else {
-                        Object.entries(data.moving_averages.MA20).forEach(([index, value]) => {
-                            const dateIndex = parseInt(index);
-                            if (dateIndex < minuteData.length) {
-                                const date = new Date(minuteData[dateIndex].minute);
-                                const hour = date.getHours();
-                                
-                                if (hour >= 4 && hour <= 16) {
-                                    ma20Data.push({
-                                        x: date,
-                                        y: parseFloat(value)
-                                    });
-                                }
-                            }
-                        });
-                    }
+                        }
+                    });
                     
                     if (ma20Data.length > 0) {
                         ma20Data.sort((a, b) => a.x - b.x);
@@ -1302,7 +1455,7 @@ function updateRealCharts(data, enhancedData) {
                         // Create MA10 data points
                         Object.entries(data.moving_averages.MA10).forEach(([index, value]) => {
                             const dateIndex = parseInt(index);
-                            if (dateIndex < minuteData.length) {
+                            if (minuteData[dateIndex]) { // holes are bars left out of a downsample
                                 const date = new Date(minuteData[dateIndex].minute);
                                 const hour = date.getHours();
                                 
@@ -1338,7 +1491,7 @@ function updateRealCharts(data, enhancedData) {
                         
                         Object.entries(data.moving_averages.MA20).forEach(([index, value]) => {
                             const dateIndex = parseInt(index);
-                            if (dateIndex < minuteData.length) {
+                            if (minuteData[dateIndex]) { // holes are bars left out of a downsample
                                 const date = new Date(minuteData[dateIndex].minute);
                                 const hour = date.getHours();
                                 
@@ -1428,72 +1581,34 @@ function updateRealCharts(data, enhancedData) {
             const signalLineData = [];
             const histogramData = [];
             
-            // Similar approach for MACD with interpolation for enhanced data
-            if (enhancedData) {
-                enhancedData.forEach((item, index) => {
-                    const dateObj = new Date(item.minute);
-                    const hour = dateObj.getHours();
+            Object.entries(data.macd.macd_line).forEach(([index, value]) => {
+                const dateIndex = parseInt(index);
+                if (minuteData[dateIndex]) { // holes are bars left out of a downsample
+                    const date = new Date(minuteData[dateIndex].minute);
+                    const hour = date.getHours();
                     
                     if (hour >= 4 && hour <= 16) {
-                        const minuteIndex = minuteData.findIndex(m => {
-                            const mDate = new Date(m.minute);
-                            return mDate >= dateObj;
+                        macdLineData.push({
+                            x: date,
+                            y: parseFloat(value)
                         });
                         
-                        if (minuteIndex >= 0) {
-                            if (data.macd.macd_line[minuteIndex]) {
-                                macdLineData.push({
-                                    x: dateObj,
-                                    y: parseFloat(data.macd.macd_line[minuteIndex])
-                                });
-                            }
-                            
-                            if (data.macd.signal_line[minuteIndex]) {
-                                signalLineData.push({
-                                    x: dateObj,
-                                    y: parseFloat(data.macd.signal_line[minuteIndex])
-                                });
-                            }
-                            
-                            if (data.macd.histogram[minuteIndex]) {
-                                histogramData.push({
-                                    x: dateObj,
-                                    y: parseFloat(data.macd.histogram[minuteIndex])
-                                });
-                            }
+                        if (data.macd.signal_line[index]) {
+                            signalLineData.push({
+                                x: date,
+                                y: parseFloat(data.macd.signal_line[index])
+                            });
                         }
-                    }
-                });
-            } else {
-                Object.entries(data.macd.macd_line).forEach(([index, value]) => {
-                    const dateIndex = parseInt(index);
-                    if (dateIndex < minuteData.length) {
-                        const date = new Date(minuteData[dateIndex].minute);
-                        const hour = date.getHours();
                         
-                        if (hour >= 4 && hour <= 16) {
-                            macdLineData.push({
+                        if (data.macd.histogram[index]) {
+                            histogramData.push({
                                 x: date,
-                                y: parseFloat(value)
+                                y: parseFloat(data.macd.histogram[index])
                             });
-                            
-                            if (data.macd.signal_line[index]) {
-                                signalLineData.push({
-                                    x: date,
-                                    y: parseFloat(data.macd.signal_line[index])
-                                });
-                            }
-                            
-                            if (data.macd.histogram[index]) {
-                                histogramData.push({
-                                    x: date,
-                                    y: parseFloat(data.macd.histogram[index])
-                                });
-                            }
                         }
                     }
-                });
-            }
+                }
+            });
             
             // Sort and update
             macdLineData.sort((a, b) => a.x - b.x);
@@ -0,0 +1,294 @@
+# bars.py
+# OHLCV bars at several resolutions, maintained incrementally while ingesting.
+# The finest bar of each chain is updated per trade; coarser bars are rebuilt
+# from their finer children, only for the buckets a batch touched.
+
+import bisect
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from timeparse import NS_PER_MINUTE, NS_PER_SECOND, isoformat_ns
+
+# Resolution name -> (bucket width in ns, resolution it is rolled up from).
+# None means the bars are fed by trades directly: 1m backs the indicators and
+# the main chart, so it is kept exact per trade rather than rolled up from 5s.
+# Sources must come before the resolutions rolled up from them.
+RESOLUTIONS: Dict[str, Tuple[int, Optional[str]]] = {
+    "1s": (NS_PER_SECOND, None),
+    "5s": (5 * NS_PER_SECOND, "1s"),
+    "1m": (NS_PER_MINUTE, None),
+    "5m": (5 * NS_PER_MINUTE, "1m"),
+    "1h": (60 * NS_PER_MINUTE, "5m"),
+}
+
+class Bar:
+    """OHLCV aggregate for a single time bucket, updated in place"""
+    __slots__ = ('start_ns', 'open_price', 'max_price', 'min_price',
+                 'close_price', 'volume', 'trade_count', 'notional')
+
+    def __init__(self, start_ns: int, price: float):
+        self.start_ns = start_ns
+        self.open_price = price
+        self.max_price = price
+        self.min_price = price
+        self.close_price = price
+        self.volume = 0
+        self.trade_count = 0
+        self.notional = 0.0
+
+    def add(self, price: float, quantity: int):
+        """Fold a single trade into the bar"""
+        if price > self.max_price:
+            self.max_price = price
+        if price < self.min_price:
+            self.min_price = price
+        self.close_price = price
+        self.volume += quantity
+        self.trade_count += 1
+        self.notional += price * quantity
+
+    def merge(self, other: 'Bar'):
+        """Fold in a finer bar that follows everything merged so far"""
+        if other.max_price > self.max_price:
+            self.max_price = other.max_price
+        if other.min_price < self.min_price:
+            self.min_price = other.min_price
+        self.close_price = other.close_price
+        self.volume += other.volume
+        self.trade_count += other.trade_count
+        self.notional += other.notional
+
+    @property
+    def vwap(self) -> Optional[float]:
+        return self.notional / self.volume if self.volume else None
+
+    def to_record(self) -> Dict:
+        """Bar as served by /bars and bar subscriptions"""
+        return {
+            'time': isoformat_ns(self.start_ns),
+            'open_price': self.open_price,
+            'max_price': self.max_price,
+            'min_price': self.min_price,
+            'close_price': self.close_price,
+            'volume': self.volume,
+            'trade_count': self.trade_count,
+            'vwap': self.vwap
+        }
+
+class MinuteBar(Bar):
+    """Minute bar that also renders in the ``minute_aggregates`` format"""
+    __slots__ = ('minute',)
+
+    def __init__(self, start_ns: int, price: float):
+        super().__init__(start_ns, price)
+        self.minute = isoformat_ns(start_ns)
+
+    @property
+    def minute_ns(self) -> int:
+        return self.start_ns
+
+    def to_dict(self) -> Dict:
+        return {
+            'minute': self.minute,
+            'min_price': self.min_price,
+            'max_price': self.max_price,
+            'open_price': self.open_price,
+            'close_price': self.close_price,
+            'volume': self.volume,
+            'trade_count': self.trade_count,
+            'vwap': self.vwap
+        }
+
+# Bar fields and their column dtypes in checkpoints
+_BAR_COLUMNS = (
+    ('start_ns', np.int64), ('open_price', np.float64), ('max_price', np.float64),
+    ('min_price', np.float64), ('close_price', np.float64), ('volume', np.int64),
+    ('trade_count', np.int64), ('notional', np.float64),
+)
+
+class BarSeries:
+    """Bars of one resolution keyed by bucket start, in time order
+
+    Two change markers are kept as bar indexes: ``dirty_from`` covers the
+    batch being ingested (consumed by ``take_dirty``), ``changed_from``
+    everything since the last ``collect_changes``.
+    """
+    def __init__(self, resolution_ns: int, bar_type=Bar):
+        self.resolution_ns = resolution_ns
+        self.bar_type = bar_type
+        self.bars: Dict[int, Bar] = {}
+        self.keys: List[int] = []  # start of every bar, ascending
+        self.dirty_from: Optional[int] = None
+        self.changed_from: Optional[int] = None
+        self._current_start = None
+        self._current_bar = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _insert(self, start_ns: int, bar: Bar) -> int:
+        self.bars[start_ns] = bar
+        if not self.keys or start_ns > self.keys[-1]:
+            self.keys.append(start_ns)
+            return len(self.keys) - 1
+        index = bisect.bisect_left(self.keys, start_ns)
+        self.keys.insert(index, start_ns)
+        return index
+
+    def _mark(self, index: int):
+        if self.dirty_from is None or index < self.dirty_from:
+            self.dirty_from = index
+
+    def bar_for(self, timestamp: int, price: float) -> Bar:
+        """Find or create the bar containing ``timestamp`` and mark it changed
+
+        Consecutive trades almost always fall in the same bucket, so the last
+        bar is cached and a dictionary lookup only happens on a bucket change.
+        The cache is dropped at the end of each batch, so marking on a bucket
+        change is enough.
+        """
+        start_ns = timestamp - timestamp % self.resolution_ns
+        if start_ns == self._current_start:
+            return self._current_bar
+        bar = self.bars.get(start_ns)
+        if bar is None:
+            bar = self.bar_type(start_ns, price)
+            index = self._insert(start_ns, bar)
+        else:
+            index = bisect.bisect_left(self.keys, start_ns)
+        self._current_start = start_ns
+        self._current_bar = bar
+        self._mark(index)
+        return bar
+
+    def rebuild(self, start_ns: int, children: List[Bar]):
+        """Replace the bar at ``start_ns`` with the aggregate of finer ``children``"""
+        bar = self.bar_type(start_ns, children[0].open_price)
+        for child in children:
+            bar.merge(child)
+        if start_ns in self.bars:
+            self.bars[start_ns] = bar
+            index = bisect.bisect_left(self.keys, start_ns)
+        else:
+            index = self._insert(start_ns, bar)
+        self._mark(index)
+
+    def take_dirty(self) -> Optional[int]:
+        """Lowest bar index touched by the current batch, resetting the marker"""
+        self._current_start = None
+        dirty_from, self.dirty_from = self.dirty_from, None
+        if dirty_from is not None and (self.changed_from is None or dirty_from < self.changed_from):
+            self.changed_from = dirty_from
+        return dirty_from
+
+    def collect_changes(self) -> Optional[int]:
+        """Lowest bar index changed since the previous call, or None"""
+        changed_from, self.changed_from = self.changed_from, None
+        return changed_from
+
+    def span(self, start_ns: Optional[int] = None, end_ns: Optional[int] = None,
+             limit: Optional[int] = None) -> Tuple[int, int]:
+        """Index range of bars starting in ``[start_ns, end_ns)``, newest ``limit`` of them"""
+        lo = bisect.bisect_left(self.keys, start_ns) if start_ns is not None else 0
+        hi = bisect.bisect_left(self.keys, end_ns) if end_ns is not None else len(self.keys)
+        if limit is not None:
+            lo = max(lo, hi - limit)
+        return lo, max(lo, hi)
+
+    def records(self, lo: int, hi: Optional[int] = None) -> List[Dict]:
+        bars = self.bars
+        return [bars[key].to_record() for key in self.keys[lo:hi]]
+
+    def to_columns(self) -> Dict[str, np.ndarray]:
+        """Every bar as columns, e.g. for a checkpoint"""
+        bars = [self.bars[key] for key in self.keys]
+        return {
+            name: np.array([getattr(bar, name) for bar in bars], dtype=dtype)
+            for name, dtype in _BAR_COLUMNS
+        }
+
+    def load_columns(self, columns: Dict[str, np.ndarray]):
+        """Replace the contents with bars from ``to_columns``"""
+        self.clear()
+        lists = {name: columns[name].tolist() for name, _ in _BAR_COLUMNS}
+        for values in zip(*lists.values()):
+            record = dict(zip(lists, values))
+            bar = self.bar_type(record['start_ns'], record['open_price'])
+            for name, value in record.items():
+                setattr(bar, name, value)
+            self.bars[bar.start_ns] = bar
+            self.keys.append(bar.start_ns)
+
+    def clear(self):
+        self.bars.clear()
+        del self.keys[:]
+        self.dirty_from = None
+        self.changed_from = None
+        self._current_start = None
+        self._current_bar = None
+
+def roll_up(fine: BarSeries, coarse: BarSeries, from_index: Optional[int]):
+    """Rebuild the coarse bars covering fine bars ``from_index`` onwards"""
+    keys = fine.keys
+    if from_index is None or from_index >= len(keys):
+        return
+    width = coarse.resolution_ns
+    # Start at the first fine bar of the bucket holding the first touched one
+    index = bisect.bisect_left(keys, keys[from_index] - keys[from_index] % width)
+    while index < len(keys):
+        bucket = keys[index] - keys[index] % width
+        stop = bisect.bisect_left(keys, bucket + width, index)
+        coarse.rebuild(bucket, [fine.bars[key] for key in keys[index:stop]])
+        index = stop
+
+class BarSet:
+    """One BarSeries per resolution in RESOLUTIONS, updated together"""
+    def __init__(self):
+        self.series: Dict[str, BarSeries] = {
+            name: BarSeries(width, MinuteBar if width == NS_PER_MINUTE else Bar)
+            for name, (width, _) in RESOLUTIONS.items()
+        }
+        self._fed = [self.series[name] for name, (_, source) in RESOLUTIONS.items() if source is None]
+        self._rollups = [(name, source) for name, (_, source) in RESOLUTIONS.items() if source is not None]
+
+    def __getitem__(self, resolution: str) -> BarSeries:
+        return self.series[resolution]
+
+    def fed_lookups(self) -> List:
+        """``bar_for`` of every directly fed series; each trade is added to all of their bars"""
+        return [series.bar_for for series in self._fed]
+
+    def finish_batch(self) -> Dict[str, Optional[int]]:
+        """Roll the batch up into coarser bars; returns the first touched index per resolution"""
+        dirty = {name: self.series[name].take_dirty()
+                 for name, (_, source) in RESOLUTIONS.items() if source is None}
+        for name, source in self._rollups:
+            roll_up(self.series[source], self.series[name], dirty[source])
+            dirty[name] = self.series[name].take_dirty()
+        return dirty
+
+    def collect_changes(self) -> Dict[str, Dict]:
+        """Changed bars per resolution since the previous call: ``{"start": i, "bars": [...]}``"""
+        changes = {}
+        for name, series in self.series.items():
+            start = series.collect_changes()
+            if start is not None:
+                changes[name] = {'start': start, 'bars': series.records(start)}
+        return changes
+
+    def to_columns(self) -> Dict[str, np.ndarray]:
+        """All series as flat columns named ``<resolution>/<field>``"""
+        return {f"{name}/{field}": values
+                for name, series in self.series.items()
+                for field, values in series.to_columns().items()}
+
+    def load_columns(self, columns: Dict[str, np.ndarray]):
+        for name, series in self.series.items():
+            prefix = f"{name}/"
+            series.load_columns({key[len(prefix):]: values for key, values in columns.items()
+                                 if key.startswith(prefix)})
+
+    def clear(self):
+        for series in self.series.values():
+            series.clear()
@@ -0,0 +1,455 @@
+# bench.py
+# End-to-end load and latency benchmark for the server.
+# Starts server.py in a subprocess and feeds it trades, either from a built-in
+# synthetic generator (configurable trades/s, symbols and burstiness) or from
+# simulator.py replaying CSV files. N headless clients connect to /ws, and the
+# run reports ingest rate, broadcast fan-out time, end-to-end latency
+# percentiles, payload sizes and the server's RSS. Linux only (RSS is read
+# from /proc).
+#
+# Usage: python bench.py --rate 20000 --symbols 4 --clients 50 --duration 30
+#        python bench.py --source simulator --data AAPL.csv --speed max --clients 10
+
+import argparse
+import asyncio
+import bisect
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import aiohttp
+import numpy as np
+from aiohttp import web
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Run a service from this checkout on a given port with patched config.
+# argv: config JSON, port
+SERVER_BOOTSTRAP = f"""
+import json, sys
+sys.path.insert(0, {REPO_DIR!r})
+import uvicorn, server
+server.simulator_config.update(json.loads(sys.argv[1]))
+uvicorn.run(server.app, host="127.0.0.1", port=int(sys.argv[2]), log_level="warning")
+"""
+
+SIMULATOR_BOOTSTRAP = f"""
+import json, sys
+sys.path.insert(0, {REPO_DIR!r})
+import uvicorn, simulator
+simulator.data_config["files"] = json.loads(sys.argv[1])
+uvicorn.run(simulator.app, host="127.0.0.1", port=int(sys.argv[2]), log_level="warning")
+"""
+
+VENUES = ["XNAS", "XNYS", "ARCX", "BATS", "EDGX", "IEXG"]
+
+class TradeClock:
+    """When each symbol's n-th trade was sent, to time its arrival at clients
+
+    Deltas carry the symbol's running ``trade_count``, so the trade that
+    brought the count to n is the newest one a delta can contain.
+    """
+    def __init__(self):
+        self.counts: Dict[str, List[int]] = defaultdict(list)
+        self.times: Dict[str, List[float]] = defaultdict(list)
+        self.total = 0
+
+    def record(self, counts: Dict[str, int], sent: float):
+        for symbol, count in counts.items():
+            running = self.counts[symbol]
+            running.append((running[-1] if running else 0) + count)
+            self.times[symbol].append(sent)
+            self.total += count
+
+    def sent_at(self, symbol: str, count: int) -> Optional[float]:
+        running = self.counts.get(symbol)
+        if not running:
+            return None
+        index = bisect.bisect_left(running, count)
+        return self.times[symbol][index] if index < len(running) else None
+
+def _count_symbols(trades: List[Dict]) -> Dict[str, int]:
+    counts: Dict[str, int] = defaultdict(int)
+    for trade in trades:
+        counts[trade.get('symbol')] += 1
+    return counts
+
+class SyntheticFeed:
+    """Stand-in simulator: serves /ws and an empty /trades/resume, and generates trades
+
+    Messages go out at ``message_hz``. Each carries a Poisson number of
+    trades around ``rate / message_hz``, scaled by a gamma-distributed factor
+    with mean 1 and coefficient of variation ``burstiness`` (0 = steady).
+    """
+    def __init__(self, symbols: List[str], rate: float, burstiness: float, message_hz: float,
+                 clock: TradeClock, seed: int = 1):
+        self.symbols = symbols
+        self.rate = rate
+        self.burstiness = burstiness
+        self.message_hz = message_hz
+        self.clock = clock
+        self.rng = np.random.default_rng(seed)
+        self.prices = [100.0 + 10 * i for i in range(len(symbols))]
+        self.consumer: Optional[web.WebSocketResponse] = None
+        self.connected = asyncio.Event()
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self, port: int):
+        app = web.Application()
+        app.router.add_get('/ws', self._websocket)
+        app.router.add_get('/trades/resume', self._resume)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, '127.0.0.1', port).start()
+
+    async def stop(self):
+        if self.consumer is not None:
+            await self.consumer.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _resume(self, request):
+        return web.Response(body=b"", content_type="application/x-ndjson")
+
+    async def _websocket(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.consumer = ws
+        self.connected.set()
+        async for _ in ws:
+            pass
+        return ws
+
+    def make_trades(self, count: int) -> List[Dict]:
+        rng = self.rng
+        symbol_codes = rng.integers(0, len(self.symbols), count).tolist()
+        steps = rng.normal(0.0, 0.01, count).tolist()
+        quantities = rng.integers(1, 500, count).tolist()
+        venue_codes = rng.integers(0, len(VENUES), count).tolist()
+        now = time.time_ns()
+        trades = []
+        for offset, (code, step, quantity, venue) in enumerate(zip(symbol_codes, steps, quantities, venue_codes)):
+            price = self.prices[code] = round(max(0.01, self.prices[code] + step), 2)
+            trades.append({'symbol': self.symbols[code], 'timestamp_ns': now + offset, 'price': price,
+                           'quantity': quantity, 'venue': VENUES[venue]})
+        return trades
+
+    async def run(self, stop: asyncio.Event):
+        """Send trades until ``stop`` is set, on a drift-free monotonic schedule"""
+        await self.connected.wait()
+        per_message = self.rate / self.message_hz
+        shape = 1.0 / self.burstiness ** 2 if self.burstiness > 0 else None
+        started = time.monotonic()
+        tick = 0
+        while not stop.is_set() and not self.consumer.closed:
+            tick += 1
+            mean = per_message * (self.rng.gamma(shape, 1.0 / shape) if shape else 1.0)
+            count = int(self.rng.poisson(mean))
+            if count:
+                trades = self.make_trades(count)
+                self.clock.record(_count_symbols(trades), time.time())
+                await self.consumer.send_str(json.dumps({"timestamp": datetime.now().isoformat(), "trades": trades}))
+            delay = started + tick / self.message_hz - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+class Stats:
+    """Measurements from every client, recorded only between warm-up and the end"""
+    def __init__(self, clock: TradeClock):
+        self.clock = clock
+        self.recording = False
+        self.latencies: List[float] = []
+        self.sizes: Dict[str, List[int]] = defaultdict(list)
+        self.publishes: Dict[tuple, List[float]] = {}  # (symbol, seq) -> [published, first, last, clients]
+        self.errors = 0
+
+    def on_message(self, text: str, received: float):
+        if not self.recording:
+            return
+        message = json.loads(text)
+        message_type = message.get('type', 'unknown')
+        self.sizes[message_type].append(len(text))
+        if message_type != 'delta':
+            return
+        symbol = message.get('symbol')
+        sent = self.clock.sent_at(symbol, message['summary']['trade_count'])
+        if sent is not None:
+            self.latencies.append(received - sent)
+        key = (symbol, message.get('seq'))
+        publish = self.publishes.get(key)
+        if publish is None:
+            published = datetime.fromisoformat(message['timestamp']).timestamp()
+            self.publishes[key] = [published, received, received, 1]
+        else:
+            publish[2] = received
+            publish[3] += 1
+
+async def run_client(session: aiohttp.ClientSession, url: str, stats: Stats, stop: asyncio.Event):
+    """One headless browser: subscribe through the URL and record every message"""
+    try:
+        async with session.ws_connect(url, max_msg_size=0) as ws:
+            while not stop.is_set():
+                try:
+                    msg = await asyncio.wait_for(ws.receive(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    continue
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    stats.on_message(msg.data, time.time())
+                elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                    stats.errors += 1
+                    return
+    except aiohttp.ClientError:
+        stats.errors += 1
+
+def process_tree_rss(pid: int) -> int:
+    """Resident set size in bytes of a process and all its descendants"""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return total
+
+async def wait_for_http(session: aiohttp.ClientSession, url: str, process, timeout: float = 30.0):
+    """Poll ``url`` until it answers 200, failing early if ``process`` exits"""
+    deadline = time.monotonic() + timeout
+    while True:
+        if process.returncode is not None:
+            raise RuntimeError(f"Service for {url} exited with code {process.returncode}, see its log")
+        try:
+            async with session.get(url) as resp:
+                if resp.status == 200:
+                    return await resp.json()
+        except aiohttp.ClientError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"{url} did not come up within {timeout:.0f} s")
+        await asyncio.sleep(0.2)
+
+def ensure_port_free(port: int):
+    """Refuse to start if something (e.g. a leftover service) already listens on ``port``"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        if probe.connect_ex(("127.0.0.1", port)) == 0:
+            raise RuntimeError(f"Port {port} is already in use")
+
+async def spawn(bootstrap: str, config, port: int, workdir: str, name: str):
+    log = open(os.path.join(workdir, f"{name}.log"), "wb")
+    return await asyncio.create_subprocess_exec(
+        sys.executable, "-c", bootstrap, json.dumps(config), str(port),
+        cwd=workdir, stdout=log, stderr=log)
+
+async def tap_simulator(session: aiohttp.ClientSession, url: str, clock: TradeClock, stop: asyncio.Event,
+                        connected: asyncio.Event):
+    """Record when the simulator sends each trade, as a second consumer of its stream"""
+    async with session.ws_connect(url, max_msg_size=0) as ws:
+        connected.set()
+        while not stop.is_set():
+            try:
+                msg = await asyncio.wait_for(ws.receive(), timeout=0.5)
+            except asyncio.TimeoutError:
+                continue
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                return
+            trades = json.loads(msg.data).get('trades')
+            if trades:
+                clock.record(_count_symbols(trades), time.time())
+
+async def server_trade_counts(session: aiohttp.ClientSession, base_url: str, symbols: List[str]) -> int:
+    """Trades the server has ingested over the given symbols"""
+    total = 0
+    for symbol in symbols:
+        async with session.get(f"{base_url}/data", params={"symbol": symbol, "limit": 1}) as resp:
+            total += (await resp.json())['summary']['trade_count']
+    return total
+
+def _percentiles(values, scale: float = 1.0) -> Dict[str, float]:
+    if not len(values):
+        return {}
+    values = np.asarray(values) * scale
+    points = {f"p{p:g}": float(np.percentile(values, p)) for p in (50, 90, 99, 99.9)}
+    points["max"] = float(values.max())
+    return points
+
+def _format_percentiles(points: Dict[str, float], unit: str) -> str:
+    return "  ".join(f"{name} {value:.1f} {unit}" for name, value in points.items()) or "no samples"
+
+async def run_benchmark(args) -> Dict:
+    ensure_port_free(args.feed_port)
+    ensure_port_free(args.server_port)
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    clock = TradeClock()
+    stats = Stats(clock)
+    stop_feed, stop_clients = asyncio.Event(), asyncio.Event()
+    processes = []
+    feed = None
+    tasks = []
+    rss_samples = []
+    try:
+        async with aiohttp.ClientSession() as session:
+            # Trade source
+            feed_url = f"http://127.0.0.1:{args.feed_port}"
+            if args.source == "synthetic":
+                symbols = [f"SYN{i:02d}" for i in range(1, args.symbols + 1)]
+                feed = SyntheticFeed(symbols, args.rate, args.burstiness, args.message_hz, clock, args.seed)
+                await feed.start(args.feed_port)
+            else:
+                files = [os.path.abspath(path) for path in args.data]
+                simulator = await spawn(SIMULATOR_BOOTSTRAP, files, args.feed_port, workdir, "simulator")
+                processes.append(simulator)
+                status = await wait_for_http(session, f"{feed_url}/simulation/status", simulator, timeout=120)
+                symbols = status["symbols"]
+
+            # Server under test, with its trade log in the scratch directory
+            server_url = f"http://127.0.0.1:{args.server_port}"
+            server = await spawn(SERVER_BOOTSTRAP, {"ws_url": f"ws://127.0.0.1:{args.feed_port}/ws",
+                                                    "resume_url": f"{feed_url}/trades/resume"},
+                                 args.server_port, workdir, "server")
+            processes.append(server)
+            await wait_for_http(session, f"{server_url}/symbols", server)
+            rss_samples.append(process_tree_rss(server.pid))
+
+            # Headless browsers, one symbol each like the dashboard
+            for i in range(args.clients):
+                url = f"ws://127.0.0.1:{args.server_port}/ws?symbols={symbols[i % len(symbols)]}"
+                tasks.append(asyncio.create_task(run_client(session, url, stats, stop_clients)))
+
+            # Start the flow of trades
+            if feed is not None:
+                tasks.append(asyncio.create_task(feed.run(stop_feed)))
+            else:
+                tapped = asyncio.Event()
+                tasks.append(asyncio.create_task(
+                    tap_simulator(session, f"ws://127.0.0.1:{args.feed_port}/ws", clock, stop_feed, tapped)))
+                await tapped.wait()
+                await asyncio.sleep(2.0)  # let the server finish connecting
+                control = f"{feed_url}/simulation/control"
+                speed = args.speed if args.speed == "max" else float(args.speed)
+                await session.post(control, json={"action": "speed", "speed": speed})
+                await session.post(control, json={"action": "start"})
+
+            await asyncio.sleep(args.warmup)
+            stats.recording = True
+            sent_before = clock.total
+            ingested_before = await server_trade_counts(session, server_url, symbols)
+            started = time.monotonic()
+            while time.monotonic() - started < args.duration:
+                await asyncio.sleep(0.5)
+                rss_samples.append(process_tree_rss(server.pid))
+            elapsed = time.monotonic() - started
+            sent = clock.total - sent_before
+            ingested = await server_trade_counts(session, server_url, symbols) - ingested_before
+            stats.recording = False
+
+            stop_feed.set()
+            stop_clients.set()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        if feed is not None:
+            await feed.stop()
+        for process in processes:
+            if process.returncode is None:
+                process.terminate()
+                try:
+                    await asyncio.wait_for(process.wait(), timeout=10)
+                except asyncio.TimeoutError:
+                    process.kill()
+                    await process.wait()
+        if args.keep_workdir:
+            print(f"Service logs kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    publishes = list(stats.publishes.values())
+    messages = sum(len(sizes) for sizes in stats.sizes.values())
+    payload_bytes = sum(sum(sizes) for sizes in stats.sizes.values())
+    return {
+        "config": vars(args),
+        "symbols": symbols,
+        "duration_seconds": elapsed,
+        "sent_trades_per_second": sent / elapsed,
+        "ingested_trades_per_second": ingested / elapsed,
+        "client_messages_per_second": messages / elapsed,
+        "client_bytes_per_second": payload_bytes / elapsed,
+        "client_errors": stats.errors,
+        "latency_ms": _percentiles(stats.latencies, 1000),
+        "publish_to_first_client_ms": _percentiles([first - published for published, first, _, _ in publishes], 1000),
+        "publish_to_last_client_ms": _percentiles([last - published for published, _, last, _ in publishes], 1000),
+        "payloads": {
+            message_type: {"count": len(sizes), "mean_bytes": float(np.mean(sizes)),
+                           "p99_bytes": float(np.percentile(sizes, 99))}
+            for message_type, sizes in stats.sizes.items()
+        },
+        "server_rss_mb": {"start": rss_samples[0] / 2**20, "peak": max(rss_samples) / 2**20,
+                          "end": rss_samples[-1] / 2**20},
+    }
+
+def print_report(result: Dict):
+    config = result["config"]
+    if config["source"] == "synthetic":
+        source = (f"synthetic, {config['rate']:g} trades/s target, {config['symbols']} symbols, "
+                  f"burstiness {config['burstiness']:g}")
+    else:
+        source = f"simulator replaying {', '.join(config['data'])} at speed {config['speed']}"
+    rss = result["server_rss_mb"]
+    lines = [
+        ("Source", source),
+        ("Sent", f"{result['sent_trades_per_second']:.0f} trades/s over {result['duration_seconds']:.1f} s"),
+        ("Ingested", f"{result['ingested_trades_per_second']:.0f} trades/s by the server"),
+        ("Clients", f"{config['clients']} clients, {result['client_messages_per_second']:.0f} messages/s, "
+                    f"{result['client_bytes_per_second'] / 2**20:.2f} MB/s, {result['client_errors']} errors"),
+        ("Latency", _format_percentiles(result["latency_ms"], "ms") + "  (trade sent -> delta received)"),
+        ("Fan-out", "first " + _format_percentiles(result["publish_to_first_client_ms"], "ms")),
+        ("", "last  " + _format_percentiles(result["publish_to_last_client_ms"], "ms")),
+    ]
+    for index, (message_type, payload) in enumerate(sorted(result["payloads"].items())):
+        lines.append(("Payloads" if index == 0 else "",
+                      f"{message_type}: {payload['count']} messages, mean {payload['mean_bytes'] / 1024:.1f} KB, "
+                      f"p99 {payload['p99_bytes'] / 1024:.1f} KB"))
+    lines.append(("Server RSS", f"start {rss['start']:.0f} MB, peak {rss['peak']:.0f} MB, end {rss['end']:.0f} MB"))
+    for label, text in lines:
+        print(f"{label:<11} {text}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load and latency benchmark for server.py")
+    parser.add_argument("--source", choices=("synthetic", "simulator"), default="synthetic")
+    parser.add_argument("--rate", type=float, default=10_000, help="synthetic trades per second")
+    parser.add_argument("--symbols", type=int, default=4, help="synthetic symbols")
+    parser.add_argument("--burstiness", type=float, default=0.0,
+                        help="coefficient of variation of the per-message trade rate, 0 for steady")
+    parser.add_argument("--message-hz", type=float, default=100.0, help="synthetic messages per second")
+    parser.add_argument("--data", nargs="+", default=["AAPL.csv"], help="CSV files for --source simulator")
+    parser.add_argument("--speed", default="max", help="simulator replay speed, a number or 'max'")
+    parser.add_argument("--clients", type=int, default=10, help="headless WebSocket clients")
+    parser.add_argument("--duration", type=float, default=20.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3.0, help="unmeasured seconds before measuring")
+    parser.add_argument("--server-port", type=int, default=8101)
+    parser.add_argument("--feed-port", type=int, default=8100, help="port of the synthetic feed or simulator")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--keep-workdir", action="store_true", help="keep service logs and the trade log")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    result = asyncio.run(run_benchmark(args))
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
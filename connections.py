@@ -0,0 +1,295 @@
+# connections.py
+# WebSocket fan-out shared by the simulator and the server.
+# Every connection gets its own bounded outbound queue and writer task, so a
+# slow client only ever delays itself. Clients may also be relayed through a
+# link to a fan-out worker process (see fanout.py).
+
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Dict, Iterable, Optional, Set
+
+from fastapi import WebSocket
+
+from metrics import REGISTRY, Registry
+
+# What to do with a client whose outbound queue is full
+SLOW_CONSUMER_POLICIES = ("drop", "disconnect")
+
+JSON_ENCODE_SECONDS = REGISTRY.histogram("json_encode_seconds", "Time to encode outbound JSON messages")
+SEND_LATENCY_SECONDS = REGISTRY.histogram("websocket_send_latency_seconds",
+                                          "Time from queueing a message for a client until it is sent")
+MESSAGES_SENT = REGISTRY.counter("websocket_messages_sent_total", "Messages written to client sockets")
+MESSAGES_DROPPED = REGISTRY.counter("websocket_messages_dropped_total",
+                                    "Queued messages discarded because a client fell behind")
+SLOW_CLIENTS_DISCONNECTED = REGISTRY.counter("websocket_slow_clients_disconnected_total",
+                                             "Clients disconnected because their queue was full")
+
+def encode_json(message) -> str:
+    """``json.dumps``, timed into the JSON encode histogram"""
+    started = time.perf_counter()
+    message_json = json.dumps(message)
+    JSON_ENCODE_SECONDS.observe(time.perf_counter() - started)
+    return message_json
+
+class ClientConnection:
+    """Outbound queue and writer task for a single WebSocket
+
+    For a client relayed by a fan-out worker, ``relay`` is the connection of
+    the worker's link and the client has no queue of its own. A link's
+    ``relayed`` counts its clients per topic.
+    """
+    __slots__ = ('websocket', 'queue', 'ready', 'writable', 'writer', 'dropped', 'topics',
+                 'relay', 'relayed')
+
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.topics: Set[str] = set()
+        self.relay: Optional['ClientConnection'] = None
+        self.relayed: Optional[Dict[str, int]] = None
+        self.queue = deque(maxlen=queue_size)  # (queued_at, message_json or binary frame)
+        self.ready = asyncio.Event()
+        self.writable = asyncio.Event()  # set while the queue is at most half full
+        self.writable.set()
+        self.writer: Optional[asyncio.Task] = None
+        self.dropped = 0
+
+class ConnectionManager:
+    """Track WebSocket clients and fan messages out to them concurrently
+
+    ``broadcast`` only enqueues, it never waits on a socket. When a client's
+    queue is full the ``slow_consumer_policy`` decides what happens:
+
+    - ``"drop"``: discard the oldest queued messages and keep the latest
+    - ``"disconnect"``: close the connection
+
+    Clients may subscribe to topics (e.g. symbols); a broadcast with a topic
+    only reaches that topic's subscribers. Producers that would rather slow
+    down than trip the policy can ``await wait_writable()`` between sends.
+
+    Fan-out worker links are added with ``connect_relay``. Clients connected
+    through one (websockets with ``link`` and ``client_id`` attributes) are
+    tracked like any other, but their messages are queued on the link, and
+    a topic broadcast is queued once per link however many of its clients
+    subscribe. A link that falls behind is always disconnected, since
+    dropping its frames would corrupt its clients' subscriptions.
+    """
+    def __init__(self, logger: logging.Logger, label: str = "connection",
+                 queue_size: int = 256, slow_consumer_policy: str = "drop",
+                 relay_queue_size: int = 65536):
+        if slow_consumer_policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown slow consumer policy: {slow_consumer_policy}")
+        self.logger = logger
+        self.label = label
+        self.queue_size = queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        self.low_watermark = queue_size // 2
+        self.relay_queue_size = relay_queue_size
+        self.active_connections: Dict[WebSocket, ClientConnection] = {}
+        self.subscribers: Dict[str, Set[ClientConnection]] = {}
+        self.relays: Dict[object, ClientConnection] = {}
+
+    async def connect(self, websocket: WebSocket):
+        await websocket.accept()
+        client = ClientConnection(websocket, self.queue_size)
+        link = getattr(websocket, "link", None)
+        if link is not None:
+            client.relay = self.relays.get(link)
+            if client.relay is None:
+                raise ConnectionError(f"Fan-out link of {self.label} {websocket.client_id} is closed")
+        else:
+            client.writer = asyncio.create_task(self._writer(client))
+        self.active_connections[websocket] = client
+        self.logger.info(f"New {self.label} established. Total connections: {len(self.active_connections)}")
+
+    async def connect_relay(self, link):
+        """Add a fan-out worker link; its frames are queued and written like a client's messages"""
+        await link.accept()
+        relay = ClientConnection(link, self.relay_queue_size)
+        relay.relayed = {}
+        relay.writer = asyncio.create_task(self._writer(relay))
+        self.relays[link] = relay
+        self.logger.info(f"Fan-out worker linked. Total workers: {len(self.relays)}")
+
+    def register_metrics(self, registry: Registry = REGISTRY):
+        """Expose connection count and outbound queue depths, computed at scrape time"""
+        def clients():
+            return [*self.active_connections.values(), *self.relays.values()]
+        registry.gauge("websocket_connections", f"Open {self.label}s", lambda: len(self.active_connections))
+        registry.gauge("websocket_queued_messages", "Messages waiting in all outbound queues",
+                       lambda: sum(len(client.queue) for client in clients()))
+        registry.gauge("websocket_max_queued_messages", "Deepest outbound queue",
+                       lambda: max((len(client.queue) for client in clients()), default=0))
+    
+    def disconnect(self, websocket: WebSocket):
+        if websocket in self.relays:
+            self.disconnect_relay(websocket)
+            return
+        client = self.active_connections.pop(websocket, None)
+        if client is None:
+            return
+        self.unsubscribe(websocket, list(client.topics), client)
+        client.writable.set()  # release producers waiting on this client
+        if client.relay is not None and client.relay.websocket in self.relays:
+            self._enqueue(client.relay, client.relay.websocket.close_frame(websocket.client_id), time.monotonic())
+        if client.writer is not None and client.writer is not asyncio.current_task():
+            client.writer.cancel()
+        self.logger.info(f"{self.label.capitalize()} closed. Remaining connections: {len(self.active_connections)}")
+
+    def disconnect_relay(self, link):
+        """Drop a fan-out worker link; its clients are dropped by whoever serves them"""
+        relay = self.relays.pop(link, None)
+        if relay is None:
+            return
+        for topic in relay.relayed:
+            self._discard_subscriber(topic, relay)
+        relay.relayed.clear()
+        if relay.writer is not None and relay.writer is not asyncio.current_task():
+            relay.writer.cancel()
+        link.closed()
+        self.logger.info(f"Fan-out worker unlinked. Remaining workers: {len(self.relays)}")
+
+    def subscribe(self, websocket: WebSocket, topics: Iterable[str]) -> Set[str]:
+        """Add topics for a client, returning the ones it was not yet subscribed to"""
+        client = self.active_connections.get(websocket)
+        if client is None:
+            return set()
+        added = set(topics) - client.topics
+        if client.relay is not None:
+            self._relay_topics(client, added, 1)
+        else:
+            for topic in added:
+                self.subscribers.setdefault(topic, set()).add(client)
+        client.topics |= added
+        return added
+
+    def unsubscribe(self, websocket: WebSocket, topics: Iterable[str],
+                    client: Optional[ClientConnection] = None):
+        client = client or self.active_connections.get(websocket)
+        if client is None:
+            return
+        removed = client.topics.intersection(topics)
+        client.topics -= removed
+        if client.relay is not None:
+            self._relay_topics(client, removed, -1)
+            return
+        for topic in removed:
+            self._discard_subscriber(topic, client)
+
+    def _discard_subscriber(self, topic: str, client: ClientConnection):
+        subscribers = self.subscribers.get(topic)
+        if subscribers is not None:
+            subscribers.discard(client)
+            if not subscribers:
+                del self.subscribers[topic]
+
+    def _relay_topics(self, client: ClientConnection, topics: Set[str], change: int):
+        """Count a relayed client's topics on its link, telling the worker"""
+        relay = client.relay
+        if not topics or relay.websocket not in self.relays:
+            return
+        for topic in topics:
+            count = relay.relayed.get(topic, 0) + change
+            if count > 0:
+                relay.relayed[topic] = count
+                self.subscribers.setdefault(topic, set()).add(relay)
+            else:
+                relay.relayed.pop(topic, None)
+                self._discard_subscriber(topic, relay)
+        frame = relay.websocket.topics_frame(client.websocket.client_id, sorted(topics), change > 0)
+        self._enqueue(relay, frame, time.monotonic())
+
+    def send(self, websocket: WebSocket, message_json: str):
+        """Queue an encoded message for one client, after anything already queued"""
+        client = self.active_connections.get(websocket)
+        if client is None:
+            return
+        if client.relay is not None:
+            if client.relay.websocket in self.relays:
+                frame = client.relay.websocket.send_frame(websocket.client_id, message_json)
+                self._enqueue(client.relay, frame, time.monotonic())
+            return
+        self._enqueue(client, message_json, time.monotonic())
+
+    async def broadcast(self, message: Dict, topic: Optional[str] = None):
+        if not self.active_connections:
+            return
+
+        try:
+            await self.broadcast_text(encode_json(message), topic)
+        except Exception as e:
+            self.logger.error(f"Error broadcasting message: {e}")
+
+    async def broadcast_text(self, message_json: str, topic: Optional[str] = None):
+        """Queue an already encoded message for every client, or a topic's subscribers"""
+        if topic is None:
+            clients = [client for client in self.active_connections.values() if client.relay is None]
+            clients.extend(self.relays.values())
+        else:
+            clients = list(self.subscribers.get(topic, ()))
+        queued_at = time.monotonic()
+        for client in clients:
+            if client.relayed is not None:
+                self._enqueue(client, client.websocket.publish_frame(topic, message_json), queued_at)
+            else:
+                self._enqueue(client, message_json, queued_at)
+
+    async def wait_writable(self, topic: Optional[str] = None, websocket: Optional[WebSocket] = None):
+        """Wait until every client's queue is back at or below half full
+
+        Only a topic's subscribers, or a single client, if given.
+        """
+        if websocket is not None:
+            client = self.active_connections.get(websocket)
+            clients = [client.relay or client] if client is not None else []
+        elif topic is not None:
+            clients = list(self.subscribers.get(topic, ()))
+        else:
+            clients = [*self.active_connections.values(), *self.relays.values()]
+        for client in clients:
+            await client.writable.wait()
+
+    def _enqueue(self, client: ClientConnection, message_json: str, queued_at: float):
+        if len(client.queue) == client.queue.maxlen:
+            if self.slow_consumer_policy == "disconnect" or client.relayed is not None:
+                self.logger.warning(f"Disconnecting slow {self.label}: {len(client.queue)} messages queued")
+                SLOW_CLIENTS_DISCONNECTED.inc()
+                self.disconnect(client.websocket)
+                asyncio.create_task(self._close(client.websocket))
+                return
+            client.dropped += 1  # deque(maxlen) discards the oldest entry
+            MESSAGES_DROPPED.inc()
+        client.queue.append((queued_at, message_json))
+        if len(client.queue) > self.low_watermark:
+            client.writable.clear()
+        client.ready.set()
+
+    async def _writer(self, client: ClientConnection):
+        """Drain one client's queue; only this task ever awaits its socket"""
+        try:
+            while True:
+                await client.ready.wait()
+                while client.queue:
+                    queued_at, message = client.queue.popleft()
+                    if isinstance(message, bytes) and client.relayed is None:
+                        await client.websocket.send_bytes(message)  # a binary frame
+                    else:
+                        await client.websocket.send_text(message)
+                    SEND_LATENCY_SECONDS.observe(time.monotonic() - queued_at)
+                    MESSAGES_SENT.inc()
+                    if len(client.queue) <= self.low_watermark:
+                        client.writable.set()
+                client.ready.clear()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.logger.error(f"Error sending message to {self.label}: {e}")
+            self.disconnect(client.websocket)
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await asyncio.wait_for(websocket.close(code=1013), timeout=5)
+        except Exception:
+            pass
@@ -0,0 +1,35 @@
+# downsample.py
+# Shape-preserving downsampling of per-bar series for chart snapshots.
+# Each series is cut into equal buckets and keeps the smallest and largest
+# value of every bucket (min/max per bucket), so spikes survive that plain
+# striding would skip. Several series share one set of indices, so a
+# downsampled snapshot still has every plotted point on a kept bar.
+
+from typing import Sequence
+
+import numpy as np
+
+def minmax_indices(values: np.ndarray, max_points: int) -> np.ndarray:
+    """Ascending indices of at most ``max_points`` (4 or more) values tracing the series' shape
+
+    The first and last values are always kept; every bucket in between keeps
+    its minimum and maximum. NaNs are never picked over a number.
+    """
+    count = len(values)
+    if count <= max_points:
+        return np.arange(count)
+    buckets = max(1, (max_points - 2) // 2)
+    inner = np.asarray(values[1:-1], dtype=np.float64)
+    bucket = np.arange(len(inner)) * buckets // len(inner)
+    starts = np.r_[0, np.flatnonzero(np.diff(bucket)) + 1]
+    missing = np.isnan(inner)
+    # Within each bucket (bucket is ascending) sort by value: the first is the minimum
+    lowest = np.lexsort((np.where(missing, np.inf, inner), bucket))[starts]
+    highest = np.lexsort((-np.where(missing, -np.inf, inner), bucket))[starts]
+    picked = np.concatenate(([0], lowest + 1, highest + 1, [count - 1]))
+    return np.unique(picked)
+
+def shared_indices(series: Sequence[np.ndarray], max_points: int) -> np.ndarray:
+    """Union of ``minmax_indices`` of equal-length series, at most ``max_points`` in all"""
+    share = max(4, max_points // len(series))
+    return np.unique(np.concatenate([minmax_indices(values, share) for values in series]))
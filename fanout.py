@@ -0,0 +1,335 @@
+# fanout.py
+# Multi-process fan-out tier. One ingest process (server.py) connects to the
+# simulator, runs the processors and encodes every update once; N worker
+# processes accept the browser WebSockets and relay them over a Unix socket.
+#
+# Each worker holds one link to the ingest process. The ingest process
+# serves a relayed browser exactly like a direct one (snapshots, resyncs,
+# subscriptions), but queues its messages on the link, and sends a topic
+# update once per link; the worker then copies it to its own subscribers.
+# Everything other than /ws is proxied to the ingest process's HTTP API.
+#
+#   python fanout.py 4    # ingest process plus 4 fan-out workers on :8001
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import struct
+import subprocess
+import sys
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+import uvicorn
+from fastapi import FastAPI, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.middleware.cors import CORSMiddleware
+
+from connections import ConnectionManager
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("fanout")
+
+# Configuration of the fan-out tier
+fanout_config = {
+    "workers": 4,  # fan-out worker processes
+    "port": 8001,  # browsers connect here, as they would to server.py alone
+    "ingest_port": 8002,  # HTTP API of the ingest process, proxied by the workers
+    "socket": "fanout.sock",  # Unix socket the ingest process relays browsers through
+    "send_queue_size": 256,  # messages buffered per browser
+    "slow_consumer_policy": "drop",  # "drop" keeps the latest updates, "disconnect" closes the socket
+    "reconnect_delay": 1.0  # seconds between attempts to link to the ingest process
+}
+
+# Link framing: header and payload lengths, then a JSON header and the
+# UTF-8 payload (an already encoded browser message, passed through as is)
+_FRAME = struct.Struct('<II')
+
+def encode_frame(header: Dict, payload: str = "") -> bytes:
+    head = json.dumps(header).encode()
+    body = payload.encode()
+    return _FRAME.pack(len(head), len(body)) + head + body
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[Dict, str]:
+    head_length, body_length = _FRAME.unpack(await reader.readexactly(_FRAME.size))
+    data = await reader.readexactly(head_length + body_length)
+    return json.loads(data[:head_length]), data[head_length:].decode()
+
+# Ingest side
+
+class RelayLink:
+    """Ingest end of a worker's link, queued in a ConnectionManager like a client
+
+    ``send_text`` writes frames built by the ``*_frame`` methods, which the
+    ConnectionManager calls for the clients relayed through this link.
+    """
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.clients: Dict[int, 'RelayedWebSocket'] = {}
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, frame: bytes):
+        self.writer.write(frame)
+        await self.writer.drain()
+
+    async def close(self, code: int = 1000):
+        self.writer.close()
+
+    def closed(self):
+        """The link is gone: disconnect every client relayed through it"""
+        for websocket in self.clients.values():
+            websocket.deliver(None)
+        self.clients.clear()
+
+    def publish_frame(self, topic: Optional[str], message_json: str) -> bytes:
+        return encode_frame({"op": "publish", "topic": topic}, message_json)
+
+    def send_frame(self, client_id: int, message_json: str) -> bytes:
+        return encode_frame({"op": "send", "client": client_id}, message_json)
+
+    def topics_frame(self, client_id: int, topics: List[str], subscribe: bool) -> bytes:
+        return encode_frame({"op": "subscribe" if subscribe else "unsubscribe",
+                             "client": client_id, "topics": topics})
+
+    def close_frame(self, client_id: int) -> bytes:
+        return encode_frame({"op": "close", "client": client_id})
+
+class RelayedWebSocket:
+    """A browser connected to a fan-out worker, as seen by the ingest process
+
+    Stands in for the browser's WebSocket in the ingest process's endpoint
+    code: messages from the browser are delivered into an inbox, and
+    ``None`` marks the browser (or its worker) as gone.
+    """
+    def __init__(self, link: RelayLink, client_id: int, query_params: Dict[str, str]):
+        self.link = link
+        self.client_id = client_id
+        self.query_params = query_params
+        self.inbox: asyncio.Queue = asyncio.Queue()
+
+    async def accept(self):
+        pass
+
+    def deliver(self, message_json: Optional[str]):
+        self.inbox.put_nowait(message_json)
+
+    async def receive_text(self) -> str:
+        message_json = await self.inbox.get()
+        if message_json is None:
+            raise WebSocketDisconnect(1001)
+        return message_json
+
+    async def close(self, code: int = 1000):
+        self.deliver(None)
+
+async def serve_relay(manager: ConnectionManager, path: str, handler) -> asyncio.AbstractServer:
+    """Accept fan-out worker links on the Unix socket ``path``
+
+    ``handler(websocket)`` serves one relayed browser until it disconnects,
+    as the endpoint does for a direct one.
+    """
+    async def serve_browser(websocket: RelayedWebSocket):
+        try:
+            await handler(websocket)
+        except Exception as e:
+            logger.error(f"Error serving relayed browser {websocket.client_id}: {e}")
+
+    async def serve_link(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        link = RelayLink(writer)
+        await manager.connect_relay(link)
+        try:
+            while True:
+                header, payload = await read_frame(reader)
+                op, client_id = header.get("op"), header.get("client")
+                if op == "connect":
+                    websocket = RelayedWebSocket(link, client_id, header.get("query") or {})
+                    link.clients[client_id] = websocket
+                    asyncio.create_task(serve_browser(websocket))
+                elif op == "message":
+                    websocket = link.clients.get(client_id)
+                    if websocket is not None:
+                        websocket.deliver(payload)
+                elif op == "disconnect":
+                    websocket = link.clients.pop(client_id, None)
+                    if websocket is not None:
+                        websocket.deliver(None)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.error(f"Error reading from fan-out worker: {e}")
+        finally:
+            manager.disconnect_relay(link)
+            writer.close()
+
+    if os.path.exists(path):
+        os.remove(path)  # left behind by a previous run
+    return await asyncio.start_unix_server(serve_link, path=path)
+
+# Worker side
+
+app = FastAPI(title="Trading Data Fan-out Worker")
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+manager = ConnectionManager(
+    logger,
+    label="browser connection",
+    queue_size=fanout_config["send_queue_size"],
+    slow_consumer_policy=fanout_config["slow_consumer_policy"]
+)
+
+# Browsers of this worker by the id the ingest process knows them by
+browsers: Dict[int, WebSocket] = {}
+client_ids = itertools.count(1)
+link_writer: Optional[asyncio.StreamWriter] = None
+http_session: Optional[aiohttp.ClientSession] = None
+
+def to_ingest(header: Dict, payload: str = ""):
+    """Send a frame to the ingest process; browser messages are small and rare"""
+    if link_writer is not None:
+        link_writer.write(encode_frame(header, payload))
+
+async def relay_from_ingest():
+    """Keep a link to the ingest process and apply its frames to local browsers"""
+    global link_writer
+    while True:
+        try:
+            reader, writer = await asyncio.open_unix_connection(fanout_config["socket"])
+        except OSError:
+            await asyncio.sleep(fanout_config["reconnect_delay"])
+            continue
+        link_writer = writer
+        logger.info("Linked to ingest process")
+        try:
+            while True:
+                header, payload = await read_frame(reader)
+                op = header.get("op")
+                if op == "publish":
+                    await manager.broadcast_text(payload, header.get("topic"))
+                    continue
+                websocket = browsers.get(header.get("client"))
+                if websocket is None:
+                    continue  # already disconnected
+                if op == "send":
+                    manager.send(websocket, payload)
+                elif op == "subscribe":
+                    manager.subscribe(websocket, header["topics"])
+                elif op == "unsubscribe":
+                    manager.unsubscribe(websocket, header["topics"])
+                elif op == "close":
+                    del browsers[header["client"]]
+                    await close_browser(websocket, 1011)
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            logger.warning(f"Lost link to ingest process: {e}")
+        except Exception as e:
+            logger.error(f"Error relaying from ingest process: {e}")
+        finally:
+            link_writer = None
+            writer.close()
+        # The ingest process no longer knows these browsers; they reconnect and resync
+        orphaned = list(browsers.values())
+        browsers.clear()
+        for websocket in orphaned:
+            await close_browser(websocket, 1012)
+        await asyncio.sleep(fanout_config["reconnect_delay"])
+
+async def close_browser(websocket: WebSocket, code: int):
+    manager.disconnect(websocket)
+    try:
+        await asyncio.wait_for(websocket.close(code=code), timeout=5)
+    except Exception:
+        pass
+
+@app.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket):
+    """Relay a browser to the ingest process, which sees its query parameters and messages"""
+    if link_writer is None:
+        await websocket.close(code=1013)  # try again later
+        return
+    await manager.connect(websocket)
+    client_id = next(client_ids)
+    browsers[client_id] = websocket
+    to_ingest({"op": "connect", "client": client_id, "query": dict(websocket.query_params)})
+    try:
+        while True:
+            to_ingest({"op": "message", "client": client_id}, await websocket.receive_text())
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"WebSocket error: {e}")
+    finally:
+        manager.disconnect(websocket)
+        if browsers.pop(client_id, None) is not None:
+            to_ingest({"op": "disconnect", "client": client_id})
+
+# Request and response headers passed through the HTTP proxy
+_PROXIED_REQUEST_HEADERS = ("accept", "accept-encoding", "content-type", "if-none-match")
+_PROXIED_RESPONSE_HEADERS = ("cache-control", "content-encoding", "content-type", "etag")
+
+@app.api_route("/{path:path}", methods=["GET", "POST"])
+async def proxy_to_ingest(path: str, request: Request):
+    """Everything but /ws is answered by the ingest process"""
+    headers = {name: value for name, value in request.headers.items()
+               if name.lower() in _PROXIED_REQUEST_HEADERS}
+    url = f"http://127.0.0.1:{fanout_config['ingest_port']}/{path}"
+    try:
+        async with http_session.request(request.method, url, params=list(request.query_params.multi_items()),
+                                        data=await request.body(), headers=headers) as resp:
+            body = await resp.read()
+            response_headers = {name: value for name, value in resp.headers.items()
+                                if name.lower() in _PROXIED_RESPONSE_HEADERS}
+            return Response(content=body, status_code=resp.status, headers=response_headers)
+    except aiohttp.ClientError as e:
+        logger.error(f"Error proxying {path} to ingest process: {e}")
+        return Response(content="Ingest process unavailable", status_code=502)
+
+@app.on_event("startup")
+async def startup_event():
+    global http_session
+    http_session = aiohttp.ClientSession(auto_decompress=False)
+    asyncio.create_task(relay_from_ingest())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if http_session is not None:
+        await http_session.close()
+
+# Bootstrap of the ingest process: server.py, relaying through the socket.
+# argv: fan-out config JSON
+INGEST_BOOTSTRAP = """
+import json, sys
+import uvicorn, server
+config = json.loads(sys.argv[1])
+server.fanout_config["socket"] = config["socket"]
+uvicorn.run(server.app, host="127.0.0.1", port=config["ingest_port"], log_level="info")
+"""
+
+# Run the ingest process and the fan-out workers
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        fanout_config["workers"] = int(sys.argv[1])
+    ingest = subprocess.Popen([sys.executable, "-c", INGEST_BOOTSTRAP, json.dumps(fanout_config)])
+    try:
+        uvicorn.run(
+            "fanout:app",
+            host="0.0.0.0",
+            port=fanout_config["port"],
+            workers=fanout_config["workers"],
+            log_level="info"
+        )
+    finally:
+        ingest.terminate()
+        ingest.wait()
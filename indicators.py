@@ -0,0 +1,486 @@
+# indicators.py
+# Technical indicators over the minute bars, kept up to date incrementally.
+# Each indicator keeps one value per bar for every output (None while it is
+# warming up) plus the per-bar recursion state it needs, so a change to bar
+# i is absorbed by recomputing bars i onwards. A vectorized batch path fills
+# the whole history when an indicator is first requested or many bars change.
+# IndicatorEngine shares one instance per parameter set between subscribers.
+
+import math
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from bars import BarSeries
+from timeparse import NS_PER_MINUTE
+
+NS_PER_DAY = 24 * 60 * NS_PER_MINUTE
+
+# Recomputing more bars than this at once uses the batch path
+BATCH_BARS = 64
+
+# Upper bound for every numeric parameter
+MAX_PARAMETER = 10_000
+
+class BarInputs:
+    """Per-bar input columns for indicators, aligned with the minute bars"""
+    FIELDS = ('start_ns', 'close', 'high', 'low', 'volume', 'notional')
+
+    def __init__(self):
+        self.start_ns: List[int] = []
+        self.close: List[float] = []
+        self.high: List[float] = []
+        self.low: List[float] = []
+        self.volume: List[int] = []
+        self.notional: List[float] = []
+
+    def __len__(self):
+        return len(self.close)
+
+    def update(self, series: BarSeries, start: int):
+        """Refresh the columns for bars ``start`` onwards"""
+        for name in self.FIELDS:
+            del getattr(self, name)[start:]
+        bars = series.bars
+        for key in series.keys[start:]:
+            bar = bars[key]
+            self.start_ns.append(bar.start_ns)
+            self.close.append(bar.close_price)
+            self.high.append(bar.max_price)
+            self.low.append(bar.min_price)
+            self.volume.append(bar.volume)
+            self.notional.append(bar.notional)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            'start_ns': np.array(self.start_ns, dtype=np.int64),
+            'close': np.array(self.close, dtype=np.float64),
+            'high': np.array(self.high, dtype=np.float64),
+            'low': np.array(self.low, dtype=np.float64),
+            'volume': np.array(self.volume, dtype=np.float64),
+            'notional': np.array(self.notional, dtype=np.float64),
+        }
+
+    def clear(self):
+        for name in self.FIELDS:
+            del getattr(self, name)[:]
+
+def _ewm(values: np.ndarray, alpha: float) -> np.ndarray:
+    """``y[0] = x[0]``, ``y[i] = y[i-1] + alpha * (x[i] - y[i-1])``"""
+    if not len(values):
+        return values
+    return pd.Series(values).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+
+def _window_sums(values: np.ndarray, period: int) -> np.ndarray:
+    """Sum of each value and the ``period - 1`` before it (fewer at the start)"""
+    totals = np.cumsum(values)
+    sums = totals.copy()
+    sums[period:] -= totals[:-period]
+    return sums
+
+def _warm_up(values: np.ndarray, bars: int) -> np.ndarray:
+    """Blank out the first ``bars`` values"""
+    values = values.astype(np.float64, copy=True)
+    values[:bars] = np.nan
+    return values
+
+class Indicator(ABC):
+    """Per-bar output columns plus the per-bar state of their recursions
+
+    Subclasses define ``PARAMS`` (name -> default, which also fixes the
+    type), ``OUTPUTS`` and ``STATE`` column names, ``step`` computing bar
+    ``i`` from the columns before it, and ``batch`` computing every column
+    at once from ``BarInputs.arrays()`` (NaN where an output has no value).
+    """
+    name = ""
+    PARAMS: Dict[str, Any] = {}
+    OUTPUTS: Tuple[str, ...] = ('value',)
+    STATE: Tuple[str, ...] = ()
+
+    def __init__(self, **params):
+        self.params = params
+        self.columns: Dict[str, List] = {name: [] for name in self.OUTPUTS + self.STATE}
+
+    def __len__(self):
+        return len(self.columns[self.OUTPUTS[0]])
+
+    @abstractmethod
+    def step(self, inputs: BarInputs, i: int):
+        """Append bar ``i``'s value of every column"""
+
+    @abstractmethod
+    def batch(self, arrays: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Every column for all bars at once"""
+
+    def update(self, inputs: BarInputs, start: int):
+        """Recompute bars ``start`` onwards"""
+        if len(inputs) - start > BATCH_BARS:
+            self.backfill(inputs)
+            return
+        for column in self.columns.values():
+            del column[start:]
+        for i in range(start, len(inputs)):
+            self.step(inputs, i)
+
+    def backfill(self, inputs: BarInputs):
+        """Recompute every bar with the batch path"""
+        if not len(inputs):
+            for column in self.columns.values():
+                del column[:]
+            return
+        results = self.batch(inputs.arrays())
+        for name, column in self.columns.items():
+            values = results[name].tolist()
+            if name in self.OUTPUTS:
+                values = [None if math.isnan(value) else value for value in values]
+            column[:] = values
+
+    def points(self, lo: int = 0, hi: Optional[int] = None) -> Dict:
+        """Output values of bars ``lo:hi``"""
+        return {'from': lo, 'values': {name: self.columns[name][lo:hi] for name in self.OUTPUTS}}
+
+class SMA(Indicator):
+    """Simple moving average of closes, from a running sum of the window"""
+    name = "sma"
+    PARAMS = {'period': 20}
+    STATE = ('sum',)
+
+    def step(self, inputs, i):
+        period = self.params['period']
+        close = inputs.close
+        total = close[i] + (self.columns['sum'][-1] if i else 0.0)
+        if i >= period:
+            total -= close[i - period]
+        self.columns['sum'].append(total)
+        self.columns['value'].append(total / period if i + 1 >= period else None)
+
+    def batch(self, arrays):
+        period = self.params['period']
+        sums = _window_sums(arrays['close'], period)
+        return {'sum': sums, 'value': _warm_up(sums / period, period - 1)}
+
+class EMA(Indicator):
+    """Exponential moving average of closes, seeded with the first close"""
+    name = "ema"
+    PARAMS = {'period': 20}
+    STATE = ('ema',)
+
+    def step(self, inputs, i):
+        close = inputs.close[i]
+        ema = self.columns['ema']
+        value = close if i == 0 else ema[-1] + 2.0 / (self.params['period'] + 1) * (close - ema[-1])
+        ema.append(value)
+        self.columns['value'].append(value if i + 1 >= self.params['period'] else None)
+
+    def batch(self, arrays):
+        ema = _ewm(arrays['close'], 2.0 / (self.params['period'] + 1))
+        return {'ema': ema, 'value': _warm_up(ema, self.params['period'] - 1)}
+
+class MACD(Indicator):
+    """MACD line, signal line and histogram using ``ewm(adjust=False)`` recursions"""
+    name = "macd"
+    PARAMS = {'fast': 12, 'slow': 26, 'signal': 9}
+    OUTPUTS = ('macd', 'signal', 'histogram')
+    STATE = ('fast_ema', 'slow_ema')
+
+    def step(self, inputs, i):
+        columns = self.columns
+        close = inputs.close[i]
+        if i == 0:
+            fast = slow = close
+            macd = signal = 0.0
+        else:
+            fast_ema, slow_ema = columns['fast_ema'][-1], columns['slow_ema'][-1]
+            fast = fast_ema + 2.0 / (self.params['fast'] + 1) * (close - fast_ema)
+            slow = slow_ema + 2.0 / (self.params['slow'] + 1) * (close - slow_ema)
+            macd = fast - slow
+            signal = columns['signal'][-1]
+            signal += 2.0 / (self.params['signal'] + 1) * (macd - signal)
+        columns['fast_ema'].append(fast)
+        columns['slow_ema'].append(slow)
+        columns['macd'].append(macd)
+        columns['signal'].append(signal)
+        columns['histogram'].append(macd - signal)
+
+    def batch(self, arrays):
+        close = arrays['close']
+        fast = _ewm(close, 2.0 / (self.params['fast'] + 1))
+        slow = _ewm(close, 2.0 / (self.params['slow'] + 1))
+        macd = fast - slow
+        signal = _ewm(macd, 2.0 / (self.params['signal'] + 1))
+        return {'fast_ema': fast, 'slow_ema': slow, 'macd': macd, 'signal': signal,
+                'histogram': macd - signal}
+
+def _rsi(avg_gain: float, avg_loss: float) -> float:
+    if avg_loss == 0:
+        return 100.0 if avg_gain > 0 else 50.0
+    return 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+
+class RSI(Indicator):
+    """Relative strength index with Wilder smoothing of gains and losses"""
+    name = "rsi"
+    PARAMS = {'period': 14}
+    STATE = ('avg_gain', 'avg_loss')
+
+    def step(self, inputs, i):
+        columns = self.columns
+        avg_gain = avg_loss = 0.0
+        if i > 0:
+            change = inputs.close[i] - inputs.close[i - 1]
+            gain, loss = max(change, 0.0), max(-change, 0.0)
+            if i == 1:
+                avg_gain, avg_loss = gain, loss
+            else:
+                alpha = 1.0 / self.params['period']
+                avg_gain = columns['avg_gain'][-1] + alpha * (gain - columns['avg_gain'][-1])
+                avg_loss = columns['avg_loss'][-1] + alpha * (loss - columns['avg_loss'][-1])
+        columns['avg_gain'].append(avg_gain)
+        columns['avg_loss'].append(avg_loss)
+        columns['value'].append(_rsi(avg_gain, avg_loss) if i >= self.params['period'] else None)
+
+    def batch(self, arrays):
+        changes = np.diff(arrays['close'])
+        alpha = 1.0 / self.params['period']
+        avg_gain = np.concatenate(([0.0], _ewm(np.maximum(changes, 0.0), alpha)))
+        avg_loss = np.concatenate(([0.0], _ewm(np.maximum(-changes, 0.0), alpha)))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            value = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+        value = np.where(avg_loss == 0, np.where(avg_gain > 0, 100.0, 50.0), value)
+        return {'avg_gain': avg_gain, 'avg_loss': avg_loss, 'value': _warm_up(value, self.params['period'])}
+
+class BollingerBands(Indicator):
+    """Moving average of closes with bands ``k`` population standard deviations away
+
+    Running sums of the window's closes and of their squared distances from
+    the first close give both in constant time per bar.
+    """
+    name = "bollinger"
+    PARAMS = {'period': 20, 'k': 2.0}
+    OUTPUTS = ('middle', 'upper', 'lower')
+    STATE = ('sum', 'sum_squares')
+
+    def _bands(self, total, sum_squares, first_close):
+        period = self.params['period']
+        middle = total / period
+        variance = sum_squares / period - (middle - first_close) ** 2
+        return middle, self.params['k'] * np.sqrt(np.maximum(variance, 0.0))
+
+    def step(self, inputs, i):
+        period = self.params['period']
+        columns = self.columns
+        close = inputs.close
+        total, sum_squares = close[i], (close[i] - close[0]) ** 2
+        if i:
+            total += columns['sum'][-1]
+            sum_squares += columns['sum_squares'][-1]
+        if i >= period:
+            total -= close[i - period]
+            sum_squares -= (close[i - period] - close[0]) ** 2
+        columns['sum'].append(total)
+        columns['sum_squares'].append(sum_squares)
+        middle = upper = lower = None
+        if i + 1 >= period:
+            middle, width = self._bands(total, sum_squares, close[0])
+            width = float(width)
+            upper, lower = middle + width, middle - width
+        columns['middle'].append(middle)
+        columns['upper'].append(upper)
+        columns['lower'].append(lower)
+
+    def batch(self, arrays):
+        period = self.params['period']
+        close = arrays['close']
+        sums = _window_sums(close, period)
+        sum_squares = _window_sums((close - close[0]) ** 2, period)
+        middle, width = self._bands(sums, sum_squares, close[0])
+        middle = _warm_up(middle, period - 1)
+        return {'sum': sums, 'sum_squares': sum_squares, 'middle': middle,
+                'upper': middle + width, 'lower': middle - width}
+
+class ATR(Indicator):
+    """Average true range with Wilder smoothing"""
+    name = "atr"
+    PARAMS = {'period': 14}
+    STATE = ('atr',)
+
+    def step(self, inputs, i):
+        high, low = inputs.high[i], inputs.low[i]
+        true_range = high - low
+        if i > 0:
+            previous_close = inputs.close[i - 1]
+            true_range = max(true_range, abs(high - previous_close), abs(low - previous_close))
+        atr = self.columns['atr']
+        value = true_range if i == 0 else atr[-1] + (true_range - atr[-1]) / self.params['period']
+        atr.append(value)
+        self.columns['value'].append(value if i + 1 >= self.params['period'] else None)
+
+    def batch(self, arrays):
+        high, low, close = arrays['high'], arrays['low'], arrays['close']
+        true_range = high - low
+        if len(close) > 1:
+            previous_close = close[:-1]
+            true_range[1:] = np.maximum.reduce([true_range[1:], np.abs(high[1:] - previous_close),
+                                                np.abs(low[1:] - previous_close)])
+        atr = _ewm(true_range, 1.0 / self.params['period'])
+        return {'atr': atr, 'value': _warm_up(atr, self.params['period'] - 1)}
+
+def _session_cumsum(values: np.ndarray, days: np.ndarray) -> np.ndarray:
+    """Running sum of ``values`` that restarts whenever ``days`` changes"""
+    totals = np.cumsum(values)
+    firsts = np.concatenate(([0], np.flatnonzero(np.diff(days)) + 1))
+    bases = (totals - values)[firsts]
+    return totals - np.repeat(bases, np.diff(np.append(firsts, len(values))))
+
+class VWAPBands(Indicator):
+    """Session VWAP with bands ``k`` volume-weighted standard deviations away
+
+    Sessions are calendar days of the bar start. Deviations are measured
+    between bar VWAPs and the session VWAP.
+    """
+    name = "vwap_bands"
+    PARAMS = {'k': 2.0}
+    OUTPUTS = ('vwap', 'upper', 'lower')
+    STATE = ('cum_volume', 'cum_notional', 'cum_squares')
+
+    def step(self, inputs, i):
+        columns = self.columns
+        volume, notional = inputs.volume[i], inputs.notional[i]
+        cum_volume, cum_notional, cum_squares = 0, 0.0, 0.0
+        if i > 0 and inputs.start_ns[i] // NS_PER_DAY == inputs.start_ns[i - 1] // NS_PER_DAY:
+            cum_volume = columns['cum_volume'][-1]
+            cum_notional = columns['cum_notional'][-1]
+            cum_squares = columns['cum_squares'][-1]
+        cum_volume += volume
+        cum_notional += notional
+        if volume:
+            cum_squares += notional * notional / volume  # volume * bar_vwap ** 2
+        columns['cum_volume'].append(cum_volume)
+        columns['cum_notional'].append(cum_notional)
+        columns['cum_squares'].append(cum_squares)
+        vwap = upper = lower = None
+        if cum_volume:
+            vwap = cum_notional / cum_volume
+            width = self.params['k'] * math.sqrt(max(cum_squares / cum_volume - vwap * vwap, 0.0))
+            upper, lower = vwap + width, vwap - width
+        columns['vwap'].append(vwap)
+        columns['upper'].append(upper)
+        columns['lower'].append(lower)
+
+    def batch(self, arrays):
+        volume, notional = arrays['volume'], arrays['notional']
+        days = arrays['start_ns'] // NS_PER_DAY
+        with np.errstate(divide='ignore', invalid='ignore'):
+            squares = np.where(volume > 0, notional * notional / volume, 0.0)
+        cum_volume = _session_cumsum(volume, days)
+        cum_notional = _session_cumsum(notional, days)
+        cum_squares = _session_cumsum(squares, days)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vwap = np.where(cum_volume > 0, cum_notional / cum_volume, np.nan)
+            width = self.params['k'] * np.sqrt(np.maximum(cum_squares / cum_volume - vwap * vwap, 0.0))
+        return {'cum_volume': cum_volume, 'cum_notional': cum_notional, 'cum_squares': cum_squares,
+                'vwap': vwap, 'upper': vwap + width, 'lower': vwap - width}
+
+# Indicator name -> class
+INDICATORS: Dict[str, type] = {
+    cls.name: cls for cls in (SMA, EMA, MACD, RSI, BollingerBands, ATR, VWAPBands)
+}
+
+def describe_indicators() -> Dict[str, Dict]:
+    """Parameters (with defaults) and outputs of every registered indicator"""
+    return {name: {'params': dict(cls.PARAMS), 'outputs': list(cls.OUTPUTS)} for name, cls in INDICATORS.items()}
+
+def normalize_spec(spec) -> Dict:
+    """Validate an indicator request like ``{"name": "rsi", "period": 9}`` and fill in defaults
+
+    A bare name selects the defaults. Raises ValueError for anything invalid.
+    """
+    if isinstance(spec, str):
+        spec = {'name': spec}
+    if not isinstance(spec, dict):
+        raise ValueError(f"Invalid indicator: {spec!r}")
+    name = str(spec.get('name', '')).lower()
+    cls = INDICATORS.get(name)
+    if cls is None:
+        raise ValueError(f"Unknown indicator: {name}")
+    unknown = set(spec) - {'name'} - set(cls.PARAMS)
+    if unknown:
+        raise ValueError(f"Unknown parameters for {name}: {', '.join(sorted(unknown))}")
+    normalized = {'name': name}
+    for param, default in cls.PARAMS.items():
+        value = spec.get(param, default)
+        try:
+            value = type(default)(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid {param} for {name}: {value!r}")
+        if not 0 < value <= MAX_PARAMETER:
+            raise ValueError(f"{param} for {name} must be in (0, {MAX_PARAMETER}]")
+        normalized[param] = value
+    return normalized
+
+def spec_key(spec: Dict) -> str:
+    """Canonical name of a normalized spec, e.g. ``rsi(period=14)``"""
+    params = ",".join(f"{param}={value}" for param, value in spec.items() if param != 'name')
+    return f"{spec['name']}({params})"
+
+class IndicatorEngine:
+    """Indicators over one symbol's minute bars, one instance per parameter set
+
+    ``pinned`` indicators are always kept; any others live while the latest
+    ``set_active`` call lists them. Changed bars are tracked per indicator
+    for ``collect_changes``.
+    """
+    def __init__(self, pinned: Iterable = ()):
+        self.inputs = BarInputs()
+        self.indicators: Dict[str, Indicator] = {}
+        self.pinned: Set[str] = set()
+        self._changed_from: Dict[str, int] = {}
+        for spec in pinned:
+            self.pinned.add(self.add(spec))
+
+    def __getitem__(self, key: str) -> Indicator:
+        return self.indicators[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.indicators
+
+    def add(self, spec) -> str:
+        """Key of the indicator for ``spec``, creating and backfilling it if needed"""
+        spec = normalize_spec(spec)
+        key = spec_key(spec)
+        if key not in self.indicators:
+            indicator = self.indicators[key] = INDICATORS[spec['name']](
+                **{param: value for param, value in spec.items() if param != 'name'})
+            indicator.backfill(self.inputs)
+        return key
+
+    def set_active(self, specs: Iterable) -> List[str]:
+        """Keep exactly the pinned indicators and those for ``specs``, returning the latter's keys"""
+        keys = {self.add(spec) for spec in specs}
+        for key in list(self.indicators):
+            if key not in keys and key not in self.pinned:
+                del self.indicators[key]
+                self._changed_from.pop(key, None)
+        return sorted(keys)
+
+    def update(self, series: BarSeries, start: int):
+        """Advance every indicator over bars ``start`` onwards of ``series``"""
+        self.inputs.update(series, start)
+        changed_from = self._changed_from
+        for key, indicator in self.indicators.items():
+            indicator.update(self.inputs, start)
+            if key not in changed_from or start < changed_from[key]:
+                changed_from[key] = start
+
+    def collect_changes(self) -> Dict[str, Dict]:
+        """Changed values per indicator since the previous call, from the first changed bar"""
+        changes = {key: self.indicators[key].points(start) for key, start in self._changed_from.items()}
+        self._changed_from.clear()
+        return changes
+
+    def clear(self):
+        self.inputs.clear()
+        for indicator in self.indicators.values():
+            indicator.backfill(self.inputs)
+        self._changed_from.clear()
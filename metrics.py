@@ -0,0 +1,186 @@
+# metrics.py
+# Minimal Prometheus-style metrics shared by the simulator and the server,
+# rendered in the text exposition format by their /metrics endpoints.
+# Hot paths only bump numbers (a counter increment, a bisect into fixed
+# histogram buckets); anything that has to walk data structures is a gauge
+# callback evaluated only when /metrics is scraped.
+
+import asyncio
+import bisect
+import inspect
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds in seconds, from tens of microseconds to seconds
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+class Counter:
+    """Monotonically increasing count"""
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def state(self):
+        return self.value
+
+    def samples(self, extra=None) -> List[str]:
+        value = self.value + (extra or 0)
+        return [f"{self.name} {_format_value(value)}"]
+
+class Gauge:
+    """Current value, either set directly or computed by a callback at scrape time
+
+    A callback may be a coroutine function, and may return a dict from
+    ``label`` values to numbers instead of a single number.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, callback: Optional[Callable] = None,
+                 label: Optional[str] = None):
+        self.name = name
+        self.help = help_text
+        self.callback = callback
+        self.label = label
+        self.value = 0
+
+    def set(self, value: float):
+        self.value = value
+
+    async def collect(self):
+        if self.callback is None:
+            return self.value
+        value = self.callback()
+        if inspect.isawaitable(value):
+            value = await value
+        return value
+
+    def samples(self, value) -> List[str]:
+        if isinstance(value, dict):
+            return [f'{self.name}{{{self.label}="{_escape(key)}"}} {_format_value(item)}'
+                    for key, item in sorted(value.items())]
+        return [f"{self.name} {_format_value(value)}"]
+
+class Histogram:
+    """Counts of observations per bucket, plus their sum"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def state(self) -> Tuple[List[int], float]:
+        return list(self.counts), self.sum
+
+    def samples(self, extra=None) -> List[str]:
+        counts, total = self.counts, self.sum
+        if extra is not None:
+            counts = [count + other for count, other in zip(counts, extra[0])]
+            total += extra[1]
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{_format_value(float(bound))}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {_format_value(total)}")
+        lines.append(f"{self.name}_count {cumulative}")
+        return lines
+
+class Registry:
+    """Named metrics of one process
+
+    Registering an existing name returns the metric already registered, so
+    modules shared by several services can declare the metrics they update.
+    """
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+
+    def _register(self, cls, name: str, *args, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, *args, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+        return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._register(Counter, name, help_text)
+
+    def gauge(self, name: str, help_text: str, callback: Optional[Callable] = None,
+              label: Optional[str] = None) -> Gauge:
+        gauge = self._register(Gauge, name, help_text)
+        if callback is not None:
+            gauge.callback, gauge.label = callback, label
+        return gauge
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, help_text, buckets)
+
+    def states(self) -> Dict[str, object]:
+        """Counter and histogram values, for merging into another process's output"""
+        return {name: metric.state() for name, metric in self.metrics.items()
+                if not isinstance(metric, Gauge)}
+
+    async def render(self, extra_states: Optional[Dict[str, object]] = None) -> str:
+        """Exposition text, adding ``extra_states`` (e.g. from worker processes) to local values"""
+        extra_states = extra_states or {}
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            if isinstance(metric, Gauge):
+                lines.extend(metric.samples(await metric.collect()))
+            else:
+                lines.extend(metric.samples(extra_states.get(name)))
+        return "\n".join(lines) + "\n"
+
+# Default registry of this process
+REGISTRY = Registry()
+
+def merge_states(states: List[Dict[str, object]]) -> Dict[str, object]:
+    """Sum ``Registry.states()`` results from several processes"""
+    merged: Dict[str, object] = {}
+    for process_states in states:
+        for name, state in process_states.items():
+            if name not in merged:
+                merged[name] = state
+            elif isinstance(state, tuple):
+                counts, total = merged[name]
+                merged[name] = ([a + b for a, b in zip(counts, state[0])], total + state[1])
+            else:
+                merged[name] += state
+    return merged
+
+async def monitor_event_loop(registry: Registry = REGISTRY, interval: float = 0.5):
+    """Sample how late the event loop wakes up from a sleep, forever"""
+    lag_seconds = registry.histogram("event_loop_lag_seconds", "Lateness of event loop wake-ups")
+    last_lag = registry.gauge("event_loop_lag_last_seconds", "Lateness of the latest event loop wake-up")
+    while True:
+        started = time.monotonic()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.monotonic() - started - interval)
+        lag_seconds.observe(lag)
+        last_lag.set(lag)
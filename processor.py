@@ -0,0 +1,811 @@
+# processor.py
+# Incremental trade aggregation and indicators, one TradeProcessor per symbol.
+# Processors can be spread across worker processes by ProcessorPool.
+
+import asyncio
+import logging
+import os
+import re
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from bars import BarSet
+from downsample import shared_indices
+from indicators import IndicatorEngine
+from metrics import REGISTRY, merge_states
+from timeparse import parse_timestamp, parse_timestamps
+from trade_buffer import TradeRingBuffer
+from trade_frames import TradeColumns
+from trade_log import LogPosition, TradeLog, TradeRecord
+
+logger = logging.getLogger("server")
+
+INDICATOR_SECONDS = REGISTRY.histogram("indicator_update_seconds",
+                                       "Time to advance all indicators of a symbol after a batch")
+
+# Metrics observed inside worker shards, merged into the server's /metrics
+_SHARD_METRICS = (INDICATOR_SECONDS,)
+
+def batch_timestamps(trades_list) -> List[Optional[int]]:
+    """Epoch-ns timestamp of every trade in a batch, None where unparseable
+
+    Trades from the simulator already carry ``timestamp_ns``; anything else
+    has its datetime strings parsed as one vectorized column.
+    """
+    try:
+        return [trade['timestamp_ns'] for trade in trades_list]
+    except KeyError:
+        pass
+    values = [trade.get('timestamp_ns') or trade.get('original_datetime', trade.get('datetime'))
+              for trade in trades_list]
+    try:
+        return parse_timestamps(values).tolist()
+    except Exception:
+        timestamps = []
+        for value in values:
+            try:
+                timestamps.append(parse_timestamp(value))
+            except Exception:
+                timestamps.append(None)
+        return timestamps
+
+def trade_rows(trades_list):
+    """``(timestamp_ns, price, quantity, venue)`` of every trade in a batch
+
+    A batch is a list of trade dicts, or ``TradeColumns`` from a binary
+    frame. Missing fields come out as None.
+    """
+    if isinstance(trades_list, TradeColumns):
+        return trades_list.rows()
+    return ((timestamp, trade.get('price'), trade.get('quantity'), trade.get('venue'))
+            for trade, timestamp in zip(trades_list, batch_timestamps(trades_list)))
+
+def _legacy_points(values: List, offset: int, first: int, stop: int,
+                   points: Optional[Iterable[int]] = None) -> Dict[str, float]:
+    """Index-keyed points of a per-bar column for bars ``[first, stop)``
+
+    Point ``i`` belongs to bar ``i + offset``, matching the dropna'd index of
+    ``Series.rolling(window).mean()`` with ``offset = window - 1``. With
+    ``points`` only those point indices are included.
+    """
+    first = max(first, offset)
+    if points is None:
+        return {str(i - offset): values[i] for i in range(first, stop)}
+    return {str(point): values[point + offset] for point in points if first <= point + offset < stop}
+
+# Store and process trades
+class TradeProcessor:
+    MA_WINDOWS = [10, 20]
+    MACD_PARAMS = (12, 26, 9)
+
+    def __init__(self, max_trades: int = 1_000_000, max_trade_age_seconds: Optional[float] = None,
+                 log: Optional[TradeLog] = None):
+        self.trades = TradeRingBuffer(max_trades, max_trade_age_seconds)
+        self.log = log  # write-ahead log of ingested trades, see recover()
+        self._checkpoint_version = None
+        # Start position and first trade index of each logged record still
+        # holding retained trades; checkpoints leave those trades in the log
+        self._log_records: Deque[Tuple[LogPosition, int]] = deque()
+        self.bars = BarSet()  # OHLCV bars at every resolution in bars.RESOLUTIONS
+        self.last_price = None
+        self.opening_price = None
+        self.day_high = None
+        self.day_low = None
+        self.total_volume = 0
+        self.trade_count = 0
+        self.last_update_time = None
+        self.version = 0  # bumped on every state change, keys cached snapshots
+        
+        # Indicator state advances only over bars touched since the last update.
+        # The dashboard's moving averages and MACD are always kept; other
+        # indicators exist while browsers subscribe to them.
+        self.indicators = IndicatorEngine(self._pinned_indicators())
+        
+        # Lowest bar index changed since the last delta, None when unchanged
+        self._changed_from: Optional[int] = None
+        self._delta_bar_count = 0
+        
+    @classmethod
+    def _pinned_indicators(cls) -> List[Dict]:
+        fast, slow, signal = cls.MACD_PARAMS
+        return [{'name': 'sma', 'period': window} for window in cls.MA_WINDOWS] + \
+               [{'name': 'macd', 'fast': fast, 'slow': slow, 'signal': signal}]
+    
+    @property
+    def minute_aggregates(self):
+        """Minute bars keyed by minute start (epoch ns)"""
+        return self.bars['1m'].bars
+    
+    @property
+    def minute_keys(self) -> List[int]:
+        """Start of every minute bar, ascending"""
+        return self.bars['1m'].keys
+        
+    async def add_trades(self, trades_list):
+        """Process incoming trades and update aggregations"""
+        return self.ingest(trades_list)
+        
+    def ingest(self, trades_list) -> bool:
+        """Synchronous body of add_trades, usable inside worker processes"""
+        if not trades_list:
+            return False
+            
+        # Columns for the retained-trade buffer
+        timestamps, prices, quantities, venues = [], [], [], []
+        venue_code = self.trades.venue_code
+        bar_lookups = self.bars.fed_lookups()
+        
+        for timestamp, price, quantity, venue in trade_rows(trades_list):
+            try:
+                price = float(price)
+                quantity = int(quantity)
+                for bar_for in bar_lookups:
+                    bar_for(timestamp, price).add(price, quantity)
+            except Exception as e:
+                logger.error(f"Skipping malformed trade at {timestamp} ({price} x {quantity}): {e}")
+                continue
+            
+            timestamps.append(timestamp)
+            prices.append(price)
+            quantities.append(quantity)
+            venues.append(venue_code(venue))
+            
+            # Update running day statistics
+            self.last_price = price
+            if self.opening_price is None:
+                self.opening_price = price
+            if self.day_high is None or price > self.day_high:
+                self.day_high = price
+            if self.day_low is None or price < self.day_low:
+                self.day_low = price
+            self.total_volume += quantity
+        
+        self.trade_count += len(timestamps)  # malformed trades were skipped
+        first = self.trades.appended
+        self.trades.extend(timestamps, prices, quantities, venues)
+        if self.log is not None and timestamps:
+            self._log_records.append((self.log.position, first))
+            self.log.append(timestamps, prices, quantities, venues, self.trades.venues)
+            self._drop_unretained_records()
+        dirty_from = self.bars.finish_batch()['1m']
+        if dirty_from is not None:
+            started = time.perf_counter()
+            self._update_indicators(dirty_from)
+            INDICATOR_SECONDS.observe(time.perf_counter() - started)
+            if self._changed_from is None or dirty_from < self._changed_from:
+                self._changed_from = dirty_from
+        self.last_update_time = datetime.now()
+        self.version += 1
+        return True
+        
+    def _update_indicators(self, start: int):
+        """Advance the indicator recursions over bars ``start`` onwards
+
+        In steady state only the last bar changes, so this is constant time
+        per batch instead of a recomputation over the whole session.
+        """
+        self.indicators.update(self.bars['1m'], start)
+    
+    def set_indicators(self, specs: List[Dict]) -> List[str]:
+        """Keep the indicators for ``specs`` (plus the dashboard's), returning their keys"""
+        return self.indicators.set_active(specs)
+    
+    def get_indicator(self, key: str, limit: Optional[int] = None) -> Optional[Dict]:
+        """Values of an active indicator for the newest ``limit`` bars, None if inactive"""
+        if key not in self.indicators:
+            return None
+        count = len(self.minute_keys)
+        return self.indicators[key].points(max(0, count - limit) if limit else 0)
+    
+    def get_minute_aggregates(self, lo: int = 0, hi: Optional[int] = None):
+        """Minute aggregates ``lo:hi`` (all by default) as a list sorted by time"""
+        bars = self.minute_aggregates
+        return [bars[key].to_dict() for key in self.minute_keys[lo:hi]]
+    
+    def minute_range(self, start_ns: Optional[int] = None, end_ns: Optional[int] = None,
+                     since: Optional[int] = None, limit: Optional[int] = None) -> Tuple[int, int]:
+        """Index range of the minute bars selected by a query, found by binary search
+
+        ``start_ns``/``end_ns`` bound the bar start times (inclusive/exclusive),
+        ``since`` is the first bar index wanted, and ``limit`` keeps only the
+        newest bars of what remains.
+        """
+        lo, hi = self.bars['1m'].span(start_ns, end_ns)
+        if since is not None:
+            lo = max(lo, since)
+        if limit is not None:
+            lo = max(lo, hi - limit)
+        return lo, max(lo, hi)
+    
+    def get_summary(self):
+        """Get trading summary statistics"""
+        return {
+            'last_price': float(self.last_price) if self.last_price is not None else None,
+            'opening_price': float(self.opening_price) if self.opening_price is not None else None,
+            'day_high': float(self.day_high) if self.day_high is not None else None,
+            'day_low': float(self.day_low) if self.day_low is not None else None,
+            'total_volume': int(self.total_volume) if self.total_volume is not None else 0,
+            'trade_count': int(self.trade_count) if self.trade_count is not None else 0,
+            'last_update': self.last_update_time.isoformat() if self.last_update_time else None
+        }
+    
+    def calculate_moving_averages(self, window_sizes=None, first: int = 0, stop: Optional[int] = None,
+                                  points: Optional[List[int]] = None):
+        """Moving averages of closes for bars ``[first, stop)``, keyed by point index
+
+        ``points`` restricts them to those point indices, e.g. a downsample's.
+        """
+        count = len(self.minute_keys)
+        if count < 2:
+            return {}
+            
+        stop = count if stop is None else stop
+        result = {}
+        for window in window_sizes or self.MA_WINDOWS:
+            if count >= window:
+                values = self.indicators[self.indicators.add({'name': 'sma', 'period': window})].columns['value']
+                result[f'MA{window}'] = _legacy_points(values, window - 1, first, stop, points)
+                
+        return result
+    
+    def calculate_macd(self, fast_period=MACD_PARAMS[0], slow_period=MACD_PARAMS[1],
+                       signal_period=MACD_PARAMS[2], first: int = 0, stop: Optional[int] = None,
+                       points: Optional[List[int]] = None):
+        """MACD line, signal line and histogram for bars ``[first, stop)``, keyed by bar index"""
+        count = len(self.minute_keys)
+        if count < max(fast_period, slow_period, signal_period):
+            return {}
+            
+        key = self.indicators.add({'name': 'macd', 'fast': fast_period, 'slow': slow_period,
+                                   'signal': signal_period})
+        columns = self.indicators[key].columns
+        stop = count if stop is None else stop
+        return {
+            'macd_line': _legacy_points(columns['macd'], 0, first, stop, points),
+            'signal_line': _legacy_points(columns['signal'], 0, first, stop, points),
+            'histogram': _legacy_points(columns['histogram'], 0, first, stop, points)
+        }
+    
+    def get_bars(self, resolution: str, start_ns: Optional[int] = None, end_ns: Optional[int] = None,
+                 limit: Optional[int] = None, max_points: Optional[int] = None) -> Dict:
+        """Bars of one resolution starting in ``[start_ns, end_ns)``, newest ``limit`` of them
+
+        ``start`` is the index of the first returned bar within the series,
+        the position later bar updates refer to. More than ``max_points``
+        bars are downsampled by the min/max per bucket of their closes and
+        volumes; ``index`` then lists the series index of each bar.
+        """
+        series = self.bars[resolution]
+        lo, hi = series.span(start_ns, end_ns, limit)
+        if max_points is None or hi - lo <= max_points:
+            return {'resolution': resolution, 'start': lo, 'bars': series.records(lo, hi)}
+        bars = [series.bars[key] for key in series.keys[lo:hi]]
+        points = shared_indices([np.array([bar.close_price for bar in bars], dtype=np.float64),
+                                 np.array([bar.volume for bar in bars], dtype=np.float64)], max_points)
+        return {'resolution': resolution, 'start': lo, 'bars': [bars[i].to_record() for i in points.tolist()],
+                'index': (points + lo).tolist(), 'downsampled_from': hi - lo}
+    
+    def get_trades(self, start_ns: Optional[int] = None, end_ns: Optional[int] = None,
+                   limit: Optional[int] = None) -> List[Dict]:
+        """Retained raw trades in ``[start_ns, end_ns)``, newest ``limit`` of them"""
+        return self.trades.slice(start_ns, end_ns, limit).to_records()
+    
+    def resume_point(self) -> Optional[Tuple[int, int]]:
+        """Newest trade timestamp and how many retained trades share it, None if empty"""
+        if not len(self.trades):
+            return None
+        last = int(self.trades.slice(limit=1).timestamp[0])
+        return last, len(self.trades.slice(last, last + 1))
+    
+    def _drop_unretained_records(self):
+        """Forget logged records whose trades have all left the ring"""
+        oldest = self.trades.appended - len(self.trades)
+        records = self._log_records
+        while len(records) > 1 and records[1][1] <= oldest:
+            records.popleft()
+
+    def checkpoint_state(self) -> Optional[Tuple[Dict[str, np.ndarray], Dict]]:
+        """Arrays and meta of a checkpoint, None if nothing changed since the last one
+
+        Bars of every resolution and day statistics are stored. Retained
+        trades are not: the log keeps their records from ``trades_from`` on
+        (skipping the first ``trades_skip`` trades). Indicators are rebuilt
+        from the minute closes on recovery.
+        """
+        if self.log is None or self.version == self._checkpoint_version:
+            return None
+        position = self.log.position
+        self._drop_unretained_records()
+        if self._log_records:
+            trades_from, first = self._log_records[0]
+            skip = self.trades.appended - len(self.trades) - first
+        else:
+            trades_from, skip = position, 0
+        arrays = {f"bars/{name}": values for name, values in self.bars.to_columns().items()}
+        meta = {
+            'position': position,
+            'trades_from': trades_from,
+            'trades_skip': skip,
+            'version': self.version,
+            'stats': {
+                'last_price': self.last_price,
+                'opening_price': self.opening_price,
+                'day_high': self.day_high,
+                'day_low': self.day_low,
+                'total_volume': self.total_volume,
+                'trade_count': self.trade_count,
+                'last_update': self.last_update_time.isoformat() if self.last_update_time else None
+            }
+        }
+        return arrays, meta
+
+    def write_checkpoint(self, arrays: Dict[str, np.ndarray], meta: Dict):
+        """Write a state from ``checkpoint_state``; safe to run in another thread"""
+        self.log.write_checkpoint(arrays, meta)
+        self._checkpoint_version = meta['version']
+
+    def checkpoint(self) -> bool:
+        """Write a checkpoint to the log if anything changed since the last one"""
+        state = self.checkpoint_state()
+        if state is None:
+            return False
+        self.write_checkpoint(*state)
+        return True
+    
+    def recover(self) -> int:
+        """Rebuild state from the log's checkpoint plus the records after it
+
+        Records before the checkpoint position only refill the retained-trade
+        buffer; their trades are already in the checkpointed bars. Returns the
+        number of trades replayed from the log tail.
+        """
+        log = self.log
+        if log is None:
+            return 0
+        position = trades_from = (0, 0)
+        skip = 0
+        checkpoint = log.load_checkpoint()
+        if checkpoint is not None:
+            arrays, meta = checkpoint
+            self.bars.load_columns({name[5:]: values for name, values in arrays.items() if name.startswith("bars/")})
+            stats = meta['stats']
+            self.last_price = stats['last_price']
+            self.opening_price = stats['opening_price']
+            self.day_high = stats['day_high']
+            self.day_low = stats['day_low']
+            self.total_volume = stats['total_volume']
+            self.trade_count = stats['trade_count']
+            self.last_update_time = datetime.fromisoformat(stats['last_update']) if stats['last_update'] else None
+            self.version = meta['version']
+            self._checkpoint_version = self.version
+            position = meta['position']
+            trades_from, skip = tuple(meta['trades_from']), meta['trades_skip']
+            self._update_indicators(0)
+        
+        # Replayed trades are already in the log
+        replayed = 0
+        self.log = None
+        try:
+            start = trades_from
+            for end, record in log.replay(trades_from):
+                first = self.trades.appended
+                if start < position:
+                    self._restore_trades(record, skip)
+                    skip = 0
+                else:
+                    self.ingest(record.to_trades())
+                    replayed += len(record.timestamps)
+                self._log_records.append((start, first))
+                start = end
+        finally:
+            self.log = log
+        self._drop_unretained_records()
+        
+        # Clients start from snapshots, so nothing is pending as a delta
+        self._changed_from = None
+        self._delta_bar_count = len(self.minute_keys)
+        self.bars.collect_changes()
+        self.indicators.collect_changes()
+        return replayed
+
+    def _restore_trades(self, record: TradeRecord, skip: int):
+        """Put a logged record's trades, after the first ``skip``, back in the retained-trade buffer"""
+        codes = np.array([self.trades.venue_code(venue) for venue in record.venues], dtype=np.int16)
+        self.trades.extend(record.timestamps[skip:], record.prices[skip:], record.quantities[skip:],
+                           codes[record.venue_codes[skip:]])
+    
+    def get_snapshot(self, start_ns: Optional[int] = None, end_ns: Optional[int] = None,
+                     since: Optional[int] = None, limit: Optional[int] = None,
+                     max_points: Optional[int] = None) -> Dict:
+        """State as sent to a browser on connect or resync
+
+        Without arguments this is the full state. Otherwise only the minute bars
+        selected as in ``minute_range`` are included, starting at bar index
+        ``start``, with the indicator points that belong to those bars.
+
+        When more than ``max_points`` bars are selected they are downsampled:
+        ``index`` lists the bar index of each bar sent, and the indicator
+        points are those of the same indices.
+        """
+        if start_ns is None and end_ns is None and since is None and limit is None:
+            lo, hi = 0, len(self.minute_keys)
+        else:
+            lo, hi = self.minute_range(start_ns, end_ns, since, limit)
+        if max_points is not None and hi - lo > max_points:
+            return self._downsampled_snapshot(lo, hi, max_points)
+        return {
+            'start': lo,
+            'minute_aggregates': self.get_minute_aggregates(lo, hi),
+            'summary': self.get_summary(),
+            'moving_averages': self.calculate_moving_averages(first=lo, stop=hi),
+            'macd': self.calculate_macd(first=lo, stop=hi)
+        }
+    
+    def _downsampled_snapshot(self, lo: int, hi: int, max_points: int) -> Dict:
+        """Snapshot of bars ``[lo, hi)`` reduced to at most ``max_points``
+
+        The bars kept are the min/max per bucket of the closes, volumes and
+        MACD histogram, so price and volume spikes and MACD crossings survive.
+        """
+        inputs = self.indicators.inputs
+        fast, slow, signal = self.MACD_PARAMS
+        histogram = self.indicators[self.indicators.add({'name': 'macd', 'fast': fast, 'slow': slow,
+                                                          'signal': signal})].columns['histogram']
+        series = [np.array(inputs.close[lo:hi], dtype=np.float64),
+                  np.array(inputs.volume[lo:hi], dtype=np.float64),
+                  np.array(histogram[lo:hi], dtype=np.float64)]
+        points = (shared_indices(series, max_points) + lo).tolist()
+        bars, keys = self.minute_aggregates, self.minute_keys
+        return {
+            'start': lo,
+            'minute_aggregates': [bars[keys[i]].to_dict() for i in points],
+            'index': points,
+            'downsampled_from': hi - lo,
+            'summary': self.get_summary(),
+            'moving_averages': self.calculate_moving_averages(first=lo, stop=hi, points=points),
+            'macd': self.calculate_macd(first=lo, stop=hi, points=points)
+        }
+    
+    def collect_delta(self) -> Optional[Dict]:
+        """Bars and indicator points changed since the previous call
+
+        Bars from index ``start`` onwards replace what the client holds. Each
+        indicator series carries its own ``from`` index; an indicator that was
+        not yet available at the previous delta is sent in full.
+        """
+        start = self._changed_from
+        if start is None:
+            return None
+        previous_count = self._delta_bar_count
+        self._changed_from = None
+        self._delta_bar_count = len(self.minute_keys)
+        
+        moving_averages = {}
+        for window in self.MA_WINDOWS:
+            first = max(0, start - window + 1) if previous_count >= window else 0
+            values = self.calculate_moving_averages([window], first + window - 1).get(f'MA{window}')
+            if values is not None:
+                moving_averages[f'MA{window}'] = {'from': first, 'values': values}
+            
+        first = start if previous_count >= max(self.MACD_PARAMS) else 0
+        macd = self.calculate_macd(first=first)
+        if macd:
+            macd = {'from': first, **macd}
+            
+        return {
+            'start': start,
+            'minute_aggregates': [self.minute_aggregates[key].to_dict() for key in self.minute_keys[start:]],
+            'summary': self.get_summary(),
+            'moving_averages': moving_averages,
+            'macd': macd,
+            'bars': self.bars.collect_changes(),
+            'indicators': self.indicators.collect_changes()
+        }
+    
+    def clear_data(self):
+        """Clear all stored data"""
+        self.trades.clear()
+        self.bars.clear()
+        if self.log is not None:
+            self.log.reset()
+        self._checkpoint_version = None
+        self._log_records.clear()
+        self.last_price = None
+        self.opening_price = None
+        self.day_high = None
+        self.day_low = None
+        self.total_volume = 0
+        self.trade_count = 0
+        self.last_update_time = None
+        self.indicators.clear()
+        self._changed_from = None
+        self._delta_bar_count = 0
+        self.version += 1
+
+# Symbols usable as log directory names
+_LOGGABLE_SYMBOL = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]*")
+
+class ProcessorShard:
+    """Processors for the symbols owned by one shard
+
+    With ``log_config`` (``directory``, ``segment_bytes``, ``fsync``) every
+    processor keeps a trade log in ``<directory>/<symbol>`` and is recovered
+    from it when created.
+    """
+    def __init__(self, log_config: Optional[Dict] = None, **processor_kwargs):
+        self.log_config = log_config
+        self.processor_kwargs = processor_kwargs
+        self.processors: Dict[str, TradeProcessor] = {}
+        self.indicator_specs: Dict[str, List[Dict]] = {}  # subscribed per symbol, see set_indicators
+        self._empty = TradeProcessor(max_trades=1)  # answers queries for unknown symbols
+
+    def _open_log(self, symbol: str) -> Optional[TradeLog]:
+        if not self.log_config:
+            return None
+        if not _LOGGABLE_SYMBOL.fullmatch(symbol):
+            logger.warning(f"Not logging trades for symbol {symbol!r}: unsafe as a directory name")
+            return None
+        return TradeLog(os.path.join(self.log_config["directory"], symbol),
+                        segment_bytes=self.log_config.get("segment_bytes", 64 * 1024 * 1024),
+                        fsync=self.log_config.get("fsync", False))
+
+    def processor(self, symbol: str, create: bool = True) -> TradeProcessor:
+        processor = self.processors.get(symbol)
+        if processor is None:
+            if not create:
+                return self._empty
+            processor = self.processors[symbol] = TradeProcessor(**self.processor_kwargs,
+                                                                 log=self._open_log(symbol))
+            if processor.log is not None:
+                replayed = processor.recover()
+                if processor.trade_count:
+                    logger.info(f"Recovered {symbol}: {processor.trade_count} trades, "
+                                f"{replayed} replayed from the log tail")
+            if symbol in self.indicator_specs:
+                processor.set_indicators(self.indicator_specs[symbol])
+        return processor
+
+    def set_indicators(self, symbol: str, specs: List[Dict]):
+        """Keep the indicators for ``specs`` on a symbol's processor
+
+        A symbol without trades yet gets them when its processor is created,
+        never on the shared empty processor.
+        """
+        if specs:
+            self.indicator_specs[symbol] = specs
+        else:
+            self.indicator_specs.pop(symbol, None)
+        processor = self.processors.get(symbol)
+        if processor is not None:
+            processor.set_indicators(specs)
+
+    def recover(self, symbols: List[str]) -> Dict[str, int]:
+        """Create (and so recover) the processors of logged symbols"""
+        return {symbol: self.processor(symbol).version for symbol in symbols}
+
+    def checkpoint_states(self) -> List[Tuple[TradeProcessor, Dict[str, np.ndarray], Dict]]:
+        """States of the changed processors, for ``write_checkpoints``"""
+        states = []
+        for processor in self.processors.values():
+            state = processor.checkpoint_state()
+            if state is not None:
+                states.append((processor, *state))
+        return states
+
+    @staticmethod
+    def write_checkpoints(states: List[Tuple[TradeProcessor, Dict[str, np.ndarray], Dict]]) -> int:
+        for processor, arrays, meta in states:
+            processor.write_checkpoint(arrays, meta)
+        return len(states)
+
+    def checkpoint(self) -> int:
+        return self.write_checkpoints(self.checkpoint_states())
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Sizes of each processor's state, for metrics"""
+        return {symbol: {'minute_bars': len(processor.minute_keys),
+                         'retained_trades': len(processor.trades),
+                         'retained_trade_bytes': processor.trades.nbytes,
+                         'trade_buffer_bytes': processor.trades.capacity_bytes}
+                for symbol, processor in self.processors.items()}
+
+    def metric_states(self) -> Dict[str, object]:
+        return {metric.name: metric.state() for metric in _SHARD_METRICS}
+
+    def close(self):
+        for processor in self.processors.values():
+            if processor.log is not None:
+                processor.log.close()
+
+    def ingest(self, batches: Dict[str, list]) -> Dict[str, int]:
+        """Apply per-symbol trade batches, returning the new processor versions"""
+        versions = {}
+        for symbol, trades in batches.items():
+            processor = self.processor(symbol)
+            processor.ingest(trades)
+            versions[symbol] = processor.version
+        return versions
+
+    def collect_deltas(self, symbols: Optional[Iterable[str]] = None) -> Dict[str, Dict]:
+        """Pending deltas of all processors, or only of ``symbols``"""
+        deltas = {}
+        if symbols is None:
+            symbols = list(self.processors)
+        for symbol in symbols:
+            processor = self.processors.get(symbol)
+            if processor is None:
+                continue
+            delta = processor.collect_delta()
+            if delta is not None:
+                deltas[symbol] = delta
+        return deltas
+
+    def call(self, symbol: str, method: str, args: tuple):
+        """Run a read-only TradeProcessor method for one symbol"""
+        return getattr(self.processor(symbol, create=False), method)(*args)
+
+    def clear(self) -> Dict[str, int]:
+        for processor in self.processors.values():
+            processor.clear_data()
+        return {symbol: processor.version for symbol, processor in self.processors.items()}
+
+# The shard owned by a worker process, created by the pool initializer
+_worker_shard: Optional[ProcessorShard] = None
+
+def _init_worker_shard(processor_kwargs: Dict):
+    global _worker_shard
+    _worker_shard = ProcessorShard(**processor_kwargs)
+
+def _run_in_worker_shard(method: str, args: tuple):
+    return getattr(_worker_shard, method)(*args)
+
+class ProcessorPool:
+    """Per-symbol TradeProcessors, optionally sharded across worker processes
+
+    With ``workers=0`` every processor lives in the calling process. Otherwise
+    each symbol is pinned by a stable hash to one single-process executor,
+    so its state always lives in the same worker and calls for different
+    symbols run in parallel.
+    """
+    def __init__(self, workers: int = 0, **processor_kwargs):
+        self.workers = workers
+        self.processor_kwargs = processor_kwargs
+        self.versions: Dict[str, int] = {}  # last known version per symbol
+        self._local = ProcessorShard(**processor_kwargs) if workers == 0 else None
+        self._executors: List[ProcessPoolExecutor] = []
+        self._checkpointing = asyncio.Lock()  # a clear waits for a checkpoint being written
+
+    @property
+    def symbols(self) -> List[str]:
+        return sorted(self.versions)
+
+    def shard_for(self, symbol: str) -> int:
+        return zlib.crc32(symbol.encode()) % self.workers
+
+    def _executor(self, shard: int) -> ProcessPoolExecutor:
+        if not self._executors:
+            self._executors = [
+                ProcessPoolExecutor(max_workers=1, initializer=_init_worker_shard,
+                                    initargs=(self.processor_kwargs,))
+                for _ in range(self.workers)
+            ]
+        return self._executors[shard]
+
+    async def _run(self, shard: int, method: str, *args):
+        if self._local is not None:
+            return getattr(self._local, method)(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor(shard), _run_in_worker_shard, method, args)
+
+    async def _run_all(self, method: str, *args) -> List:
+        if self._local is not None:
+            return [getattr(self._local, method)(*args)]
+        return await asyncio.gather(*(self._run(shard, method, *args) for shard in range(self.workers)))
+
+    async def ingest(self, batches: Dict[str, list]):
+        """Apply trade batches keyed by symbol, one round trip per shard"""
+        if self._local is not None:
+            self.versions.update(self._local.ingest(batches))
+            return
+        by_shard: Dict[int, Dict[str, list]] = {}
+        for symbol, trades in batches.items():
+            by_shard.setdefault(self.shard_for(symbol), {})[symbol] = trades
+        results = await asyncio.gather(*(self._run(shard, 'ingest', shard_batches)
+                                         for shard, shard_batches in by_shard.items()))
+        for versions in results:
+            self.versions.update(versions)
+
+    async def collect_deltas(self, symbols: Optional[Iterable[str]] = None) -> Dict[str, Dict]:
+        """Pending deltas of every symbol, or only of ``symbols`` (asking only their shards)"""
+        if symbols is None:
+            results = await self._run_all('collect_deltas')
+        elif self._local is not None:
+            results = [self._local.collect_deltas(symbols)]
+        else:
+            by_shard: Dict[int, List[str]] = {}
+            for symbol in symbols:
+                by_shard.setdefault(self.shard_for(symbol), []).append(symbol)
+            results = await asyncio.gather(*(self._run(shard, 'collect_deltas', shard_symbols)
+                                             for shard, shard_symbols in by_shard.items()))
+        deltas = {}
+        for shard_deltas in results:
+            deltas.update(shard_deltas)
+        return deltas
+
+    async def set_indicators(self, symbol: str, specs: List[Dict]):
+        """Keep the indicators for ``specs`` on ``symbol``'s processor, now or once it exists"""
+        await self._run(self.shard_for(symbol) if self.workers else 0, 'set_indicators', symbol, specs)
+
+    async def call(self, symbol: str, method: str, *args):
+        """Run a read-only TradeProcessor method on the shard owning ``symbol``"""
+        shard = self.shard_for(symbol) if self.workers else 0
+        return await self._run(shard, 'call', symbol, method, args)
+
+    async def clear(self):
+        async with self._checkpointing:
+            for versions in await self._run_all('clear'):
+                self.versions.update(versions)
+
+    async def recover(self) -> List[str]:
+        """Recover every symbol that has a trade log, returning the symbols"""
+        log_config = self.processor_kwargs.get("log_config")
+        if not log_config or not os.path.isdir(log_config["directory"]):
+            return []
+        symbols = sorted(name for name in os.listdir(log_config["directory"])
+                         if _LOGGABLE_SYMBOL.fullmatch(name)
+                         and os.path.isdir(os.path.join(log_config["directory"], name)))
+        if self._local is not None:
+            self.versions.update(self._local.recover(symbols))
+            return symbols
+        by_shard: Dict[int, List[str]] = {}
+        for symbol in symbols:
+            by_shard.setdefault(self.shard_for(symbol), []).append(symbol)
+        for versions in await asyncio.gather(*(self._run(shard, 'recover', shard_symbols)
+                                               for shard, shard_symbols in by_shard.items())):
+            self.versions.update(versions)
+        return symbols
+
+    async def checkpoint(self) -> int:
+        """Checkpoint every changed processor, returning how many were written
+
+        In-process, the state is captured on the event loop and written to
+        disk from a thread, so ingestion carries on meanwhile.
+        """
+        async with self._checkpointing:
+            if self._local is not None:
+                return await asyncio.to_thread(ProcessorShard.write_checkpoints, self._local.checkpoint_states())
+            return sum(await self._run_all('checkpoint'))
+
+    async def stats(self) -> Dict[str, Dict[str, int]]:
+        stats = {}
+        for shard_stats in await self._run_all('stats'):
+            stats.update(shard_stats)
+        return stats
+
+    async def metric_states(self) -> Dict[str, object]:
+        """Worker-side metric values to add to this process's, empty when in-process"""
+        if self._local is not None:
+            return {}
+        return merge_states(await self._run_all('metric_states'))
+
+    def shutdown(self):
+        if self._local is not None:
+            self._local.close()
+        for executor in self._executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._executors = []
+
+def group_by_symbol(trades_list, default_symbol: str) -> Dict[str, list]:
+    """Split a mixed batch of trades into per-symbol batches, keeping order"""
+    if isinstance(trades_list, TradeColumns):
+        return trades_list.by_symbol()
+    batches: Dict[str, list] = {}
+    for trade in trades_list:
+        batches.setdefault(trade.get('symbol') or default_symbol, []).append(trade)
+    return batches
@@ -0,0 +1,508 @@
+# replay_cache.py
+# Precompiled, memory-mapped replay data for the simulator.
+# A tick CSV is parsed once, in chunks, into a directory of .npy columns
+# stored next to it (AAPL.csv -> AAPL.csv.replay/), sorted by time and
+# indexed by second. Later starts map those files instead of re-reading the
+# CSV. Several files form a ReplayTimeline: files covering the same period
+# are merged, consecutive periods (e.g. daily files) are played back to back.
+#
+# Usage: python replay_cache.py AAPL.csv [MSFT.csv ...]
+
+import bisect
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from timeparse import NS_PER_SECOND, parse_timestamps
+from trade_frames import TradeColumns
+
+logger = logging.getLogger("simulator")
+
+CACHE_VERSION = 2
+CACHE_SUFFIX = ".replay"
+
+# CSV rows parsed at a time while compiling, and about half the rows merged
+# at a time when sorting; both bound the memory used, whatever the file size
+CHUNK_ROWS = 250_000
+
+# Trade columns, one .npy file each
+COLUMNS = (
+    "timestamp_ns",  # int64 epoch nanoseconds
+    "price",         # float64
+    "quantity",      # int32
+    "venue",         # int16 codes into the venue dictionary
+    "symbol",        # int16 codes into the symbol dictionary
+    "datetime",      # original datetime strings, fixed-width bytes
+)
+
+class ReplayData:
+    """Time-sorted trade columns plus a per-second offset index
+
+    Trades of second ``i`` are rows ``second_offsets[i]:second_offsets[i + 1]``
+    and start at ``second_starts[i]`` (epoch ns). Columns may be memory-mapped,
+    so messages are built from array slices on demand.
+    """
+    def __init__(self, columns: Dict[str, np.ndarray], venues: List[str], symbols: List[str],
+                 second_starts: np.ndarray, second_offsets: np.ndarray):
+        self.columns = columns
+        self.venues = venues
+        self.symbols = symbols
+        self.second_starts = second_starts
+        self.second_offsets = second_offsets
+
+    def __len__(self):
+        return len(self.columns["timestamp_ns"])
+
+    @property
+    def num_seconds(self) -> int:
+        return len(self.second_starts)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self.columns.values())
+
+    def records(self, start: int, stop: int, first_seq: Optional[int] = None) -> List[Dict]:
+        """Trade dicts for rows ``start:stop``, in the simulator's message format
+
+        With ``first_seq``, trades are numbered consecutively from it.
+        """
+        columns = self.columns
+        venues, symbols = self.venues, self.symbols
+        if first_seq is not None:
+            records = self.records(start, stop)
+            for seq, record in enumerate(records, first_seq):
+                record['seq'] = seq
+            return records
+        return [
+            {
+                'symbol': symbols[symbol],
+                'original_datetime': dt.decode(),
+                'timestamp_ns': ts,
+                'price': price,
+                'quantity': quantity,
+                'venue': venues[venue],
+            }
+            for symbol, dt, ts, price, quantity, venue in zip(
+                columns["symbol"][start:stop].tolist(),
+                columns["datetime"][start:stop].tolist(),
+                columns["timestamp_ns"][start:stop].tolist(),
+                columns["price"][start:stop].tolist(),
+                columns["quantity"][start:stop].tolist(),
+                columns["venue"][start:stop].tolist(),
+            )
+        ]
+
+    def trade_columns(self, start: int, stop: int, first_seq: Optional[int] = None) -> TradeColumns:
+        """Rows ``start:stop`` as columns, for binary trade frames"""
+        columns = self.columns
+        return TradeColumns(columns["timestamp_ns"][start:stop], columns["price"][start:stop],
+                            columns["quantity"][start:stop], columns["symbol"][start:stop],
+                            columns["venue"][start:stop], self.symbols, self.venues, first_seq)
+
+    def second_records(self, index: int) -> List[Dict]:
+        return self.records(int(self.second_offsets[index]), int(self.second_offsets[index + 1]))
+
+def build_second_index(timestamps: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Start time and first row of every second present in sorted timestamps
+
+    Returns ``(second_starts, second_offsets)``; ``second_offsets`` has one
+    extra trailing entry equal to the number of rows. Works through
+    ``CHUNK_ROWS`` rows at a time, so memory-mapped columns stay on disk.
+    """
+    starts, first_rows = [], []
+    previous = None
+    for lo in range(0, len(timestamps), CHUNK_ROWS):
+        chunk = np.asarray(timestamps[lo:lo + CHUNK_ROWS])
+        seconds = chunk - chunk % NS_PER_SECOND
+        rows = np.flatnonzero(np.diff(seconds)) + 1
+        if seconds[0] != previous:
+            rows = np.concatenate(([0], rows))
+        starts.append(seconds[rows])
+        first_rows.append(rows + lo)
+        previous = seconds[-1]
+    second_starts = np.concatenate(starts) if starts else np.empty(0, dtype=np.int64)
+    first_rows = np.concatenate(first_rows) if first_rows else np.empty(0, dtype=np.int64)
+    return second_starts, np.append(first_rows, len(timestamps)).astype(np.int64)
+
+def cache_path(csv_path: str) -> str:
+    return csv_path + CACHE_SUFFIX
+
+def _categorical(values, index: Dict[str, int]) -> np.ndarray:
+    """int16 codes of ``values``, extending ``index`` with names not seen in earlier chunks"""
+    codes, categories = pd.factorize(pd.Series(values).astype(str))
+    lookup = np.array([index.setdefault(name, len(index)) for name in categories], dtype=np.int64)
+    if len(index) > np.iinfo(np.int16).max:
+        raise ValueError("Too many distinct categories for int16 codes")
+    return lookup[codes].astype(np.int16)
+
+def _source_stamp(csv_path: str) -> Dict:
+    stat = os.stat(csv_path)
+    return {"source_size": stat.st_size, "source_mtime_ns": stat.st_mtime_ns}
+
+def _join_pieces(path: str, pieces: List[Tuple[str, np.dtype, int]], dtype, total: int) -> np.ndarray:
+    """Concatenate a column's raw chunk files into the .npy file ``path``, memory-mapped"""
+    if total == 0:
+        np.save(path, np.empty(0, dtype=dtype))
+        return np.load(path)
+    target = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(total,))
+    offset = 0
+    for piece_path, piece_dtype, count in pieces:
+        target[offset:offset + count] = np.fromfile(piece_path, dtype=piece_dtype, count=count)
+        offset += count
+        os.remove(piece_path)
+    return target
+
+def _merge_sorted_runs(runs: Dict[str, List[np.ndarray]], targets: Dict[str, np.ndarray],
+                       recode: Optional[Dict[str, List[np.ndarray]]] = None):
+    """Merge runs of columns, each sorted by ``timestamp_ns``, into ``targets``
+
+    Cut points sampled from the runs split the time range into slices of at
+    most about ``2 * CHUNK_ROWS`` rows; each slice is gathered from every run
+    by binary search and sorted on its own, so only one slice is in memory.
+    Equal timestamps keep run order, then row order. ``recode`` maps a
+    column's codes per run (e.g. venue codes of separately compiled files).
+    """
+    timestamps = runs["timestamp_ns"]
+    count = len(timestamps)
+    step = max(64, CHUNK_ROWS // count)
+    samples = np.sort(np.concatenate([np.asarray(run[::step]) for run in timestamps]))
+    # Between two cut points each run has at most ``step`` rows per sample of
+    # any run there, plus ``step`` before its own first one
+    cuts = np.unique(samples[count::count]).tolist()
+    cursors = [0] * count
+    offset = 0
+    for cut in cuts + [None]:
+        stops = [len(run) if cut is None else cursor + int(np.searchsorted(run[cursor:], cut, side='left'))
+                 for run, cursor in zip(timestamps, cursors)]
+        taken = [index for index in range(count) if stops[index] > cursors[index]]
+        if not taken:
+            continue
+        order = np.argsort(np.concatenate([timestamps[index][cursors[index]:stops[index]] for index in taken]),
+                           kind='stable')
+        for name, target in targets.items():
+            pieces = []
+            for index in taken:
+                values = np.asarray(runs[name][index][cursors[index]:stops[index]])
+                if recode and name in recode:
+                    values = recode[name][index][values]
+                pieces.append(values)
+            target[offset:offset + len(order)] = np.concatenate(pieces)[order]
+        offset += len(order)
+        cursors = stops
+
+def symbol_for_file(file_path: str) -> str:
+    """Symbol of a tick file without a symbol column, named after the file"""
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    if name[:1].isdigit():
+        # A daily file such as AAPL/2020-07-01.csv is named after its directory
+        name = os.path.basename(os.path.dirname(os.path.abspath(file_path))) or name
+    return name.split('_')[0].upper()
+
+def compile_replay_cache(csv_path: str, symbol: str) -> str:
+    """Parse a tick CSV once, in chunks, and write its sorted columns next to it
+
+    Each chunk of ``CHUNK_ROWS`` rows is appended to raw column files, so
+    memory stays bounded for multi-gigabyte files. Tick files are normally
+    in time order already; in one that is not, each chunk is sorted as it is
+    read and the sorted chunks are merged at the end, a slice at a time.
+    ``symbol`` names the trades of a file without a symbol column.
+    """
+    logger.info(f"Compiling replay cache for {csv_path}")
+    target = cache_path(csv_path)
+    staging = target + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    dtypes = {"timestamp_ns": np.int64, "price": np.float64, "quantity": np.int32,
+              "venue": np.int16, "symbol": np.int16}
+    pieces: Dict[str, List[Tuple[str, np.dtype, int]]] = {name: [] for name in COLUMNS}
+    venue_index: Dict[str, int] = {}
+    symbol_index: Dict[str, int] = {}
+    total, width, in_order, last_timestamp = 0, 1, True, None
+    named_by_caller = False
+
+    for number, df in enumerate(pd.read_csv(csv_path, chunksize=CHUNK_ROWS)):
+        datetimes = df['datetime'].to_numpy(dtype=object)
+        timestamps = parse_timestamps(datetimes)
+        if len(timestamps) == 0:
+            continue
+        chunk_order = None
+        if not np.all(timestamps[1:] >= timestamps[:-1]):
+            chunk_order = np.argsort(timestamps, kind='stable')
+            timestamps = timestamps[chunk_order]
+            datetimes = datetimes[chunk_order]
+        in_order = in_order and chunk_order is None and (last_timestamp is None or timestamps[0] >= last_timestamp)
+        last_timestamp = timestamps[-1]
+        if df['quantity'].abs().max() > np.iinfo(np.int32).max:
+            raise ValueError("Quantities do not fit in int32")
+        if 'symbol' in df.columns:
+            symbol_codes = _categorical(df['symbol'].str.upper(), symbol_index)
+        else:
+            symbol_codes = np.full(len(df), symbol_index.setdefault(symbol, 0), dtype=np.int16)
+            named_by_caller = True
+        chunk_width = max(1, max(len(value) for value in datetimes))
+        width = max(width, chunk_width)
+
+        chunk = {
+            "timestamp_ns": timestamps,
+            "price": df['price'].to_numpy(dtype=np.float64),
+            "quantity": df['quantity'].to_numpy(dtype=np.int32),
+            "venue": _categorical(df['venue'], venue_index),
+            "symbol": symbol_codes,
+            "datetime": datetimes.astype(f'S{chunk_width}'),
+        }
+        if chunk_order is not None:
+            for name in ("price", "quantity", "venue", "symbol"):
+                chunk[name] = chunk[name][chunk_order]
+        for name, values in chunk.items():
+            piece_path = os.path.join(staging, f"{name}.{number}.raw")
+            values.tofile(piece_path)
+            pieces[name].append((piece_path, values.dtype, len(values)))
+        total += len(df)
+
+    # Write into a temporary directory and rename, so readers never see a partial cache
+    suffix = ".npy" if in_order else ".runs.npy"
+    columns = {name: _join_pieces(os.path.join(staging, name + suffix), pieces[name],
+                                  f'S{width}' if name == "datetime" else dtypes[name], total)
+               for name in COLUMNS}
+    if not in_order:
+        run_ends = np.cumsum([count for _, _, count in pieces["timestamp_ns"]])[:-1]
+        logger.info(f"{csv_path} is not in time order, merging {len(run_ends) + 1} sorted chunks")
+        targets = {name: np.lib.format.open_memmap(os.path.join(staging, f"{name}.npy"), mode='w+',
+                                                   dtype=column.dtype, shape=(total,))
+                   for name, column in columns.items()}
+        _merge_sorted_runs({name: np.split(column, run_ends) for name, column in columns.items()}, targets)
+        columns.clear()
+        for name in COLUMNS:
+            os.remove(os.path.join(staging, name + suffix))
+        columns = targets
+    for column in columns.values():
+        if isinstance(column, np.memmap):
+            column.flush()
+    del columns
+    timestamps = np.load(os.path.join(staging, "timestamp_ns.npy"), mmap_mode='r')
+    second_starts, second_offsets = build_second_index(timestamps)
+    del timestamps
+    np.save(os.path.join(staging, "second_starts.npy"), second_starts)
+    np.save(os.path.join(staging, "second_offsets.npy"), second_offsets)
+    meta = {"version": CACHE_VERSION, "trades": total, "venues": list(venue_index),
+            "symbols": list(symbol_index), "named_by_caller": named_by_caller, **_source_stamp(csv_path)}
+    with open(os.path.join(staging, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    shutil.rmtree(target, ignore_errors=True)
+    os.rename(staging, target)
+    return target
+
+def _read_meta(csv_path: str) -> Optional[Dict]:
+    """Metadata of an up-to-date cache for ``csv_path``, or None"""
+    try:
+        with open(os.path.join(cache_path(csv_path), "meta.json")) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != CACHE_VERSION:
+        return None
+    if any(meta.get(key) != value for key, value in _source_stamp(csv_path).items()):
+        return None
+    return meta
+
+def load_replay_data(csv_path: str, symbol: str) -> ReplayData:
+    """Memory-map the replay cache of a CSV, compiling it first if missing or stale"""
+    meta = _read_meta(csv_path)
+    if meta is None:
+        compile_replay_cache(csv_path, symbol)
+        meta = _read_meta(csv_path)
+    directory = cache_path(csv_path)
+
+    def load(name):
+        return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+
+    columns = {name: load(name) for name in COLUMNS}
+    symbols = meta["symbols"]
+    if meta["named_by_caller"] and symbols != [symbol]:
+        # The file has no symbol column: its trades are whatever the caller calls them
+        symbols = [symbol]
+    return ReplayData(columns, meta["venues"], symbols, load("second_starts"), load("second_offsets"))
+
+def merge_replay_data(parts: List[ReplayData]) -> ReplayData:
+    """Merge several files into one timeline
+
+    The merged columns are written to memory-mapped files in a temporary
+    directory, removed once the result is no longer used, so a merged
+    session does not have to fit in memory.
+    """
+    if len(parts) == 1:
+        return parts[0]
+    venues = sorted({venue for part in parts for venue in part.venues})
+    symbols = sorted({symbol for part in parts for symbol in part.symbols})
+    venue_index = {venue: code for code, venue in enumerate(venues)}
+    symbol_index = {symbol: code for code, symbol in enumerate(symbols)}
+    width = max(part.columns["datetime"].dtype.itemsize for part in parts)
+    recode = {
+        "venue": [np.array([venue_index[v] for v in part.venues], dtype=np.int16) for part in parts],
+        "symbol": [np.array([symbol_index[s] for s in part.symbols], dtype=np.int16) for part in parts],
+    }
+
+    directory = tempfile.mkdtemp(prefix="replay-merge-")
+    total = sum(len(part) for part in parts)
+    targets = {name: np.lib.format.open_memmap(
+                   os.path.join(directory, f"{name}.npy"), mode='w+', shape=(total,),
+                   dtype=f'S{width}' if name == "datetime" else parts[0].columns[name].dtype)
+               for name in COLUMNS}
+    _merge_sorted_runs({name: [part.columns[name] for part in parts] for name in COLUMNS}, targets, recode)
+    for target in targets.values():
+        target.flush()
+    del targets
+    merged = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r') for name in COLUMNS}
+    data = ReplayData(merged, venues, symbols, *_merged_second_index(parts))
+    weakref.finalize(data, shutil.rmtree, directory, True)
+    return data
+
+def _merged_second_index(parts: List[ReplayData]) -> Tuple[np.ndarray, np.ndarray]:
+    """Second index of the merge of ``parts``, from their own indexes only"""
+    starts = np.concatenate([part.second_starts for part in parts])
+    counts = np.concatenate([np.diff(part.second_offsets) for part in parts])
+    second_starts, inverse = np.unique(starts, return_inverse=True)
+    totals = np.bincount(inverse, weights=counts, minlength=len(second_starts)).astype(np.int64)
+    return second_starts, np.concatenate(([0], np.cumsum(totals))).astype(np.int64)
+
+class ReplayTimeline:
+    """Replay sessions played back to back, addressed by one global row index
+
+    A session is either one file, memory-mapped, or several files covering
+    overlapping periods (e.g. one day of several symbols), merged into
+    temporary memory-mapped files. Merged sessions are built when first
+    used, normally ahead of time by ``prefetch``, and only the
+    ``max_merged`` most recently used are kept, so a month of daily files
+    never has to be merged on disk at once.
+    """
+    def __init__(self, sessions: List[List[ReplayData]], max_merged: int = 2):
+        self.sessions = sessions
+        self.max_merged = max_merged
+        self.symbols = sorted({symbol for parts in sessions for part in parts for symbol in part.symbols})
+        indexes = [(parts[0].second_starts, parts[0].second_offsets) if len(parts) == 1
+                   else _merged_second_index(parts) for parts in sessions]
+        # First global row of every session, plus the total
+        self.session_rows = [0]
+        for _, offsets in indexes:
+            self.session_rows.append(self.session_rows[-1] + int(offsets[-1]))
+        self.second_starts = np.concatenate([starts for starts, _ in indexes])
+        self.second_offsets = np.concatenate(
+            [offsets[:-1] + first for (_, offsets), first in zip(indexes, self.session_rows)]
+            + [np.array([self.session_rows[-1]], dtype=np.int64)])
+        # First timestamp of each session, for locating a time
+        self._session_starts = [int(starts[0]) if len(starts) else 0 for starts, _ in indexes]
+        self._merged: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.session_rows[-1]
+
+    @property
+    def num_seconds(self) -> int:
+        return len(self.second_starts)
+
+    def session(self, index: int) -> ReplayData:
+        parts = self.sessions[index]
+        if len(parts) == 1:
+            return parts[0]
+        with self._lock:
+            data = self._merged.get(index)
+            if data is None:
+                logger.info(f"Merging {len(parts)} files for replay session {index + 1} of {len(self.sessions)}")
+                data = merge_replay_data(parts)
+                self._merged[index] = data
+                while len(self._merged) > self.max_merged:
+                    self._merged.popitem(last=False)
+            self._merged.move_to_end(index)
+            return data
+
+    def _locate(self, row: int) -> int:
+        """Session holding global ``row``"""
+        return max(0, bisect.bisect_right(self.session_rows, row, hi=len(self.sessions)) - 1)
+
+    def is_session_start(self, row: int) -> bool:
+        """Whether ``row`` is the first trade of a session after the first one"""
+        return row > 0 and self.session_rows[self._locate(row)] == row
+
+    def timestamp(self, row: int) -> int:
+        index = self._locate(row)
+        return int(self.session(index).columns["timestamp_ns"][row - self.session_rows[index]])
+
+    def search(self, timestamp_ns: int, side: str = 'left') -> int:
+        """Global row where ``timestamp_ns`` would be inserted, like ``np.searchsorted``"""
+        index = max(0, bisect.bisect_right(self._session_starts, timestamp_ns) - 1)
+        timestamps = self.session(index).columns["timestamp_ns"]
+        return self.session_rows[index] + int(np.searchsorted(timestamps, timestamp_ns, side=side))
+
+    def records(self, start: int, stop: int, first_seq: Optional[int] = None) -> List[Dict]:
+        """Trade dicts for global rows ``start:stop``, which may span sessions"""
+        records = []
+        while start < stop:
+            index = self._locate(start)
+            first = self.session_rows[index]
+            end = min(stop, self.session_rows[index + 1])
+            records.extend(self.session(index).records(start - first, end - first, first_seq))
+            if first_seq is not None:
+                first_seq += end - start
+            start = end
+        return records
+
+    def trade_columns(self, start: int, stop: int, first_seq: Optional[int] = None) -> TradeColumns:
+        """Global rows ``start:stop`` as columns, which may span sessions"""
+        parts = []
+        while start < stop:
+            index = self._locate(start)
+            first = self.session_rows[index]
+            end = min(stop, self.session_rows[index + 1])
+            parts.append(self.session(index).trade_columns(start - first, end - first, first_seq))
+            if first_seq is not None:
+                first_seq += end - start
+            start = end
+        return TradeColumns.concatenate(parts)
+
+    def prefetch(self, row: int, rows: int):
+        """Make rows ``row:row + rows`` ready to replay: build merged sessions and
+        page in memory-mapped columns. Meant to run in a background thread."""
+        stop = min(len(self), row + rows)
+        while row < stop:
+            index = self._locate(row)
+            first = self.session_rows[index]
+            end = min(stop, self.session_rows[index + 1])
+            data = self.session(index)
+            for column in data.columns.values():
+                if isinstance(column, np.memmap):
+                    # One element per page is enough to fault the range in
+                    step = max(1, 4096 // column.itemsize)
+                    np.array(column[row - first:end - first:step])
+            row = end
+
+def open_timeline(parts: List[ReplayData]) -> ReplayTimeline:
+    """Group files into sessions: overlapping periods merge, later ones follow"""
+    parts = sorted((part for part in parts if len(part)), key=lambda part: int(part.second_starts[0]))
+    sessions: List[List[ReplayData]] = []
+    end = None
+    for part in parts:
+        if sessions and int(part.second_starts[0]) <= end:
+            sessions[-1].append(part)
+        else:
+            sessions.append([part])
+            end = None
+        last = int(part.second_starts[-1])
+        end = last if end is None else max(end, last)
+    return ReplayTimeline(sessions)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    for path in sys.argv[1:]:
+        print(compile_replay_cache(path, symbol_for_file(path)))
@@ -4,16 +4,26 @@
 
 import asyncio
 import pandas as pd
-import numpy as np
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, Response, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 import json
 import logging
 from datetime import datetime
 import uvicorn
-from typing import List, Dict, Optional
+from typing import Iterable, List, Dict, Optional, Set, Tuple
 import aiohttp
+import os
 import time
+from collections import defaultdict, deque
+
+from bars import RESOLUTIONS
+from connections import ConnectionManager, encode_json
+from fanout import serve_relay
+from indicators import describe_indicators, normalize_spec, spec_key
+from metrics import CONTENT_TYPE, REGISTRY, monitor_event_loop
+from processor import ProcessorPool, batch_timestamps, group_by_symbol
+from tracing import LatencyTracer
+from trade_frames import TradeColumns, decode_trade_frame
 
 # Configure logging
 logging.basicConfig(
@@ -33,248 +43,110 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Configuration for browser fan-out
+browser_config = {
+    "send_queue_size": 256,  # messages buffered per browser
+    "slow_consumer_policy": "drop",  # "drop" keeps the latest updates, "disconnect" closes the socket
+    # Smallest downsampling budget (max_points) honoured; budgets are rounded
+    # down to a power of two, so each symbol caches only a few of them
+    "min_points": 64
+}
+
 # Store active browser connections
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+browser_manager = ConnectionManager(
+    logger,
+    label="browser connection",
+    queue_size=browser_config["send_queue_size"],
+    slow_consumer_policy=browser_config["slow_consumer_policy"]
+)
+browser_manager.register_metrics()
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        logger.info(f"New browser connection established. Total connections: {len(self.active_connections)}")
+# Fan-out workers (fanout.py) relay browsers through this Unix socket;
+# set by `python fanout.py`, None serves browsers only on /ws directly
+fanout_config = {
+    "socket": None
+}
 
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-            logger.info(f"Browser connection closed. Remaining connections: {len(self.active_connections)}")
+# Browser updates are coalesced: at most this many deltas per symbol per second
+broadcast_config = {
+    "max_rate_hz": 10.0
+}
 
-    async def broadcast(self, message: Dict):
-        if not self.active_connections:
-            return
-            
-        try:
-            # Convert message to JSON
-            message_json = json.dumps(message)
-            
-            disconnect_list = []
-            
-            for connection in self.active_connections:
-                try:
-                    await connection.send_text(message_json)
-                except Exception as e:
-                    logger.error(f"Error sending message to browser: {e}")
-                    disconnect_list.append(connection)
-                    
-            # Clean up disconnected clients
-            for connection in disconnect_list:
-                if connection in self.active_connections:
-                    self.active_connections.remove(connection)
-        except Exception as e:
-            logger.error(f"Error broadcasting message: {e}")
+# Latency tracing of simulator batches, served on /latency
+tracing_config = {
+    "sample_every": 10,  # keep stage timings of every Nth batch
+    "max_samples": 1000  # per stage
+}
+tracer = LatencyTracer(tracing_config["sample_every"], tracing_config["max_samples"])
 
-browser_manager = ConnectionManager()
+# Retention of raw trades in each processor's ring buffer
+retention_config = {
+    "max_trades": 1_000_000,  # per symbol
+    "max_age_seconds": None  # e.g. 3600 to keep only the last hour
+}
 
-# Store and process trades
-class TradeProcessor:
-    def __init__(self):
-        self.all_trades = []
-        self.minute_aggregates = {}
-        self.last_price = None
-        self.opening_price = None
-        self.day_high = None
-        self.day_low = None
-        self.total_volume = 0
-        self.trade_count = 0
-        self.last_update_time = None
-        
-    async def add_trades(self, trades_list):
-        """Process incoming trades and update aggregations"""
-        if not trades_list:
-            return False
-            
-        # Add trades to master list
-        self.all_trades.extend(trades_list)
-        self.trade_count += len(trades_list)
-        
-        # Create DataFrame for easier processing
-        df = pd.DataFrame(trades_list)
-        
-        # Convert datetime strings to datetime objects
-        try:
-            # Custom datetime parsing for the specific format in AAPL.csv
-            def parse_datetime(dt_str):
-                if not isinstance(dt_str, str):
-                    return dt_str
-                    
-                parts = dt_str.split(':')
-                if len(parts) == 4:  # If it has the form HH:MM:SS:mmm
-                    date_part = parts[0]  # Contains date and hour
-                    minute = parts[1]
-                    second = parts[2]
-                    ms = parts[3]
-                    # Reconstruct as YYYY-MM-DD HH:MM:SS.mmm
-                    return f"{date_part}:{minute}:{second}.{ms}"
-                return dt_str
-                
-            if 'original_datetime' in df.columns:
-                df['parsed_datetime'] = df['original_datetime'].apply(parse_datetime)
-                df['datetime'] = pd.to_datetime(df['parsed_datetime'])
-            elif 'datetime' in df.columns and isinstance(df['datetime'].iloc[0], str):
-                df['parsed_datetime'] = df['datetime'].apply(parse_datetime)
-                df['datetime'] = pd.to_datetime(df['parsed_datetime'])
-        except Exception as e:
-            logger.error(f"Error processing datetime: {e}")
-            
-        # Get minute timestamp (floor to minute)
-        df['minute'] = df['datetime'].dt.floor('min')
-        
-        # Update the last price
-        self.last_price = df['price'].iloc[-1]
-        
-        # Update opening, high, low prices
-        if self.opening_price is None:
-            self.opening_price = df['price'].iloc[0]
-            
-        if self.day_high is None or df['price'].max() > self.day_high:
-            self.day_high = df['price'].max()
-            
-        if self.day_low is None or df['price'].min() < self.day_low:
-            self.day_low = df['price'].min()
-            
-        # Update total volume
-        self.total_volume += df['quantity'].sum()
-        
-        # Aggregate by minute - THIS LINE NEEDS THE AWAIT
-        await self._aggregate_by_minute(df)
-        
-        self.last_update_time = datetime.now()
-        return True
-        
-    async def _aggregate_by_minute(self, df):
-        """Aggregate trades by minute"""
-        # Group by minute
-        minute_groups = df.groupby('minute')
-        
-        # Calculate aggregates for each minute
-        for minute, group in minute_groups:
-            minute_str = minute.isoformat()
-            
-            # If minute already exists, update with new data
-            if minute_str in self.minute_aggregates:
-                existing = self.minute_aggregates[minute_str]
-                
-                # Update min and max prices
-                min_price = min(existing['min_price'], group['price'].min())
-                max_price = max(existing['max_price'], group['price'].max())
-                
-                # Keep the first price as open, and set the latest as close
-                open_price = existing['open_price']
-                close_price = group['price'].iloc[-1]
-                
-                # Add volumes
-                volume = existing['volume'] + group['quantity'].sum()
-                
-                # Combine trade counts
-                trade_count = existing['trade_count'] + len(group)
-                
-            else:
-                # Create new minute aggregate
-                min_price = group['price'].min()
-                max_price = group['price'].max()
-                open_price = group['price'].iloc[0]
-                close_price = group['price'].iloc[-1]
-                volume = group['quantity'].sum()
-                trade_count = len(group)
-            
-            self.minute_aggregates[minute_str] = {
-                'minute': minute_str,
-                'min_price': float(min_price),
-                'max_price': float(max_price),
-                'open_price': float(open_price),
-                'close_price': float(close_price),
-                'volume': int(volume),
-                'trade_count': int(trade_count),
-                'vwap': float((group['price'] * group['quantity']).sum() / group['quantity'].sum()) if not group.empty else None
-            }
-    
-    def get_minute_aggregates(self):
-        """Get all minute aggregates as a list sorted by time"""
-        result = list(self.minute_aggregates.values())
-        return sorted(result, key=lambda x: x['minute'])
-    
-    def get_summary(self):
-        """Get trading summary statistics"""
-        return {
-            'last_price': float(self.last_price) if self.last_price is not None else None,
-            'opening_price': float(self.opening_price) if self.opening_price is not None else None,
-            'day_high': float(self.day_high) if self.day_high is not None else None,
-            'day_low': float(self.day_low) if self.day_low is not None else None,
-            'total_volume': int(self.total_volume) if self.total_volume is not None else 0,
-            'trade_count': int(self.trade_count) if self.trade_count is not None else 0,
-            'last_update': self.last_update_time.isoformat() if self.last_update_time else None
-        }
-    
-    def calculate_moving_averages(self, window_sizes=[10, 20]):
-        """Calculate moving averages for candlestick data"""
-        if len(self.minute_aggregates) < 2:
-            return {}
-            
-        # Convert to DataFrame for easier calculation
-        minute_data = self.get_minute_aggregates()
-        df = pd.DataFrame(minute_data)
-        
-        # Calculate moving averages for specified window sizes
-        result = {}
-        for window in window_sizes:
-            if len(df) >= window:
-                ma_values = df['close_price'].rolling(window=window).mean()
-                # Convert to native Python types
-                result[f'MA{window}'] = {str(i): float(val) for i, val in enumerate(ma_values.dropna())}
-                
-        return result
-    
-    def calculate_macd(self, fast_period=12, slow_period=26, signal_period=9):
-        """Calculate MACD indicator"""
-        if len(self.minute_aggregates) < max(fast_period, slow_period, signal_period):
-            return {}
-            
-        minute_data = self.get_minute_aggregates()
-        df = pd.DataFrame(minute_data)
-        
-        # Calculate exponential moving averages
-        fast_ema = df['close_price'].ewm(span=fast_period, adjust=False).mean()
-        slow_ema = df['close_price'].ewm(span=slow_period, adjust=False).mean()
-        
-        # Calculate MACD line
-        macd_line = fast_ema - slow_ema
-        
-        # Calculate signal line
-        signal_line = macd_line.ewm(span=signal_period, adjust=False).mean()
-        
-        # Calculate histogram
-        histogram = macd_line - signal_line
-        
-        # Convert to native Python types
-        return {
-            'macd_line': {str(i): float(val) for i, val in enumerate(macd_line)},
-            'signal_line': {str(i): float(val) for i, val in enumerate(signal_line)},
-            'histogram': {str(i): float(val) for i, val in enumerate(histogram)}
-        }
-    
-    def clear_data(self):
-        """Clear all stored data"""
-        self.all_trades = []
-        self.minute_aggregates = {}
-        self.last_price = None
-        self.opening_price = None
-        self.day_high = None
-        self.day_low = None
-        self.total_volume = 0
-        self.trade_count = 0
-        self.last_update_time = None
-
-# Create trade processor instance
-trade_processor = TradeProcessor()
+# Configuration for per-symbol processing
+processing_config = {
+    "shard_workers": 0,  # worker processes for symbol processors, 0 keeps them in-process
+    "default_symbol": "AAPL"  # for trades without a symbol and clients that don't subscribe
+}
+
+# Write-ahead trade log and checkpoints, so a restart recovers processor state
+persistence_config = {
+    "directory": "trade_log",  # one subdirectory per symbol, None disables persistence
+    "checkpoint_interval_seconds": 60,
+    "segment_bytes": 64 * 1024 * 1024,
+    "fsync": False  # True survives power loss as well as process crashes, at a cost per batch
+}
+
+# Create the per-symbol trade processors
+processors = ProcessorPool(
+    processing_config["shard_workers"],
+    max_trades=retention_config["max_trades"],
+    max_trade_age_seconds=retention_config["max_age_seconds"],
+    log_config=persistence_config if persistence_config["directory"] else None
+)
+
+# Sequenced update stream sent to browsers
+class UpdateStream:
+    """Assigns sequence numbers to outgoing updates and keeps a bounded history
+
+    Clients that notice a gap in sequence numbers ask for a resync; recent
+    updates are replayed from the history, anything older gets a snapshot.
+    """
+    def __init__(self, history_size: int = 1000):
+        self.seq = 0
+        self.history = deque(maxlen=history_size)  # (seq, message_json)
+
+    def publish(self, message: Dict) -> str:
+        self.seq += 1
+        message['seq'] = self.seq
+        message_json = encode_json(message)
+        self.history.append((self.seq, message_json))
+        return message_json
+
+    def since(self, seq: int) -> Optional[List[str]]:
+        """Encoded updates after ``seq``, or None if they are no longer retained
+
+        A ``seq`` ahead of the stream (e.g. from before a server restart) is
+        never answered with an empty replay, so the client gets a snapshot.
+        """
+        if seq > self.seq:
+            return None
+        if seq == self.seq:
+            return []
+        if not self.history or self.history[0][0] > seq + 1:
+            return None
+        return [message_json for message_seq, message_json in self.history if message_seq > seq]
+
+# One sequence per symbol (and bar or indicator topic), created when its first
+# update is published, so queries about unknown symbols don't add streams
+update_streams: Dict[str, UpdateStream] = defaultdict(UpdateStream)
+
+def stream_seq(topic: str) -> int:
+    """Sequence number of the newest update published on a topic, 0 before any"""
+    stream = update_streams.get(topic)
+    return stream.seq if stream is not None else 0
 
 # Configuration for simulator connection
 simulator_config = {
@@ -283,9 +155,182 @@ simulator_config = {
     "reconnect_delay": 5,  # seconds
     "max_reconnect_attempts": 10,
     "ws_url": "ws://localhost:8000/ws",
-    "http_url": "http://localhost:8000/trades"
+    "resume_url": "http://localhost:8000/trades/resume",  # missed trades, streamed before the live ones
+    # Live trade messages as "binary" columnar frames (see trade_frames.py) or
+    # "json"; a simulator without binary frames keeps sending JSON
+    "format": "binary",
+    # Simulator messages held while ingestion is behind; once full the
+    # socket is no longer read, so TCP flow control slows the simulator
+    "queue_size": 1000
 }
 
+class TradeSequence:
+    """Newest simulator trade sequence number ingested, so nothing is ingested twice
+
+    The simulator numbers the trades of its replay 1, 2, ... in the order
+    sent; a restarted simulator (or a new replay) starts a new ``stream``.
+    Trades without a sequence number are always fresh.
+    """
+    def __init__(self):
+        self.stream: Optional[str] = None
+        self.seq = 0
+
+    def follow(self, stream: Optional[str]) -> bool:
+        """Switch to ``stream``, returning False if its numbers are not the ones seen so far"""
+        if stream is not None and stream == self.stream:
+            return True
+        self.stream, self.seq = stream, 0
+        return False
+
+    def fresh(self, trades_list) -> list:
+        """Trades not ingested yet; trades of one message or batch have consecutive numbers"""
+        if not trades_list:
+            return trades_list
+        if isinstance(trades_list, TradeColumns):
+            first = trades_list.first_seq
+            last = first + len(trades_list) - 1 if first is not None else None
+        else:
+            first, last = trades_list[0].get('seq'), trades_list[-1].get('seq')
+        if not isinstance(first, int) or not isinstance(last, int):
+            return trades_list
+        if first > self.seq + 1 and self.seq:
+            logger.warning(f"Missed simulator trades {self.seq + 1} to {first - 1}")
+        seq = self.seq
+        self.seq = max(seq, last)
+        if first > seq:
+            return trades_list
+        fresh = trades_list[seq + 1 - first:]
+        DUPLICATE_TRADES.inc(len(trades_list) - len(fresh))
+        return fresh
+
+sequence = TradeSequence()
+
+# Runtime metrics served on /metrics; gauges are computed when scraped
+ADD_TRADES_SECONDS = REGISTRY.histogram("add_trades_seconds",
+                                        "Time to ingest one batch of trades into the processors")
+TRADES_INGESTED = REGISTRY.counter("trades_ingested_total", "Trades received and ingested")
+SIMULATOR_MESSAGES = REGISTRY.counter("simulator_messages_total", "Messages received from the simulator")
+SIMULATOR_RECONNECTS = REGISTRY.counter("simulator_reconnects_total", "Failed or lost simulator connections")
+RESUMED_TRADES = REGISTRY.counter("resumed_trades_total", "Missed trades caught up on after connecting")
+DUPLICATE_TRADES = REGISTRY.counter("duplicate_trades_total", "Trades received again and skipped")
+
+async def _processor_stat(name: str) -> Dict[str, int]:
+    return {symbol: stats[name] for symbol, stats in (await processors.stats()).items()}
+
+REGISTRY.gauge("minute_bars", "Minute bars held per symbol", lambda: _processor_stat('minute_bars'), "symbol")
+REGISTRY.gauge("retained_trades", "Raw trades retained per symbol",
+               lambda: _processor_stat('retained_trades'), "symbol")
+REGISTRY.gauge("retained_trades_bytes", "Bytes of the raw trades retained per symbol",
+               lambda: _processor_stat('retained_trade_bytes'), "symbol")
+REGISTRY.gauge("trade_buffer_bytes", "Memory allocated for the retained-trade buffer per symbol",
+               lambda: _processor_stat('trade_buffer_bytes'), "symbol")
+
+async def ingest_trades(trades_list, trace: Optional[Dict] = None) -> bool:
+    """Route a mixed-symbol batch of trades to the owning processors
+
+    Only marks the symbols dirty; browsers are updated by the broadcaster.
+    ``trace`` is the latency trace of the simulator message, if any.
+    """
+    if not trades_list:
+        return False
+    batches = group_by_symbol(trades_list, processing_config["default_symbol"])
+    started = time.perf_counter()
+    await processors.ingest(batches)
+    ADD_TRADES_SECONDS.observe(time.perf_counter() - started)
+    TRADES_INGESTED.inc(len(trades_list))
+    tracer.processed(trace, batches, time.time())
+    broadcaster.mark_dirty(batches)
+    return True
+
+async def resume_request():
+    """Query for the simulator's /trades/resume, plus each symbol's resume point
+
+    The simulator resumes after the newest sequence number ingested. If that
+    is from another stream (e.g. the server restarted and recovered trades
+    from its log), it resumes from the oldest symbol's newest trade instead.
+    """
+    points = {}
+    for symbol in processors.symbols:
+        point = await processors.call(symbol, 'resume_point')
+        if point is not None:
+            points[symbol] = point
+    params = {"after": sequence.seq}
+    if sequence.stream is not None:
+        params["stream"] = sequence.stream
+    if points:
+        params["from"] = min(last_ns for last_ns, _ in points.values())
+    return params, points
+
+async def iter_lines(content: aiohttp.StreamReader):
+    """Lines of a streamed body, which may be longer than ``readline`` allows"""
+    pending = []
+    async for chunk in content.iter_any():
+        *lines, rest = chunk.split(b"\n")
+        if lines:
+            lines[0] = b"".join(pending) + lines[0]
+            pending = []
+        for line in lines:
+            yield line
+        if rest:
+            pending.append(rest)
+    if pending:
+        yield b"".join(pending)
+
+async def resume_from_simulator(session: aiohttp.ClientSession):
+    """Catch up on the trades missed while disconnected, one bulk batch per line"""
+    params, points = await resume_request()
+    async with session.get(simulator_config["resume_url"], params=params) as resp:
+        resp.raise_for_status()
+        if sequence.follow(resp.headers.get("X-Trade-Stream")):
+            points = {}  # the sequence number alone says what is held
+        resumed = 0
+        async for line in iter_lines(resp.content):
+            if not line.strip():
+                continue
+            trades = sequence.fresh(drop_held_trades(json.loads(line)["trades"], points))
+            await ingest_trades(trades)
+            resumed += len(trades)
+    RESUMED_TRADES.inc(resumed)
+    logger.info(f"Resumed {resumed} missed trades")
+
+def drop_held_trades(trades_list, points: Dict) -> list:
+    """Drop trades the processors already hold, given their resume points
+
+    A symbol holds every trade before its last timestamp and the first
+    ``count`` trades at it.
+    """
+    if not points:
+        return trades_list
+    kept = []
+    skipped_at_last = defaultdict(int)
+    default_symbol = processing_config["default_symbol"]
+    for trade, timestamp in zip(trades_list, batch_timestamps(trades_list)):
+        symbol = trade.get('symbol') or default_symbol
+        point = points.get(symbol)
+        if point is not None and timestamp is not None:
+            last_ns, count = point
+            if timestamp < last_ns:
+                continue
+            if timestamp == last_ns and skipped_at_last[symbol] < count:
+                skipped_at_last[symbol] += 1
+                continue
+        kept.append(trade)
+    return kept
+
+async def read_simulator(ws: aiohttp.ClientWebSocketResponse, messages: asyncio.Queue):
+    """Queue the simulator's messages with their receive times, then None once closed
+
+    Waits while the queue is full rather than reading ahead of ingestion.
+    """
+    try:
+        async for msg in ws:
+            await messages.put((msg, time.time()))
+    except asyncio.CancelledError:
+        raise  # the consumer stopped and reads no more
+    except Exception as e:
+        logger.error(f"Error reading from simulator: {e}")
+    await messages.put((None, time.time()))
+
 # Connect to simulator and process trades
 async def connect_to_simulator():
     """Connect to trade simulator via WebSocket and process incoming trades"""
@@ -297,48 +342,56 @@ async def connect_to_simulator():
                 ws_url = simulator_config["ws_url"]
                 logger.info(f"Connecting to simulator at {ws_url}")
                 
-                # Try to get initial historical data via HTTP
-                try:
-                    http_url = simulator_config["http_url"]
-                    async with session.get(http_url) as resp:
-                        if resp.status == 200:
-                            hist_trades = await resp.json()
-                            logger.info(f"Loaded {len(hist_trades)} historical trades")
-                            await trade_processor.add_trades(hist_trades)  # Use await here
-                            # Broadcast initial data to any connected browsers
-                            await broadcast_updates()
-                except Exception as e:
-                    logger.warning(f"Could not get historical trades: {e}")
-                
                 # Connect to WebSocket for real-time updates
-                async with session.ws_connect(ws_url) as ws:
+                async with session.ws_connect(ws_url, params={"format": simulator_config["format"]}) as ws:
                     logger.info("Connected to simulator WebSocket")
                     reconnect_attempts = 0  # Reset reconnect counter on successful connection
                     
-                    # Process WebSocket messages
-                    async for msg in ws:
-                        if msg.type == aiohttp.WSMsgType.TEXT:
-                            try:
-                                data = json.loads(msg.data)
-                                
-                                # Process trades if present
-                                if "trades" in data:
-                                    trades = data["trades"]
-                                    if await trade_processor.add_trades(trades):  # Use await here
-                                        # Broadcast updates to browsers
-                                        await broadcast_updates()
-                            except Exception as e:
-                                logger.error(f"Error processing message: {e}")
-                                
-                        elif msg.type == aiohttp.WSMsgType.CLOSED:
-                            logger.warning("WebSocket connection closed by simulator")
-                            break
-                        elif msg.type == aiohttp.WSMsgType.ERROR:
-                            logger.error(f"WebSocket error: {msg}")
-                            break
+                    # Live messages are read, and held, while the missed trades
+                    # are caught up on, so none fall between the two
+                    messages: asyncio.Queue = asyncio.Queue(maxsize=simulator_config["queue_size"])
+                    reader = asyncio.create_task(read_simulator(ws, messages))
+                    try:
+                        try:
+                            await resume_from_simulator(session)
+                        except Exception as e:
+                            logger.warning(f"Could not resume missed trades: {e}")
+                        
+                        # Process WebSocket messages
+                        while True:
+                            msg, received_at = await messages.get()
+                            if msg is not None and msg.type in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+                                SIMULATOR_MESSAGES.inc()
+                                try:
+                                    if msg.type == aiohttp.WSMsgType.BINARY:
+                                        data = decode_trade_frame(msg.data)
+                                    else:
+                                        data = json.loads(msg.data)
+                                    if data.get("type") == "connection_established":
+                                        logger.info(f"Simulator sends {data.get('format', 'json')} trade messages")
+                                    
+                                    # Process trades if present
+                                    if "trades" in data:
+                                        trace = tracer.received(data, received_at, time.time())
+                                        if data.get("stream") != sequence.stream:
+                                            # e.g. a restarted simulator whose resume failed
+                                            sequence.follow(data.get("stream"))
+                                        await ingest_trades(sequence.fresh(data["trades"]), trace)
+                                except Exception as e:
+                                    logger.error(f"Error processing message: {e}")
+                                    
+                            elif msg is None or msg.type == aiohttp.WSMsgType.CLOSED:
+                                logger.warning("WebSocket connection closed by simulator")
+                                break
+                            elif msg.type == aiohttp.WSMsgType.ERROR:
+                                logger.error(f"WebSocket error: {msg}")
+                                break
+                    finally:
+                        reader.cancel()
                             
         except Exception as e:
             logger.error(f"Error connecting to simulator: {e}")
+            SIMULATOR_RECONNECTS.inc()
             
             # Handle reconnection with backoff
             reconnect_attempts += 1
@@ -351,72 +404,403 @@ async def connect_to_simulator():
                 await asyncio.sleep(60)  # Wait longer before trying again
                 reconnect_attempts = 0
 
-# Converter for numpy types for JSON serialization
-def convert_numpy_types(obj):
-    """Convert NumPy types to Python native types for JSON serialization"""
-    import numpy as np
-    
-    if isinstance(obj, np.integer):
-        return int(obj)
-    elif isinstance(obj, np.floating):
-        return float(obj)
-    elif isinstance(obj, np.ndarray):
-        return obj.tolist()
-    elif isinstance(obj, np.bool_):
-        return bool(obj)
-    elif isinstance(obj, (pd.Timestamp, pd.Timedelta)):
-        return str(obj)
-    elif isinstance(obj, dict):
-        return {k: convert_numpy_types(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_numpy_types(i) for i in obj]
-    else:
-        return obj
-
-# Broadcast updates to all connected browsers
-async def broadcast_updates():
-    """Send updated data to all connected browsers"""
-    # Prepare data to send
-    update_data = {
-        'timestamp': datetime.now().isoformat(),
-        'minute_aggregates': trade_processor.get_minute_aggregates(),
-        'summary': trade_processor.get_summary(),
-        'moving_averages': trade_processor.calculate_moving_averages(),
-        'macd': trade_processor.calculate_macd()
-    }
-    
-    # Convert NumPy types before serialization
-    update_data = convert_numpy_types(update_data)
+async def build_snapshot(symbol: str, *query) -> Dict:
+    """State of one symbol, tagged with the sequence number it is consistent with
+
+    ``query`` is ``(start_ns, end_ns, since, limit, max_points)`` as taken
+    by ``TradeProcessor.get_snapshot``; without it the full state is built.
+    """
+    seq = stream_seq(symbol)
+    snapshot = await processors.call(symbol, 'get_snapshot', *query)
+    snapshot.update({
+        'type': 'snapshot',
+        'symbol': symbol,
+        'seq': seq,
+        'timestamp': datetime.now().isoformat()
+    })
+    return snapshot
+
+# Encoded snapshot shared by /data, new WebSocket clients and resyncs
+class EncodedSnapshot:
+    __slots__ = ('key', 'text', 'etag', '_body')
+
+    def __init__(self, key: tuple, text: str, etag: str):
+        self.key = key
+        self.text = text
+        self.etag = etag
+        self._body = None
+
+    @property
+    def body(self) -> bytes:
+        if self._body is None:
+            self._body = self.text.encode()
+        return self._body
+
+class SnapshotCache:
+    """Serialize each symbol's snapshot once per state version and point budget
+
+    Entries are keyed on the processor version and the update stream seq,
+    so they are rebuilt only after trades are ingested or an update published.
+    The full state and its downsamples (a query with only ``max_points``)
+    are kept per budget, for symbols that have trades. Ranged snapshots and
+    the empty state of unknown symbols are built per request and not kept,
+    but get ETags from the same key, so they can be revalidated without
+    being built.
+    """
+    def __init__(self):
+        self._boot_id = format(time.time_ns(), 'x')
+        self._entries: Dict[Tuple[str, Optional[int]], EncodedSnapshot] = {}
+
+    def _key(self, symbol: str) -> tuple:
+        return (processors.versions.get(symbol, 0), stream_seq(symbol))
+
+    def etag(self, symbol: str, query: Optional[tuple] = None) -> str:
+        key = self._key(symbol)
+        suffix = "".join(f"-{'' if value is None else value}" for value in query) if query else ""
+        return f'"{self._boot_id}-{symbol}-{key[0]}-{key[1]}{suffix}"'
+
+    async def get(self, symbol: str, query: Optional[tuple] = None) -> EncodedSnapshot:
+        key = self._key(symbol)
+        if (query and any(value is not None for value in query[:4])) or symbol not in processors.versions:
+            text = encode_json(await build_snapshot(symbol, *(query or ())))
+            return EncodedSnapshot(key, text, self.etag(symbol, query))
+        max_points = query[4] if query else None
+        entry = self._entries.get((symbol, max_points))
+        if entry is None or entry.key != key:
+            text = encode_json(await build_snapshot(symbol, *(query or ())))
+            entry = EncodedSnapshot(key, text, self.etag(symbol, query))
+            self._entries[(symbol, max_points)] = entry
+        return entry
+
+snapshot_cache = SnapshotCache()
+
+def bar_topic(symbol: str, resolution: str) -> str:
+    """Topic (and update stream) of one symbol's bars at one resolution"""
+    return f"{symbol}@{resolution}"
+
+async def build_bar_snapshot(symbol: str, resolution: str, limit: Optional[int] = None,
+                             max_points: Optional[int] = None) -> Dict:
+    """The newest ``limit`` bars of a resolution, as the start of a bar subscription"""
+    seq = stream_seq(bar_topic(symbol, resolution))
+    snapshot = await processors.call(symbol, 'get_bars', resolution, None, None, limit, max_points)
+    snapshot.update({'type': 'bars', 'snapshot': True, 'symbol': symbol, 'seq': seq})
+    return snapshot
+
+def indicator_topic(symbol: str, key: str) -> str:
+    """Topic (and update stream) of one symbol's indicator with one parameter set"""
+    return f"{symbol}#{key}"
+
+# Normalized spec of every indicator key requested so far
+indicator_specs: Dict[str, Dict] = {}
+
+# Indicator keys each symbol's processor currently keeps
+active_indicators: Dict[str, Set[str]] = {}
+
+async def sync_indicators(symbol: str):
+    """Make a symbol's processor keep exactly the indicators browsers subscribe to
+
+    Every browser asking for the same parameter set shares one instance.
+    """
+    prefix = f"{symbol}#"
+    wanted = {topic[len(prefix):] for topic in browser_manager.subscribers if topic.startswith(prefix)}
+    if wanted != active_indicators.get(symbol, set()):
+        await processors.set_indicators(symbol, [indicator_specs[key] for key in sorted(wanted)])
+        if wanted:
+            active_indicators[symbol] = wanted
+        else:
+            active_indicators.pop(symbol, None)
+
+async def build_indicator_snapshot(symbol: str, key: str, limit: Optional[int] = None) -> Optional[Dict]:
+    """Current values of an indicator, as the start of an indicator subscription"""
+    seq = stream_seq(indicator_topic(symbol, key))
+    snapshot = await processors.call(symbol, 'get_indicator', key, limit)
+    if snapshot is not None:
+        snapshot.update({'type': 'indicator', 'snapshot': True, 'symbol': symbol, 'indicator': key, 'seq': seq})
+    return snapshot
+
+# Broadcast updates to subscribed browsers
+async def broadcast_updates(symbols: Optional[Iterable[str]] = None):
+    """Send each symbol's changes since the last broadcast to its subscribers
+
+    Changed bars of each resolution go only to that resolution's subscribers;
+    ``start`` is the series index from which the bars replace the client's.
+    Indicator changes likewise go to each parameter set's subscribers, with
+    values replacing the client's from bar index ``from``. A delta's
+    ``origin`` traces the oldest simulator batch it includes.
+    """
+    deltas = await processors.collect_deltas(symbols)
+    timestamp = datetime.now().isoformat()
+    unwatched = set()
+    for symbol, delta in deltas.items():
+        bar_changes = delta.pop('bars', {})
+        indicator_changes = delta.pop('indicators', {})
+        delta.update({'type': 'delta', 'symbol': symbol, 'timestamp': timestamp})
+        origin = tracer.take_origin(symbol, time.time())
+        if origin is not None:
+            delta['origin'] = origin
+        await browser_manager.broadcast_text(update_streams[symbol].publish(delta), topic=symbol)
+        
+        for resolution, change in bar_changes.items():
+            topic = bar_topic(symbol, resolution)
+            if topic in browser_manager.subscribers:
+                change.update({'type': 'bars', 'symbol': symbol, 'resolution': resolution})
+                await browser_manager.broadcast_text(update_streams[topic].publish(change), topic=topic)
+        
+        for key, change in indicator_changes.items():
+            topic = indicator_topic(symbol, key)
+            if topic in browser_manager.subscribers:
+                change.update({'type': 'indicator', 'symbol': symbol, 'indicator': key})
+                await browser_manager.broadcast_text(update_streams[topic].publish(change), topic=topic)
+            elif key in active_indicators.get(symbol, ()):
+                unwatched.add(symbol)  # its last subscriber disconnected
     
-    # Broadcast to all browsers
-    await browser_manager.broadcast(update_data)
+    for symbol in unwatched:
+        await sync_indicators(symbol)
+
+async def broadcast_snapshots():
+    """Send every symbol's full state to its subscribers, e.g. after a reset"""
+    await processors.collect_deltas()  # a snapshot supersedes any pending changes
+    for symbol in processors.symbols:
+        snapshot = await build_snapshot(symbol)
+        snapshot.pop('seq')
+        await browser_manager.broadcast_text(update_streams[symbol].publish(snapshot), topic=symbol)
+        
+        for resolution in RESOLUTIONS:
+            topic = bar_topic(symbol, resolution)
+            if topic in browser_manager.subscribers:
+                snapshot = await build_bar_snapshot(symbol, resolution)
+                snapshot.pop('seq')
+                await browser_manager.broadcast_text(update_streams[topic].publish(snapshot), topic=topic)
+        
+        for key in active_indicators.get(symbol, ()):
+            topic = indicator_topic(symbol, key)
+            if topic not in browser_manager.subscribers:
+                continue
+            snapshot = await build_indicator_snapshot(symbol, key)
+            if snapshot is not None:
+                snapshot.pop('seq')
+                await browser_manager.broadcast_text(update_streams[topic].publish(snapshot), topic=topic)
+
+class UpdateBroadcaster:
+    """Publish pending changes at a bounded rate, decoupled from ingest
+
+    Ingest only marks symbols dirty. This task wakes when something changed,
+    publishes one delta per dirty symbol covering everything ingested since
+    the previous one, then waits out the rest of the interval, so any number
+    of simulator messages in between coalesce into a single update.
+    """
+    def __init__(self, max_rate_hz: float):
+        self.interval = 1.0 / max_rate_hz
+        self.dirty: Set[str] = set()
+        self._changed = asyncio.Event()
+
+    def mark_dirty(self, symbols: Iterable[str]):
+        self.dirty.update(symbols)
+        self._changed.set()
+
+    async def run(self):
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+            started = time.monotonic()
+            symbols, self.dirty = self.dirty, set()
+            try:
+                await broadcast_updates(symbols)
+            except Exception as e:
+                logger.error(f"Error broadcasting updates: {e}")
+            await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+broadcaster = UpdateBroadcaster(broadcast_config["max_rate_hz"])
+
+def _parse_symbols(value) -> List[str]:
+    if isinstance(value, str):
+        value = value.split(",")
+    return [symbol.strip().upper() for symbol in value or [] if symbol.strip()]
+
+def _point_budget(max_points) -> Optional[int]:
+    """Downsampling budget for a requested ``max_points``: a power of two, at least ``min_points``"""
+    if max_points is None:
+        return None
+    budget = max(_int_param(max_points, "max_points"), browser_config["min_points"])
+    return 1 << (budget.bit_length() - 1)
+
+def _int_param(value, name: str) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be an integer, not {value!r}")
+
+def _time_bound(value, name: str) -> Optional[int]:
+    """A timestamp parameter as epoch ns, None if empty; raises ValueError naming the parameter"""
+    if not value:
+        return None
+    try:
+        timestamp = pd.Timestamp(value)
+    except (TypeError, ValueError):
+        timestamp = pd.NaT
+    if timestamp is pd.NaT:
+        raise ValueError(f"{name} must be a timestamp, not {value!r}")
+    return timestamp.value
+
+def _snapshot_query(start: Optional[str] = None, end: Optional[str] = None,
+                    since: Optional[int] = None, limit: Optional[int] = None,
+                    max_points: Optional[int] = None) -> Optional[tuple]:
+    """Normalize range parameters into a snapshot query, None for the full state
+
+    Raises ValueError for a parameter that doesn't parse.
+    """
+    query = (_time_bound(start, "from"),
+             _time_bound(end, "to"),
+             _int_param(since, "since") if since is not None else None,
+             _int_param(limit, "limit") if limit is not None else None,
+             _point_budget(max_points))
+    return query if any(value is not None for value in query) else None
+
+def _send_error(websocket: WebSocket, message: str, **details):
+    browser_manager.send(websocket, json.dumps({"type": "error", "message": message, **details}))
+
+async def subscribe_symbols(websocket: WebSocket, symbols: List[str], query: Optional[tuple] = None):
+    """Subscribe a browser to symbols and queue a snapshot for each new one"""
+    for symbol in symbols:
+        if browser_manager.subscribe(websocket, [symbol]):
+            browser_manager.send(websocket, (await snapshot_cache.get(symbol, query)).text)
+
+async def subscribe_bars(websocket: WebSocket, message: Dict):
+    """Subscribe a browser to one resolution's bars and queue their current state
+
+    Repeating the request is how a client that missed a bar update resyncs.
+    """
+    symbol = (message.get("symbol") or processing_config["default_symbol"]).upper()
+    resolution = message.get("resolution")
+    if resolution not in RESOLUTIONS:
+        browser_manager.send(websocket, json.dumps({
+            "type": "error", "message": f"Unknown resolution: {resolution}", "resolutions": list(RESOLUTIONS)
+        }))
+        return
+    limit = message.get("limit")
+    limit = _int_param(limit, "limit") if limit else None
+    max_points = _point_budget(message.get("max_points"))
+    browser_manager.subscribe(websocket, [bar_topic(symbol, resolution)])
+    snapshot = await build_bar_snapshot(symbol, resolution, limit, max_points)
+    browser_manager.send(websocket, json.dumps(snapshot))
+
+def _indicator_keys(websocket: WebSocket, message: Dict) -> Optional[List[str]]:
+    """Keys of the indicators a message asks for, or None after sending the client an error"""
+    keys = []
+    try:
+        for spec in message.get("indicators") or []:
+            spec = normalize_spec(spec)
+            key = spec_key(spec)
+            indicator_specs.setdefault(key, spec)
+            keys.append(key)
+    except ValueError as e:
+        browser_manager.send(websocket, json.dumps({
+            "type": "error", "message": str(e), "indicators": describe_indicators()
+        }))
+        return None
+    return keys
+
+async def subscribe_indicators(websocket: WebSocket, message: Dict):
+    """Subscribe a browser to indicators and queue their current values
+
+    ``{"type": "subscribe_indicators", "symbol": "AAPL", "indicators":
+    [{"name": "rsi", "period": 9}, "bollinger"]}``; omitted parameters take
+    their defaults. Repeating the request resyncs the listed indicators.
+    """
+    symbol = (message.get("symbol") or processing_config["default_symbol"]).upper()
+    keys = _indicator_keys(websocket, message)
+    if not keys:
+        return
+    browser_manager.subscribe(websocket, [indicator_topic(symbol, key) for key in keys])
+    await sync_indicators(symbol)
+    limit = message.get("limit")
+    limit = _int_param(limit, "limit") if limit else None
+    for key in keys:
+        snapshot = await build_indicator_snapshot(symbol, key, limit)
+        if snapshot is not None:
+            browser_manager.send(websocket, json.dumps(snapshot))
+
+async def unsubscribe_indicators(websocket: WebSocket, message: Dict):
+    symbol = (message.get("symbol") or processing_config["default_symbol"]).upper()
+    keys = _indicator_keys(websocket, message)
+    if keys:
+        browser_manager.unsubscribe(websocket, [indicator_topic(symbol, key) for key in keys])
+        await sync_indicators(symbol)
 
 # WebSocket endpoint for browsers
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(websocket: WebSocket, symbols: Optional[str] = None, since: Optional[int] = None,
+                             max_points: Optional[int] = None):
+    """Browsers subscribe with ?symbols=AAPL,MSFT or subscribe/unsubscribe messages
+
+    A reconnecting browser that still holds bars passes ?since=<first bar index
+    it needs> and gets a snapshot of only those bars. ?max_points=N caps the
+    bars of every snapshot it is sent, downsampling longer sessions.
+    """
+    await serve_browser(websocket, symbols, since, max_points)
+
+async def serve_browser(websocket, symbols: Optional[str] = None, since: Optional[int] = None,
+                        max_points: Optional[int] = None):
+    """Serve one browser until it disconnects, directly or relayed by a fan-out worker"""
     await browser_manager.connect(websocket)
     
     try:
-        # Send initial data to the client
-        update_data = {
-            'timestamp': datetime.now().isoformat(),
-            'minute_aggregates': trade_processor.get_minute_aggregates(),
-            'summary': trade_processor.get_summary(),
-            'moving_averages': trade_processor.calculate_moving_averages(),
-            'macd': trade_processor.calculate_macd()
-        }
-        await websocket.send_text(json.dumps(update_data))
+        # Queue initial snapshots; deltas for each symbol follow from its seq
+        try:
+            query = _snapshot_query(since=since, max_points=max_points)
+        except ValueError as e:
+            # Only reachable through a fan-out worker; /ws validates its query itself
+            _send_error(websocket, str(e))
+            query = max_points = None
+        await subscribe_symbols(websocket, _parse_symbols(symbols) or [processing_config["default_symbol"]], query)
         
         # Keep connection alive until disconnected
         while True:
-            # Wait for client messages (ping/pong or other)
+            # Wait for client messages (ping/pong, subscriptions, resync requests)
             data = await websocket.receive_text()
             try:
                 message = json.loads(data)
-                if message.get("type") == "ping":
-                    await websocket.send_text(json.dumps({"type": "pong"}))
-            except:
-                pass
+            except ValueError:
+                continue
+                
+            message_type = message.get("type")
+            try:
+                if message_type == "ping":
+                    browser_manager.send(websocket, json.dumps({"type": "pong"}))
+                elif message_type == "subscribe":
+                    await subscribe_symbols(websocket, _parse_symbols(message.get("symbols")),
+                                            _snapshot_query(max_points=message.get("max_points", max_points)))
+                elif message_type == "unsubscribe":
+                    browser_manager.unsubscribe(websocket, _parse_symbols(message.get("symbols")))
+                elif message_type == "subscribe_bars":
+                    await subscribe_bars(websocket, message)
+                elif message_type == "unsubscribe_bars":
+                    symbol = (message.get("symbol") or processing_config["default_symbol"]).upper()
+                    browser_manager.unsubscribe(websocket, [bar_topic(symbol, message.get("resolution"))])
+                elif message_type == "subscribe_indicators":
+                    await subscribe_indicators(websocket, message)
+                elif message_type == "unsubscribe_indicators":
+                    await unsubscribe_indicators(websocket, message)
+                elif message_type == "latency":
+                    # A browser reporting when a delta with this origin arrived
+                    tracer.delivered(message.get("origin"), message.get("received_at"))
+                elif message_type == "resync":
+                    symbol = (message.get("symbol") or processing_config["default_symbol"]).upper()
+                    from_seq = message.get("from_seq")
+                    from_seq = _int_param(from_seq, "from_seq") if from_seq is not None else None
+                    stream = update_streams.get(symbol)
+                    missed = stream.since(from_seq) if stream is not None and from_seq is not None else None
+                    # Replaying more than fits in the send queue would just drop it again
+                    if missed is None or len(missed) >= browser_manager.queue_size:
+                        query = _snapshot_query(message.get("from"), message.get("to"), message.get("since"),
+                                                message.get("limit"), message.get("max_points", max_points))
+                        browser_manager.send(websocket, (await snapshot_cache.get(symbol, query)).text)
+                    else:
+                        for message_json in missed:
+                            browser_manager.send(websocket, message_json)
+            except (TypeError, ValueError) as e:
+                # Bad parameters in the message; the connection stays up
+                _send_error(websocket, str(e), request=message_type)
                 
     except WebSocketDisconnect:
         browser_manager.disconnect(websocket)
@@ -426,40 +810,177 @@ async def websocket_endpoint(websocket: WebSocket):
 
 # HTTP endpoint to get current state (for initial load or reconnection)
 @app.get("/data")
-async def get_current_data():
-    """Get current aggregated trading data"""
-    data = {
-        'minute_aggregates': trade_processor.get_minute_aggregates(),
-        'summary': trade_processor.get_summary(),
-        'moving_averages': trade_processor.calculate_moving_averages(),
-        'macd': trade_processor.calculate_macd()
+async def get_current_data(request: Request, symbol: Optional[str] = None,
+                           start: Optional[str] = Query(None, alias="from"),
+                           end: Optional[str] = Query(None, alias="to"),
+                           since: Optional[int] = None, limit: Optional[int] = None,
+                           max_points: Optional[int] = None):
+    """Get current aggregated trading data for one symbol
+
+    Supports conditional requests: a matching If-None-Match returns 304.
+    
+    Args:
+        symbol: Symbol to query (defaults to the default symbol)
+        from: Inclusive lower bound on the minute bar start (ISO timestamp)
+        to: Exclusive upper bound on the minute bar start (ISO timestamp)
+        since: Index of the first minute bar wanted
+        limit: Maximum number of minute bars, counted back from the newest
+        max_points: Downsample to at most this many bars (rounded down to a
+            power of two), keeping each bucket's extremes; ``index`` then
+            lists the bar index of each bar
+    
+    With any of the range parameters the response holds only the selected
+    bars, starting at index ``start``, and the indicator points belonging
+    to them.
+    """
+    symbol = (symbol or processing_config["default_symbol"]).upper()
+    try:
+        query = _snapshot_query(start, end, since, limit, max_points)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    etag = snapshot_cache.etag(symbol, query)
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers={"ETag": etag})
+        
+    snapshot = await snapshot_cache.get(symbol, query)
+    return Response(content=snapshot.body, media_type="application/json",
+                    headers={"ETag": snapshot.etag})
+
+# Prometheus scrape endpoint
+@app.get("/metrics")
+async def get_metrics():
+    text = await REGISTRY.render(await processors.metric_states())
+    return Response(content=text, media_type=CONTENT_TYPE)
+
+# Sampled per-stage latency of simulator batches
+@app.get("/latency")
+async def get_latency(limit: int = 20):
+    """Percentiles per stage, plus the most recent sampled server-side traces"""
+    return {
+        "sample_every": tracer.sample_every,
+        "stages": tracer.summary(),
+        "recent": list(tracer.recent)[-limit:] if limit > 0 else []
     }
+
+# HTTP endpoint listing the symbols seen so far
+@app.get("/symbols")
+async def get_symbols():
+    return processors.symbols
+
+# HTTP endpoint listing the indicators browsers can subscribe to
+@app.get("/indicators")
+async def get_indicators():
+    return describe_indicators()
+
+# HTTP endpoint for OHLCV bars at any supported resolution
+@app.get("/bars")
+async def get_bars(symbol: Optional[str] = None, resolution: str = "1m",
+                   start: Optional[str] = Query(None, alias="from"),
+                   end: Optional[str] = Query(None, alias="to"), limit: Optional[int] = None,
+                   max_points: Optional[int] = None):
+    """
+    Get bars for one symbol, oldest first.
     
-    # Convert NumPy types to Python native types
-    return convert_numpy_types(data)
+    Args:
+        symbol: Symbol to query (defaults to the default symbol)
+        resolution: One of 1s, 5s, 1m, 5m, 1h
+        from: Inclusive lower bound on the bar start (ISO timestamp)
+        to: Exclusive upper bound on the bar start (ISO timestamp)
+        limit: Maximum number of bars to return, counted back from the newest
+        max_points: Downsample to at most this many bars, as for /data
+    """
+    if resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution must be one of {', '.join(RESOLUTIONS)}")
+    symbol = (symbol or processing_config["default_symbol"]).upper()
+    try:
+        start_ns, end_ns = _time_bound(start, "from"), _time_bound(end, "to")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    result = await processors.call(symbol, 'get_bars', resolution, start_ns, end_ns, limit,
+                                   _point_budget(max_points))
+    result['symbol'] = symbol
+    return result
+
+# HTTP endpoint for retained raw trades
+@app.get("/trades")
+async def get_raw_trades(symbol: Optional[str] = None, start: Optional[str] = None,
+                         end: Optional[str] = None, limit: int = 1000):
+    """
+    Get raw trades retained by the server for one symbol, oldest first.
+    
+    Args:
+        symbol: Symbol to query (defaults to the default symbol)
+        start: Inclusive lower time bound (ISO timestamp)
+        end: Exclusive upper time bound (ISO timestamp)
+        limit: Maximum number of trades to return, counted back from the newest
+    """
+    symbol = (symbol or processing_config["default_symbol"]).upper()
+    try:
+        start_ns, end_ns = _time_bound(start, "start"), _time_bound(end, "end")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await processors.call(symbol, 'get_trades', start_ns, end_ns, limit)
 
 # Endpoint to reset all data
 @app.post("/reset")
 async def reset_data():
     """Reset all stored trade data"""
-    trade_processor.clear_data()
+    await processors.clear()
+    tracer.clear()
+    await broadcast_snapshots()
     return {"status": "success", "message": "All data has been reset"}
 
+async def periodic_checkpoint_task():
+    """Checkpoint changed processors so recovery only replays a short log tail"""
+    while True:
+        await asyncio.sleep(persistence_config["checkpoint_interval_seconds"])
+        try:
+            written = await processors.checkpoint()
+            if written:
+                logger.info(f"Checkpointed {written} symbol(s)")
+        except Exception as e:
+            logger.error(f"Error writing checkpoints: {e}")
+
 @app.on_event("startup")
 async def startup_event():
+    # Recover logged state first, so the simulator is only asked for what is missing
+    if persistence_config["directory"]:
+        symbols = await processors.recover()
+        if symbols:
+            logger.info(f"Recovered state for {', '.join(symbols)}")
+        asyncio.create_task(periodic_checkpoint_task())
     # Start connecting to simulator in background
     asyncio.create_task(connect_to_simulator())
 
-# Create a background task to periodically broadcast updates
-async def periodic_update_task():
-    """Send regular updates to browsers even if no new trades arrive"""
-    while True:
-        await broadcast_updates()
-        await asyncio.sleep(1)  # Update every second
+@app.on_event("shutdown")
+async def shutdown_event():
+    if persistence_config["directory"]:
+        try:
+            await processors.checkpoint()
+        except Exception as e:
+            logger.error(f"Error writing checkpoints: {e}")
+    processors.shutdown()
 
 @app.on_event("startup")
-async def start_periodic_updates():
-    asyncio.create_task(periodic_update_task())
+async def start_broadcaster():
+    asyncio.create_task(broadcaster.run())
+    asyncio.create_task(monitor_event_loop())
+
+async def serve_relayed_browser(websocket):
+    await serve_browser(websocket, websocket.query_params.get("symbols"), websocket.query_params.get("since"),
+                        websocket.query_params.get("max_points"))
+
+@app.on_event("startup")
+async def start_relay():
+    if fanout_config["socket"]:
+        await serve_relay(browser_manager, fanout_config["socket"], serve_relayed_browser)
+        logger.info(f"Relaying fan-out workers through {fanout_config['socket']}")
+
+@app.on_event("shutdown")
+async def stop_relay():
+    if fanout_config["socket"] and os.path.exists(fanout_config["socket"]):
+        os.remove(fanout_config["socket"])
 
 # Run the server
 if __name__ == "__main__":
@@ -3,15 +3,26 @@
 # It provides WebSocket and HTTP interfaces for the server to consume
 
 import asyncio
-import pandas as pd
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request
+import bisect
+import numpy as np
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, Query, Response, HTTPException
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import json
 import logging
-from datetime import datetime
 import uvicorn
 from typing import List, Dict, Optional
 import time
+import glob
+import itertools
+import os
+import uuid
+
+from connections import ConnectionManager, encode_json
+from metrics import CONTENT_TYPE, REGISTRY, monitor_event_loop
+from replay_cache import load_replay_data, open_timeline, symbol_for_file
+from timeparse import isoformat_ns, parse_timestamp
+from trade_frames import FORMATS, encode_trade_frame
 
 # Configure logging
 logging.basicConfig(
@@ -31,148 +42,406 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Configuration for consumer fan-out
+connection_config = {
+    "send_queue_size": 1024,  # messages buffered per consumer
+    # Dropping trade messages would corrupt downstream aggregates, so slow
+    # consumers are disconnected and recover via /trades/resume on reconnect
+    "slow_consumer_policy": "disconnect"
+}
+
 # Store active connections
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+manager = ConnectionManager(
+    logger,
+    queue_size=connection_config["send_queue_size"],
+    slow_consumer_policy=connection_config["slow_consumer_policy"]
+)
+manager.register_metrics()
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        logger.info(f"New connection established. Total connections: {len(self.active_connections)}")
+# Subscribers of the shared replay controlled by /simulation/control; a
+# subscriber that opens its own replay session leaves it for the session
+LIVE_TOPIC = "live"
 
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-        logger.info(f"Connection closed. Remaining connections: {len(self.active_connections)}")
+# Trade message format of each subscriber, chosen when connecting
+# (/ws?format=binary, see trade_frames.py; JSON otherwise)
+trade_formats: Dict[WebSocket, str] = {}
 
-    async def broadcast(self, message: Dict):
-        if not self.active_connections:
-            return
-            
-        message_json = json.dumps(message)
-        disconnect_list = []
-        
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message_json)
-            except Exception as e:
-                logger.error(f"Error sending message: {e}")
-                disconnect_list.append(connection)
-                
-        # Clean up disconnected clients
-        for connection in disconnect_list:
-            self.active_connections.remove(connection)
+def live_topics(websocket: WebSocket) -> List[str]:
+    """Topics of a live subscriber: all of them, and those taking its format"""
+    return [LIVE_TOPIC, f"{LIVE_TOPIC}.{trade_formats.get(websocket, 'json')}"]
+
+# Replay metrics served on /metrics
+TRADES_SENT = REGISTRY.counter("trades_sent_total", "Trades broadcast to subscribers")
+REPLAY_MESSAGES = REGISTRY.counter("replay_messages_total", "Trade messages broadcast to subscribers")
+
+# Trade files to replay; glob patterns and directories are expanded and each
+# file is one symbol, named after the file (AAPL.csv, AAPL_2020-07-01.csv or
+# AAPL/2020-07-01.csv -> AAPL) unless it has a symbol column. Files covering
+# the same period are merged; later periods (e.g. days) play back to back.
+data_config = {
+    "files": ["AAPL.csv"]
+}
+
+# Replay pacing. Trades are sent at their original offsets scaled by the
+# speed factor; trades falling due within one batch window go out together.
+replay_config = {
+    "batch_window_ms": 5.0,    # minimum wall time between messages
+    "max_batch_trades": 5000,  # larger due sets are split across messages
+    "min_speed": 0.01,
+    "max_speed": 1_000_000.0,
+    "max_wait_seconds": 0.25,  # longest single sleep, so control changes apply promptly
+    "prefetch_trades": 500_000,  # upcoming trades paged in ahead of the replay
+    "prefetch_interval_seconds": 0.5,
+    "resume_batch_trades": 20_000  # trades per line of a /trades/resume stream
+}
 
-manager = ConnectionManager()
+def resolve_data_files(patterns) -> List[str]:
+    """Expand glob patterns and directories into a sorted list of CSV files"""
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            files.extend(sorted(glob.glob(os.path.join(pattern, '*.csv'))))
+        else:
+            files.extend(sorted(glob.glob(pattern)) or [pattern])
+    return files
+
+def parse_speed(value):
+    """A speed factor within the configured bounds, or "max"; raises ValueError otherwise"""
+    if value == "max":
+        return value
+    try:
+        speed = float(value)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid speed value")
+    if not replay_config["min_speed"] <= speed <= replay_config["max_speed"]:
+        raise ValueError(f"Speed must be between {replay_config['min_speed']} and "
+                         f"{replay_config['max_speed']}, or \"max\"")
+    return speed
+
+def parse_bound(value) -> int:
+    """A time bound (timestamp string, epoch ns int or digit string) as epoch ns"""
+    if isinstance(value, str) and value.isdigit():
+        value = int(value)
+    return parse_timestamp(value)
 
 # Store the current simulation state
 class SimulationState:
+    """A replay cursor and clock over a loaded trade timeline
+
+    The shared replay owns the timeline; per-subscriber sessions are forks
+    that read the same timeline object (see ``fork``), with their own
+    position, speed, pause state and range.
+    """
     def __init__(self):
         self.trade_data = None
-        self.last_second_index = 0
+        self.position = 0  # row of the next trade to send
         self.is_running = False
         self.speed_factor = 1.0
-        self.trade_buffer = {}  # Store trades by second
+        self.unthrottled = False  # send as fast as consumers accept, ignoring timestamps
+        # Replay clock: data time ``anchor_ns`` corresponds to monotonic ``anchor_wall``
+        self.anchor_wall = 0.0
+        self.anchor_ns = 0
         self.all_seconds = []
+        self.symbols = []
+        self.start = 0  # first row of the replayed range
+        self.end = None  # row the replayed range stops before, None for all data
+        self.repeat = True  # start over at the end of the range, rather than finish
+        self.task = None  # replay loop, which may outlive a stop until it next wakes
+        # Sent trades are numbered 1, 2, ... in the order sent, across seeks,
+        # resets and laps; ``segments`` holds the (seq, row) of every jump
+        self.stream = uuid.uuid4().hex  # identifies these sequence numbers
+        self.segments = [(1, 0)]
+
+    def fork(self, start_ns: Optional[int] = None, end_ns: Optional[int] = None) -> 'SimulationState':
+        """A session replaying the same timeline once, from ``start_ns`` up to ``end_ns``"""
+        session = SimulationState()
+        session.trade_data = self.trade_data
+        session.all_seconds = self.all_seconds
+        session.symbols = self.symbols
+        session.repeat = False
+        session.seek(start_ns)
+        if end_ns is not None:
+            session.end = self.trade_data.search(end_ns, side='left')
+        return session
+
+    def end_position(self) -> int:
+        total = len(self.trade_data)
+        return total if self.end is None else min(self.end, total)
+
+    def seek(self, start_ns: Optional[int] = None):
+        """Continue from the first trade at or after ``start_ns`` (default: the start of the range)"""
+        if start_ns is not None:
+            self.start = self.trade_data.search(start_ns, side='left')
+        self.jump(self.start)
+        if self.is_running:
+            self.anchor(time.monotonic())
+
+    def jump(self, position: int):
+        """Move the cursor; sequence numbers carry on from the last trade sent"""
+        seq = self.row_seq(self.position)
+        if self.segments[-1][0] == seq:
+            self.segments.pop()  # nothing was sent since the previous jump
+        self.segments.append((seq, position))
+        self.position = position
+
+    def row_seq(self, row: int) -> int:
+        """Sequence number trade ``row`` gets when sent from the current cursor"""
+        seq, first_row = self.segments[-1]
+        return seq + row - first_row
+
+    def next_seq(self) -> int:
+        return self.row_seq(self.position)
+
+    def seq_rows(self, seq: int) -> tuple:
+        """Row of sent trade ``seq`` and how many trades were sent from there on without a jump"""
+        index = bisect.bisect_right(self.segments, (seq, float('inf'))) - 1
+        first_seq, first_row = self.segments[index]
+        end = self.segments[index + 1][0] if index + 1 < len(self.segments) else self.next_seq()
+        return first_row + seq - first_seq, end - seq
+
+    def seq_at(self, start_ns: Optional[int] = None) -> int:
+        """Sequence number of the first trade at or after ``start_ns`` sent since the last jump"""
+        seq, first_row = self.segments[-1]
+        if start_ns is None:
+            return seq
+        row = self.trade_data.search(start_ns, side='left')
+        return seq + max(0, min(row, self.position) - first_row)
         
-    def load_data(self, file_path='AAPL.csv'):
+    def load_data(self, file_paths=None):
+        """Load one or more symbol files into a single timeline
+
+        Each CSV is compiled once, in chunks, into a columnar replay cache
+        next to it and memory-mapped on later starts (see replay_cache.py),
+        so only the trades about to be replayed need to be in memory.
+        """
         try:
-            logger.info(f"Loading trade data from {file_path}")
-            df = pd.read_csv(file_path)
-            
-            # Process datetime to proper format (handling the unique format in AAPL.csv)
-            df['original_datetime'] = df['datetime']
-            
-            # Custom datetime parsing for the specific format in AAPL.csv
-            # Format is like "2020-07-01 04:00:00:072" with unusual structure
-            def parse_datetime(dt_str):
-                parts = dt_str.split(':')
-                if len(parts) == 4:  # If it has the form HH:MM:SS:mmm
-                    date_part = parts[0]  # Contains date and hour
-                    minute = parts[1]
-                    second = parts[2]
-                    ms = parts[3]
-                    # Reconstruct as YYYY-MM-DD HH:MM:SS.mmm
-                    return f"{date_part}:{minute}:{second}.{ms}"
-                return dt_str
-                
-            df['parsed_datetime'] = df['datetime'].apply(parse_datetime)
-            df['datetime'] = pd.to_datetime(df['parsed_datetime'])
-            df['second'] = df['datetime'].dt.floor('S')
+            parts = []
+            for file_path in resolve_data_files(file_paths or data_config["files"]):
+                logger.info(f"Loading trade data from {file_path}")
+                parts.append(load_replay_data(file_path, symbol_for_file(file_path)))
+            data = open_timeline(parts)
             
-            # Sort by datetime
-            df = df.sort_values('datetime')
+            # Start time of every second that has trades
+            self.all_seconds = data.second_starts
+            self.symbols = data.symbols
             
-            # Group by second
-            second_groups = df.groupby('second')
-            
-            # Store trades by second
-            self.trade_buffer = {}
-            for second, group in second_groups:
-                self.trade_buffer[second] = group[['original_datetime', 'price', 'quantity', 'venue']].to_dict('records')
-            
-            # Get all unique seconds
-            self.all_seconds = sorted(list(self.trade_buffer.keys()))
-            
-            logger.info(f"Loaded {len(df)} trades across {len(self.all_seconds)} seconds")
-            self.trade_data = df
-            self.last_second_index = 0
+            logger.info(f"Loaded {len(data)} trades for {len(self.symbols)} symbols across "
+                        f"{len(self.all_seconds)} seconds in {len(data.sessions)} session(s)")
+            self.trade_data = data
+            self.position = 0
             return True
         except Exception as e:
             logger.error(f"Error loading trade data: {e}")
             return False
             
-    def get_trades_for_second(self, index):
-        """Get all trades for a specific second index"""
-        if index >= len(self.all_seconds):
-            return None
-            
-        second = self.all_seconds[index]
-        return {
-            "timestamp": second.isoformat(),
-            "trades": self.trade_buffer[second]
-        }
+    def data_clock(self, now: float) -> int:
+        """Data time (epoch ns) the replay has reached at monotonic time ``now``"""
+        return self.anchor_ns + int((now - self.anchor_wall) * self.speed_factor * 1e9)
+
+    def due_time(self, index: int) -> float:
+        """Monotonic time at which trade ``index`` is due to be sent"""
+        timestamp = self.trade_data.timestamp(index)
+        return self.anchor_wall + (timestamp - self.anchor_ns) / (self.speed_factor * 1e9)
+
+    def anchor(self, now: float, data_ns: Optional[int] = None):
+        """Pin the replay clock so that ``data_ns`` (default: the next trade) plays at ``now``"""
+        if data_ns is None:
+            data = self.trade_data
+            data_ns = data.timestamp(self.position) if self.position < len(data) else 0
+        self.anchor_wall = now
+        self.anchor_ns = data_ns
+
+    def set_speed(self, speed: float):
+        """Change the speed factor without jumping the replay clock"""
+        if self.is_running and not self.unthrottled:
+            now = time.monotonic()
+            self.anchor(now, self.data_clock(now))
+        self.speed_factor = speed
+
+    def apply_speed(self, speed):
+        """Switch to a speed returned by ``parse_speed``"""
+        if speed == "max":
+            self.unthrottled = True
+        elif self.unthrottled:
+            self.unthrottled = False
+            self.speed_factor = speed
+            self.anchor(time.monotonic())
+        else:
+            self.set_speed(speed)
+
+    def current_second_index(self) -> int:
+        """Index of the second the most recently sent trade belongs to"""
+        if self.trade_data is None or self.position == 0:
+            return 0
+        return int(np.searchsorted(self.trade_data.second_offsets, self.position - 1, side='right')) - 1
     
-    def get_historical_trades(self, limit):
-        """Get historical trades up to the current simulation point"""
-        if not self.trade_data is not None:
+    def get_historical_trades(self, limit, start_ns=None, end_ns=None):
+        """Get historical trades up to the current simulation point
+
+        ``second_offsets`` is a running trade count per second, so the range
+        is located by index arithmetic and binary search and only the
+        returned trades are materialized.
+        
+        Args:
+            limit: Maximum number of trades, counted back from the newest
+            start_ns: Optional inclusive lower time bound (epoch ns)
+            end_ns: Optional exclusive upper time bound (epoch ns)
+        """
+        if self.trade_data is None:
             return []
             
-        all_trades = []
-        for i in range(min(self.last_second_index, len(self.all_seconds))):
-            second = self.all_seconds[i]
-            all_trades.extend(self.trade_buffer[second])
-            
-        # Return most recent trades up to limit
-        return all_trades[-limit:] if limit < len(all_trades) else all_trades
+        data = self.trade_data
+        stop = self.position
+        if end_ns is not None:
+            stop = min(stop, data.search(end_ns, side='left'))
+        start = stop - limit if limit is not None else 0
+        if start_ns is not None:
+            start = max(start, data.search(start_ns, side='left'))
+        return data.records(max(start, 0), stop) if start < stop else []
+
+    def status(self) -> Dict:
+        if self.trade_data is None:
+            return {"status": "not_initialized"}
+
+        current_index = self.current_second_index()
+        current_second = None
+        if 0 <= current_index < len(self.all_seconds):
+            current_second = isoformat_ns(self.all_seconds[current_index])
+
+        if self.is_running:
+            status = "running"
+        elif not self.repeat and self.position >= self.end_position():
+            status = "finished"
+        else:
+            status = "stopped"
+        return {
+            "status": status,
+            "total_seconds": len(self.all_seconds),
+            "current_second_index": current_index,
+            "current_second": current_second,
+            "trades_sent": self.position - self.start,
+            "total_trades": self.end_position() - self.start,
+            "speed_factor": "max" if self.unthrottled else self.speed_factor,
+            "batch_window_ms": replay_config["batch_window_ms"],
+            "symbols": self.symbols
+        }
 
 simulation = SimulationState()
 
+# Per-subscriber replay sessions, forked from ``simulation``
+sessions: Dict[WebSocket, SimulationState] = {}
+REGISTRY.gauge("replay_sessions", "Open per-subscriber replay sessions", lambda: len(sessions))
+
+def start_replay(state: SimulationState, websocket: Optional[WebSocket] = None) -> bool:
+    """Run (or resume) a replay, sending to ``websocket`` alone if given; False if already running"""
+    if state.is_running:
+        return False
+    state.is_running = True
+    state.anchor(time.monotonic())
+    if state.task is None or state.task.done():
+        state.task = asyncio.create_task(simulate_real_time_data(state, websocket))
+    return True
+
 @app.on_event("startup")
 async def startup_event():
     if not simulation.load_data():
         logger.error("Failed to load trade data, simulator cannot start")
+    asyncio.create_task(monitor_event_loop())
+    asyncio.create_task(prefetch_replay_data())
+
+async def prefetch_replay_data():
+    """Page in (or merge) the trades about to be replayed, off the event loop"""
+    while True:
+        data = simulation.trade_data
+        # Sessions share the timeline, so one page-in serves every cursor near it
+        positions = sorted({state.position for state in (simulation, *sessions.values()) if state.is_running})
+        for position in positions if data is not None else ():
+            try:
+                await asyncio.to_thread(data.prefetch, position, replay_config["prefetch_trades"])
+            except Exception as e:
+                logger.error(f"Error prefetching trade data: {e}")
+        await asyncio.sleep(replay_config["prefetch_interval_seconds"])
+
+# Prometheus scrape endpoint
+@app.get("/metrics")
+async def get_metrics():
+    return Response(content=await REGISTRY.render(), media_type=CONTENT_TYPE)
 
 # HTTP endpoint to get historical trades
 @app.get("/trades")
-async def get_trades(limit: int = 100):
+async def get_trades(limit: int = 100, start: Optional[str] = Query(None, alias="from"),
+                     end: Optional[str] = Query(None, alias="to")):
     """
     Get historical trades up to the current simulation point.
     
     Args:
         limit: Maximum number of trades to return (default 100)
+        from: Optional inclusive lower time bound (timestamp string or epoch ns)
+        to: Optional exclusive upper time bound (timestamp string or epoch ns)
     """
-    return simulation.get_historical_trades(limit)
+    try:
+        start_ns = parse_bound(start) if start else None
+        end_ns = parse_bound(end) if end else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return simulation.get_historical_trades(limit, start_ns, end_ns)
+
+@app.get("/trades/resume")
+async def resume_trades(after: int = 0, stream: Optional[str] = None,
+                        start: Optional[str] = Query(None, alias="from")):
+    """
+    Stream the shared replay's trades after sequence number ``after``, up to
+    the newest sent, as newline-delimited JSON batches of up to
+    ``replay_config["resume_batch_trades"]`` trades.
+
+    Args:
+        after: Sequence number of the newest trade already received
+        stream: Stream the sequence number belongs to (the ``X-Trade-Stream``
+            header of an earlier response); if it is not this replay's stream,
+            ``after`` is ignored and the stream resumes at ``from``
+        from: Optional time (timestamp string or epoch ns) to resume at
+            without a sequence number; default the last reset or lap
+    """
+    try:
+        start_ns = parse_bound(start) if start else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    state = simulation
+    if state.trade_data is None:
+        return Response(content="No trade data loaded", status_code=503)
+    if stream != state.stream:
+        after = state.seq_at(start_ns) - 1
+
+    async def batches():
+        data = state.trade_data
+        seq = after + 1
+        while seq < state.next_seq():
+            row, count = state.seq_rows(seq)
+            count = min(count, replay_config["resume_batch_trades"])
+            # Built off the event loop, so live sends are not held up
+            line = await asyncio.to_thread(
+                lambda: encode_json({"seq": seq, "trades": data.records(row, row + count, seq)}) + "\n")
+            yield line
+            seq += count
+
+    return StreamingResponse(batches(), media_type="application/x-ndjson",
+                             headers={"X-Trade-Stream": state.stream})
 
 # WebSocket endpoint for real-time trade updates
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(websocket: WebSocket, trade_format: str = Query("json", alias="format")):
     await manager.connect(websocket)
+    trade_formats[websocket] = trade_format if trade_format in FORMATS else "json"
+    manager.subscribe(websocket, live_topics(websocket))
     
     # Send confirmation message
-    await websocket.send_text(json.dumps({
+    manager.send(websocket, json.dumps({
         "type": "connection_established",
-        "message": "Connected to trade simulator"
+        "message": "Connected to trade simulator",
+        "stream": simulation.stream,
+        "format": trade_formats[websocket]
     }))
     
     try:
@@ -182,15 +451,71 @@ async def websocket_endpoint(websocket: WebSocket):
             data = await websocket.receive_text()
             try:
                 message = json.loads(data)
-                if message.get("type") == "ping":
-                    await websocket.send_text(json.dumps({"type": "pong"}))
-            except:
-                pass
+            except ValueError:
+                continue
+            if not isinstance(message, dict):
+                continue
+            if message.get("type") == "ping":
+                manager.send(websocket, json.dumps({"type": "pong"}))
+            elif message.get("type") == "replay":
+                manager.send(websocket, encode_json(control_session(websocket, message)))
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        pass
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
+    finally:
+        close_session(websocket)
         manager.disconnect(websocket)
+        trade_formats.pop(websocket, None)
+
+def close_session(websocket: WebSocket):
+    """End a subscriber's replay session, if it has one"""
+    session = sessions.pop(websocket, None)
+    if session is not None:
+        session.is_running = False
+
+def control_session(websocket: WebSocket, message: Dict) -> Dict:
+    """Open or control a subscriber's own replay session
+
+    A session replays the loaded timeline from its own start time, at its
+    own speed, to this subscriber alone; while it is open the subscriber
+    receives no trades from the shared replay. Actions: open (from, to,
+    speed, paused), pause, resume, speed, seek (from) and close.
+    """
+    action = message.get("action")
+    session = sessions.get(websocket)
+    try:
+        if action == "open":
+            if simulation.trade_data is None:
+                raise ValueError("No trade data loaded")
+            speed = parse_speed(message.get("speed", 1.0))
+            start_ns = parse_bound(message["from"]) if message.get("from") is not None else None
+            end_ns = parse_bound(message["to"]) if message.get("to") is not None else None
+            close_session(websocket)
+            session = sessions[websocket] = simulation.fork(start_ns, end_ns)
+            session.apply_speed(speed)
+            manager.unsubscribe(websocket, live_topics(websocket))
+            if not message.get("paused"):
+                start_replay(session, websocket)
+        elif session is None:
+            raise ValueError("No replay session open")
+        elif action == "pause":
+            session.is_running = False
+        elif action == "resume":
+            start_replay(session, websocket)
+        elif action == "speed":
+            session.apply_speed(parse_speed(message.get("speed", 1.0)))
+        elif action == "seek":
+            session.seek(parse_bound(message["from"]) if message.get("from") is not None else None)
+        elif action == "close":
+            close_session(websocket)
+            manager.subscribe(websocket, live_topics(websocket))
+            return {"type": "replay_status", "replay": {"status": "closed"}}
+        else:
+            raise ValueError("Unknown action")
+    except (KeyError, TypeError, ValueError) as e:
+        return {"type": "replay_error", "action": action, "message": str(e)}
+    return {"type": "replay_status", "replay": session.status()}
 
 # Start/stop/configure the simulation
 @app.post("/simulation/control")
@@ -199,9 +524,7 @@ async def control_simulation(request: Request):
     action = data.get("action")
     
     if action == "start":
-        if not simulation.is_running:
-            simulation.is_running = True
-            asyncio.create_task(simulate_real_time_data())
+        if start_replay(simulation):
             return {"status": "started"}
         return {"status": "already_running"}
         
@@ -211,66 +534,142 @@ async def control_simulation(request: Request):
         
     elif action == "reset":
         simulation.is_running = False
-        simulation.last_second_index = 0
+        simulation.jump(0)
         return {"status": "reset"}
         
     elif action == "speed":
+        # A number scales the original timing; "max" sends as fast as consumers accept
+        try:
+            speed = parse_speed(data.get("speed", 1.0))
+        except ValueError as e:
+            return {"status": "error", "message": str(e)}
+        simulation.apply_speed(speed)
+        return {"status": "speed_updated", "speed_factor": speed}
+
+    elif action == "batch_window":
         try:
-            speed = float(data.get("speed", 1.0))
-            if 0.1 <= speed <= 10.0:
-                simulation.speed_factor = speed
-                return {"status": "speed_updated", "speed_factor": speed}
-            return {"status": "error", "message": "Speed must be between 0.1 and 10.0"}
-        except:
-            return {"status": "error", "message": "Invalid speed value"}
+            window_ms = float(data.get("ms", replay_config["batch_window_ms"]))
+        except (TypeError, ValueError):
+            return {"status": "error", "message": "Invalid batch window"}
+        if window_ms < 0:
+            return {"status": "error", "message": "Batch window must not be negative"}
+        replay_config["batch_window_ms"] = window_ms
+        return {"status": "batch_window_updated", "batch_window_ms": window_ms}
     
     return {"status": "error", "message": "Unknown action"}
 
 # Simulate real-time data
-async def simulate_real_time_data():
-    logger.info("Starting trade simulation")
+batch_ids = itertools.count(1)
+
+def encode_trades(state: SimulationState, start: int, stop: int, message: Dict, trade_format: str):
+    """A trade message for rows ``start:stop``: JSON text, or a binary frame"""
+    data = state.trade_data
+    if trade_format == "binary":
+        return encode_trade_frame(data.trade_columns(start, stop, state.row_seq(start)), message)
+    return encode_json({"timestamp": isoformat_ns(data.timestamp(start)), **message,
+                        "trades": data.records(start, stop, state.row_seq(start))})
+
+async def send_trades(state: SimulationState, start: int, stop: int, due: Optional[float] = None,
+                      websocket: Optional[WebSocket] = None):
+    """Send trades ``start:stop`` of a replay as one message
+
+    The shared replay broadcasts to the live subscribers, a session sends to
+    its ``websocket`` only. Messages carry a batch id, the wall-clock time
+    they were emitted at and how late that was against ``due`` (monotonic),
+    so the server can trace where latency is spent downstream. Each is
+    encoded once per format its recipients take.
+    """
+    emitted = time.monotonic()
+    message = {
+        "batch_id": next(batch_ids),
+        "stream": state.stream,  # what the trades' sequence numbers count
+        "emitted_at": time.time(),
+        "scheduling_lag": max(0.0, emitted - due) if due is not None else 0.0,
+    }
+    if websocket is None:
+        for trade_format in FORMATS:
+            topic = f"{LIVE_TOPIC}.{trade_format}"
+            if manager.subscribers.get(topic):
+                await manager.broadcast_text(encode_trades(state, start, stop, message, trade_format), topic)
+    else:
+        manager.send(websocket, encode_trades(state, start, stop, message, trade_formats.get(websocket, "json")))
+    TRADES_SENT.inc(stop - start)
+    REPLAY_MESSAGES.inc()
+
+async def simulate_real_time_data(state: SimulationState = simulation, websocket: Optional[WebSocket] = None):
+    """Replay trades at their original offsets, scaled by the speed factor
+
+    Send times are computed from a monotonic anchor rather than by adding up
+    sleeps, so scheduling and broadcast latency never accumulate into drift.
+    Each wake-up sends everything that has fallen due, and sleeps are at
+    least one batch window long, which bounds the message rate at high
+    speeds. In max-speed mode timestamps are ignored and the loop waits for
+    consumer queues to drain instead.
+
+    ``state`` is the shared replay by default, broadcast to the live
+    subscribers; a subscriber's own session passes its ``websocket``.
+    """
+    name = "Trade simulation" if websocket is None else "Replay session"
+    logger.info(f"Starting {name.lower()}")
+    state.anchor(time.monotonic())
     
-    while simulation.is_running:
-        current_index = simulation.last_second_index
+    while state.is_running:
+        data = state.trade_data
+        total = state.end_position()
+        position = state.position
         
-        if current_index >= len(simulation.all_seconds):
+        if position >= total:
+            if not state.repeat:
+                logger.info(f"End of {name.lower()} range reached")
+                state.is_running = False
+                manager.send(websocket, encode_json({"type": "replay_status", "replay": state.status()}))
+                break
             logger.info("End of trade data reached, resetting simulation")
-            simulation.last_second_index = 0
+            state.jump(state.start)
+            state.anchor(time.monotonic())
             continue
         
-        # Get trades for current second
-        current_trades = simulation.get_trades_for_second(current_index)
+        max_batch = replay_config["max_batch_trades"]
+        if state.unthrottled:
+            if websocket is None and not manager.subscribers.get(LIVE_TOPIC):
+                await asyncio.sleep(replay_config["max_wait_seconds"])
+                continue
+            await manager.wait_writable(LIVE_TOPIC, websocket)
+            if not state.is_running:
+                break
+            stop = min(state.position + max_batch, total)
+            await send_trades(state, state.position, stop, websocket=websocket)
+            state.position = stop
+            state.anchor(time.monotonic())
+            await asyncio.sleep(0)
+            continue
         
-        if current_trades:
-            # Broadcast to all connected clients
-            await manager.broadcast(current_trades)
-            
-        # Increment to next second
-        simulation.last_second_index += 1
+        # Send everything that has fallen due, in bounded chunks. The next
+        # session (e.g. the next daily file) starts right away, not after the gap
+        now = time.monotonic()
+        if data.is_session_start(position) and state.data_clock(now) < data.timestamp(position):
+            state.anchor(now)
+        due = min(data.search(state.data_clock(now), side='right'), total)
+        while position < due:
+            stop = min(position + max_batch, due)
+            await send_trades(state, position, stop, state.due_time(position), websocket)
+            position = stop
+        state.position = position
         
-        # Sleep to simulate real-time (adjusted by speed factor)
-        sleep_time = 1.0 / simulation.speed_factor
-        await asyncio.sleep(sleep_time)
+        # Sleep until the next trade is due, but at least one batch window
+        if position < total:
+            delay = max(state.due_time(position) - time.monotonic(), replay_config["batch_window_ms"] / 1000.0)
+            await asyncio.sleep(min(delay, replay_config["max_wait_seconds"]))
     
-    logger.info("Trade simulation stopped")
+    logger.info(f"{name} stopped")
 
 # Get current simulation status
 @app.get("/simulation/status")
 async def get_simulation_status():
-    if simulation.trade_data is None:
-        return {"status": "not_initialized"}
-        
-    current_second = None
-    if 0 <= simulation.last_second_index < len(simulation.all_seconds):
-        current_second = simulation.all_seconds[simulation.last_second_index].isoformat()
-        
-    return {
-        "status": "running" if simulation.is_running else "stopped",
-        "total_seconds": len(simulation.all_seconds),
-        "current_second_index": simulation.last_second_index,
-        "current_second": current_second,
-        "speed_factor": simulation.speed_factor
-    }
+    status = simulation.status()
+    if simulation.trade_data is not None:
+        status["replay_sessions"] = len(sessions)
+    return status
 
 # Run the simulator with auto-reload disabled for production use
 if __name__ == "__main__":
@@ -0,0 +1,75 @@
+# test_bars.py
+# Bars at every resolution, fed per trade or rolled up, against a pandas recomputation.
+
+import pandas as pd
+import pytest
+
+from bars import RESOLUTIONS, BarSet
+from processor import TradeProcessor
+from test_processor import START, ingest_in_batches, random_trades, reference_bars
+from timeparse import NS_PER_MINUTE, NS_PER_SECOND
+
+def reference(trades, resolution):
+    """Fed bars from the trades in arrival order; rolled-up bars from their source bars in time order"""
+    width, source = RESOLUTIONS[resolution]
+    if source is None:
+        return reference_bars(trades, width)
+    fine = reference(trades, source)
+    fine['notional'] = fine['vwap'] * fine['volume']
+    grouped = fine.groupby(fine.index - fine.index % width)
+    return pd.DataFrame({
+        'open_price': grouped['open_price'].first(), 'close_price': grouped['close_price'].last(),
+        'max_price': grouped['max_price'].max(), 'min_price': grouped['min_price'].min(),
+        'volume': grouped['volume'].sum(), 'trade_count': grouped['trade_count'].sum(),
+        'vwap': grouped['notional'].sum() / grouped['volume'].sum(),
+    })
+
+@pytest.mark.parametrize("resolution", list(RESOLUTIONS))
+def test_every_resolution_matches_a_full_recomputation(resolution):
+    trades = random_trades(4000, seed=4)
+    processor = TradeProcessor()
+    ingest_in_batches(processor, trades, seed=4)
+    expected = reference(trades, resolution)
+    series = processor.bars[resolution]
+    assert series.keys == expected.index.tolist()
+    bars = [series.bars[key] for key in series.keys]
+    for name in ('open_price', 'close_price', 'max_price', 'min_price', 'volume', 'trade_count'):
+        assert [getattr(bar, name) for bar in bars] == expected[name].tolist(), name
+    assert [bar.vwap for bar in bars] == pytest.approx(expected['vwap'].tolist())
+
+def test_late_trade_marks_only_the_buckets_it_changes():
+    bars = BarSet()
+    for i in range(3 * 60):  # three minutes, one trade per second
+        for bar_for in bars.fed_lookups():
+            bar_for(START + i * NS_PER_SECOND, 100.0).add(100.0, 1)
+    bars.finish_batch()
+    bars.collect_changes()
+
+    for bar_for in bars.fed_lookups():
+        bar_for(START + 70 * NS_PER_SECOND + 5, 90.0).add(90.0, 4)
+    dirty = bars.finish_batch()
+    assert (dirty['1s'], dirty['5s'], dirty['1m'], dirty['5m'], dirty['1h']) == (70, 14, 1, 0, 0)
+    changes = bars.collect_changes()
+    assert changes['5s']['start'] == 14
+    assert changes['5s']['bars'][0]['min_price'] == 90.0 and changes['5s']['bars'][0]['volume'] == 9
+    assert changes['5m']['bars'][0]['volume'] == 180 + 4
+    assert bars.collect_changes() == {}
+
+def test_bar_queries_by_time_range_and_limit():
+    processor = TradeProcessor()
+    processor.ingest([{'timestamp_ns': START + i * 30 * NS_PER_SECOND, 'price': 100.0 + i, 'quantity': 1}
+                      for i in range(40)])  # twenty minutes
+    result = processor.get_bars('5m', START + 5 * NS_PER_MINUTE, START + 15 * NS_PER_MINUTE)
+    assert result['start'] == 1
+    assert [bar['volume'] for bar in result['bars']] == [10, 10]
+    latest = processor.get_bars('1m', limit=3)
+    assert latest['start'] == 17 and len(latest['bars']) == 3
+    assert latest['bars'][-1]['close_price'] == 139.0
+
+def test_checkpoint_columns_round_trip():
+    processor = TradeProcessor()
+    ingest_in_batches(processor, random_trades(1000, seed=5), seed=5)
+    copy = BarSet()
+    copy.load_columns(processor.bars.to_columns())
+    for resolution in RESOLUTIONS:
+        assert copy[resolution].records(0) == processor.bars[resolution].records(0)
@@ -0,0 +1,131 @@
+# test_connections.py
+# Per-client outbound queues: slow-consumer policies, topics and producer backpressure.
+
+import asyncio
+import logging
+
+import pytest
+
+from connections import ConnectionManager
+
+logger = logging.getLogger("test")
+
+class FakeSocket:
+    """Records sent messages; a blocked socket holds every send until released"""
+    def __init__(self, blocked=False, fail=False):
+        self.sent = []
+        self.closed_with = None
+        self.fail = fail
+        self.open = asyncio.Event()
+        if not blocked:
+            self.open.set()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        await self.open.wait()
+        if self.fail:
+            raise ConnectionResetError("gone")
+        self.sent.append(message)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def test_drop_policy_keeps_the_newest_messages_of_a_slow_client():
+    async def scenario():
+        manager = ConnectionManager(logger, queue_size=4, slow_consumer_policy="drop")
+        fast, slow = FakeSocket(), FakeSocket(blocked=True)
+        await manager.connect(fast)
+        await manager.connect(slow)
+        for n in range(10):
+            await manager.broadcast_text(str(n))
+            await settle()
+        assert fast.sent == [str(n) for n in range(10)]
+        slow.open.set()
+        await settle()
+        return slow, manager.active_connections[slow]
+
+    slow, client = run(scenario())
+    # The writer had already taken "0" when the socket blocked; the rest are the newest four
+    assert slow.sent == ["0", "6", "7", "8", "9"]
+    assert client.dropped == 5
+
+def test_disconnect_policy_closes_only_the_slow_client():
+    async def scenario():
+        manager = ConnectionManager(logger, queue_size=4, slow_consumer_policy="disconnect")
+        fast, slow = FakeSocket(), FakeSocket(blocked=True)
+        await manager.connect(fast)
+        await manager.connect(slow)
+        for n in range(10):
+            await manager.broadcast_text(str(n))
+            await settle()
+        return manager, fast, slow
+
+    manager, fast, slow = run(scenario())
+    assert slow not in manager.active_connections
+    assert slow.closed_with == 1013
+    assert fast in manager.active_connections and len(fast.sent) == 10
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        ConnectionManager(logger, slow_consumer_policy="block")
+
+def test_topic_broadcasts_reach_only_subscribers():
+    async def scenario():
+        manager = ConnectionManager(logger)
+        aapl, msft = FakeSocket(), FakeSocket()
+        await manager.connect(aapl)
+        await manager.connect(msft)
+        assert manager.subscribe(aapl, ["AAPL"]) == {"AAPL"}
+        assert manager.subscribe(aapl, ["AAPL"]) == set()
+        manager.subscribe(msft, ["MSFT"])
+        await manager.broadcast_text("a", "AAPL")
+        await manager.broadcast_text("m", "MSFT")
+        await manager.broadcast_text("all")
+        manager.unsubscribe(aapl, ["AAPL"])
+        await manager.broadcast_text("a2", "AAPL")
+        manager.send(msft, "direct")
+        await settle()
+        manager.disconnect(msft)
+        assert "MSFT" not in manager.subscribers
+        return aapl, msft
+
+    aapl, msft = run(scenario())
+    assert aapl.sent == ["a", "all"]
+    assert msft.sent == ["m", "all", "direct"]
+
+def test_producers_wait_until_a_queue_is_half_drained():
+    async def scenario():
+        manager = ConnectionManager(logger, queue_size=8)
+        slow = FakeSocket(blocked=True)
+        await manager.connect(slow)
+        for n in range(6):
+            await manager.broadcast_text(str(n))
+        waiter = asyncio.create_task(manager.wait_writable())
+        await settle()
+        assert not waiter.done()
+        slow.open.set()
+        await asyncio.wait_for(waiter, 1)
+        return slow
+
+    assert run(scenario()).sent == [str(n) for n in range(6)]
+
+def test_failed_send_disconnects_the_client():
+    async def scenario():
+        manager = ConnectionManager(logger)
+        broken = FakeSocket(fail=True)
+        await manager.connect(broken)
+        await manager.broadcast_text("x")
+        await settle()
+        return manager, broken
+
+    manager, broken = run(scenario())
+    assert broken not in manager.active_connections
@@ -0,0 +1,57 @@
+# test_deltas.py
+# Sequenced updates: replay from the history, resync by snapshot, and deltas that rebuild the state.
+
+import json
+
+from processor import TradeProcessor
+from server import UpdateStream
+from test_trade_log import trades
+
+def published(stream, count):
+    return [stream.publish({'type': 'delta', 'n': n}) for n in range(count)]
+
+def test_updates_are_numbered_and_replayed_after_a_seq():
+    stream = UpdateStream(history_size=10)
+    messages = published(stream, 5)
+    assert [json.loads(message)['seq'] for message in messages] == [1, 2, 3, 4, 5]
+    assert stream.since(2) == messages[2:]
+    assert stream.since(5) == []
+
+def test_updates_no_longer_retained_need_a_snapshot():
+    stream = UpdateStream(history_size=3)
+    messages = published(stream, 6)
+    assert stream.since(2) is None
+    assert stream.since(3) == messages[3:]
+
+def test_seq_ahead_of_the_stream_needs_a_snapshot():
+    stream = UpdateStream()
+    published(stream, 3)
+    assert stream.since(500) is None  # e.g. a client that saw the stream before a restart
+    assert UpdateStream().since(1) is None
+
+def apply_delta(state, delta):
+    """What the dashboard does with a delta: bars from ``start`` and points from ``from`` replaced"""
+    state['minute_aggregates'][delta['start']:] = delta['minute_aggregates']
+    for group in ('moving_averages', 'macd'):
+        series = delta[group]
+        for name, values in series.items():
+            if name == 'from':
+                continue
+            if 'values' in values:  # moving averages carry their own 'from'
+                first, values = values['from'], values['values']
+            else:
+                first = series['from']
+            kept = {key: value for key, value in state[group].get(name, {}).items() if int(key) < first}
+            state[group][name] = {**kept, **values}
+    state['summary'] = delta['summary']
+
+def test_deltas_rebuild_the_full_snapshot():
+    processor = TradeProcessor()
+    processor.ingest(trades(0, 100))
+    state = processor.get_snapshot()
+    processor.collect_delta()
+    for first in range(100, 400, 37):
+        processor.ingest(trades(first, 37))
+        apply_delta(state, processor.collect_delta())
+        assert state == processor.get_snapshot()
+    assert processor.collect_delta() is None  # nothing changed since
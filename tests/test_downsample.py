@@ -0,0 +1,59 @@
+# test_downsample.py
+# Min/max-per-bucket downsampling and downsampled chart snapshots.
+
+import numpy as np
+import pytest
+
+from downsample import minmax_indices, shared_indices
+from processor import TradeProcessor
+from test_trade_log import trades
+
+def test_short_series_are_kept_whole():
+    assert minmax_indices(np.arange(10.0), 10).tolist() == list(range(10))
+
+@pytest.mark.parametrize("max_points", [4, 5, 64, 100])
+def test_at_most_max_points_ascending_with_both_ends(max_points):
+    values = np.random.default_rng(0).normal(size=1000).cumsum()
+    indices = minmax_indices(values, max_points)
+    assert len(indices) <= max_points
+    assert (np.diff(indices) > 0).all()
+    assert indices[0] == 0 and indices[-1] == 999
+
+def test_spikes_survive_that_striding_would_skip():
+    values = np.zeros(1000)
+    values[333], values[667] = 50.0, -50.0
+    indices = minmax_indices(values, 16)
+    assert 333 in indices and 667 in indices
+
+def test_every_bucket_keeps_its_minimum_and_maximum():
+    values = np.random.default_rng(1).normal(size=402)
+    indices = set(minmax_indices(values, 10).tolist())
+    inner = values[1:-1]
+    for bucket in np.array_split(np.arange(400), 4):
+        assert int(bucket[np.argmin(inner[bucket])]) + 1 in indices
+        assert int(bucket[np.argmax(inner[bucket])]) + 1 in indices
+
+def test_nans_are_not_picked_over_numbers():
+    values = np.full(100, np.nan)
+    values[[0, 40, 60, 99]] = [1.0, 5.0, -5.0, 2.0]
+    assert minmax_indices(values, 4).tolist() == [0, 40, 60, 99]
+
+def test_shared_indices_cover_each_series_within_the_budget():
+    rng = np.random.default_rng(2)
+    closes, volumes = rng.normal(size=500).cumsum(), rng.integers(0, 100, 500).astype(float)
+    volumes[123] = 10_000
+    indices = shared_indices([closes, volumes], 64)
+    assert len(indices) <= 64
+    assert 123 in indices
+    assert int(np.argmax(closes)) in indices
+
+def test_downsampled_snapshot_lists_the_bars_it_keeps():
+    processor = TradeProcessor()
+    processor.ingest(trades(0, 2000))  # 500 minute bars
+    full = processor.get_snapshot()
+    snapshot = processor.get_snapshot(max_points=64)
+    assert snapshot['downsampled_from'] == len(full['minute_aggregates']) == 500
+    assert len(snapshot['index']) == len(snapshot['minute_aggregates']) <= 64
+    assert [full['minute_aggregates'][i] for i in snapshot['index']] == snapshot['minute_aggregates']
+    macd = snapshot['macd']['histogram']
+    assert all(full['macd']['histogram'][key] == value for key, value in macd.items())
@@ -0,0 +1,101 @@
+# test_fanout.py
+# Relaying browsers through a fan-out worker link: framing, one publish per link, and cleanup.
+
+import asyncio
+import logging
+
+from fastapi import WebSocketDisconnect
+
+from connections import ConnectionManager
+from fanout import encode_frame, read_frame, serve_relay
+
+logger = logging.getLogger("test")
+
+def test_frames_round_trip_through_a_stream():
+    async def scenario():
+        reader = asyncio.StreamReader()
+        reader.feed_data(encode_frame({"op": "publish", "topic": "AAPL"}, '{"price": "é"}'))
+        reader.feed_data(encode_frame({"op": "close", "client": 3}))
+        return await read_frame(reader), await read_frame(reader)
+
+    assert asyncio.run(scenario()) == (({"op": "publish", "topic": "AAPL"}, '{"price": "é"}'),
+                                       ({"op": "close", "client": 3}, ""))
+
+async def serve_browser(manager, websocket):
+    """The ingest endpoint in miniature: subscribe to the requested symbol, echo messages"""
+    await manager.connect(websocket)
+    manager.subscribe(websocket, [websocket.query_params["symbol"]])
+    try:
+        while True:
+            manager.send(websocket, "echo " + await websocket.receive_text())
+    except WebSocketDisconnect:
+        manager.disconnect(websocket)
+
+async def frames(reader, count):
+    return [await asyncio.wait_for(read_frame(reader), 1) for _ in range(count)]
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+def test_relayed_browsers_share_one_publish_per_link(tmp_path):
+    async def scenario():
+        manager = ConnectionManager(logger)
+        path = str(tmp_path / "relay.sock")
+        server = await serve_relay(manager, path, lambda websocket: serve_browser(manager, websocket))
+        reader, writer = await asyncio.open_unix_connection(path)
+        for client_id, symbol in ((1, "AAPL"), (2, "AAPL"), (3, "MSFT")):
+            writer.write(encode_frame({"op": "connect", "client": client_id, "query": {"symbol": symbol}}))
+        subscribed = await frames(reader, 3)
+
+        await manager.broadcast_text("aapl update", "AAPL")
+        await manager.broadcast_text("everyone")
+        writer.write(encode_frame({"op": "message", "client": 2}, "hello"))
+        relayed = await frames(reader, 3)
+
+        writer.write(encode_frame({"op": "disconnect", "client": 1}))
+        writer.write(encode_frame({"op": "disconnect", "client": 2}))
+        await settle()
+        await manager.broadcast_text("nobody", "AAPL")
+        await manager.broadcast_text("msft update", "MSFT")
+        after = await frames(reader, 5)
+
+        writer.close()
+        server.close()
+        return manager, subscribed, relayed, after
+
+    manager, subscribed, relayed, after = asyncio.run(scenario())
+    assert [header for header, _ in subscribed] == [
+        {"op": "subscribe", "client": 1, "topics": ["AAPL"]},
+        {"op": "subscribe", "client": 2, "topics": ["AAPL"]},
+        {"op": "subscribe", "client": 3, "topics": ["MSFT"]}]
+    assert relayed == [({"op": "publish", "topic": "AAPL"}, "aapl update"),
+                       ({"op": "publish", "topic": None}, "everyone"),
+                       ({"op": "send", "client": 2}, "echo hello")]
+    assert [header for header, _ in after] == [
+        {"op": "unsubscribe", "client": 1, "topics": ["AAPL"]},
+        {"op": "close", "client": 1},
+        {"op": "unsubscribe", "client": 2, "topics": ["AAPL"]},
+        {"op": "close", "client": 2},
+        {"op": "publish", "topic": "MSFT"}]
+    assert after[-1][1] == "msft update"
+    assert "AAPL" not in manager.subscribers
+
+def test_lost_link_disconnects_its_browsers(tmp_path):
+    async def scenario():
+        manager = ConnectionManager(logger)
+        path = str(tmp_path / "relay.sock")
+        server = await serve_relay(manager, path, lambda websocket: serve_browser(manager, websocket))
+        reader, writer = await asyncio.open_unix_connection(path)
+        writer.write(encode_frame({"op": "connect", "client": 1, "query": {"symbol": "AAPL"}}))
+        await frames(reader, 1)
+        assert len(manager.relays) == 1 and len(manager.active_connections) == 1
+        writer.close()
+        await settle()
+        server.close()
+        return manager
+
+    manager = asyncio.run(scenario())
+    assert manager.relays == {}
+    assert manager.active_connections == {}
+    assert manager.subscribers == {}
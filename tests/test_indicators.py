@@ -0,0 +1,83 @@
+# test_indicators.py
+# Incremental indicator updates against the batch path and plain rolling references.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from indicators import INDICATORS, BarInputs, BollingerBands, Indicator, NS_PER_DAY, SMA
+from timeparse import NS_PER_MINUTE
+
+def inputs(count, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100.0 + np.cumsum(rng.normal(0, 0.5, count))
+    bars = BarInputs()
+    # Two sessions, so session-based indicators restart once
+    bars.start_ns = [NS_PER_DAY - 40 * NS_PER_MINUTE + i * NS_PER_MINUTE for i in range(count)]
+    bars.close = close.tolist()
+    bars.high = (close + rng.uniform(0, 1, count)).tolist()
+    bars.low = (close - rng.uniform(0, 1, count)).tolist()
+    bars.volume = rng.integers(0, 500, count).tolist()
+    bars.notional = (np.array(bars.volume) * close).tolist()
+    return bars
+
+def make(cls):
+    return cls(**cls.PARAMS)
+
+def stepped(cls, bars):
+    """An indicator advanced one bar at a time, as in steady state"""
+    indicator = make(cls)
+    for i in range(len(bars)):
+        indicator.step(bars, i)
+    return indicator
+
+def assert_columns_equal(actual, expected):
+    for name, values in expected.columns.items():
+        assert len(actual.columns[name]) == len(values), name
+        for a, b in zip(actual.columns[name], values):
+            assert (a is None) == (b is None), name
+            if a is not None:
+                assert a == pytest.approx(b, rel=1e-9, abs=1e-9), name
+
+@pytest.mark.parametrize("name", sorted(INDICATORS))
+def test_stepping_every_bar_matches_the_batch_path(name):
+    bars = inputs(200)
+    batch = make(INDICATORS[name])
+    batch.backfill(bars)
+    assert_columns_equal(stepped(INDICATORS[name], bars), batch)
+
+@pytest.mark.parametrize("name", sorted(INDICATORS))
+def test_recomputing_changed_bars_matches_a_fresh_backfill(name):
+    bars = inputs(150)
+    indicator = make(INDICATORS[name])
+    indicator.backfill(bars)
+    changed = inputs(150, seed=1)
+    for column in BarInputs.FIELDS:  # the last 30 bars change, e.g. late trades
+        getattr(bars, column)[120:] = getattr(changed, column)[120:]
+    indicator.update(bars, 120)
+    fresh = make(INDICATORS[name])
+    fresh.backfill(bars)
+    assert_columns_equal(indicator, fresh)
+
+def test_moving_average_and_bands_match_pandas_rolling():
+    bars = inputs(300)
+    close = pd.Series(bars.close)
+    sma = stepped(SMA, bars)
+    bands = stepped(BollingerBands, bars)
+    mean = close.rolling(20).mean()
+    std = close.rolling(20).std(ddof=0)
+    for i in range(19, 300):
+        assert sma.columns['value'][i] == pytest.approx(mean[i], rel=1e-12)
+        assert bands.columns['upper'][i] == pytest.approx(mean[i] + 2 * std[i], rel=1e-12)
+        assert bands.columns['lower'][i] == pytest.approx(mean[i] - 2 * std[i], rel=1e-12)
+    assert sma.columns['value'][:19] == [None] * 19
+
+def test_flat_prices_have_zero_width_bands():
+    bars = inputs(40)
+    bars.close = [101.25] * 40
+    bands = stepped(BollingerBands, bars)
+    assert bands.columns['upper'][-1] == bands.columns['lower'][-1] == pytest.approx(101.25)
+
+def test_indicator_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        Indicator()
@@ -0,0 +1,70 @@
+# test_metrics.py
+# Metrics registry: exposition text, scrape-time gauges and states merged from worker processes.
+
+import asyncio
+
+import pytest
+
+from metrics import Counter, Registry, merge_states
+
+def render(registry, extra_states=None):
+    return asyncio.run(registry.render(extra_states)).splitlines()
+
+def test_counters_and_histograms_render_in_exposition_format():
+    registry = Registry()
+    registry.counter("trades_total", "Trades ingested").inc(3)
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 7.0):
+        latency.observe(value)
+    assert render(registry) == [
+        "# HELP trades_total Trades ingested", "# TYPE trades_total counter", "trades_total 3",
+        "# HELP latency_seconds Latency", "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 2', 'latency_seconds_bucket{le="1.0"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4', "latency_seconds_sum 7.65", "latency_seconds_count 4"]
+
+def test_gauges_are_computed_when_scraped():
+    registry = Registry()
+    queued = [1, 2]
+
+    async def depth():
+        return len(queued)
+
+    registry.gauge("queued", "Queued messages", depth)
+    registry.gauge("per_symbol", "Trades per symbol", lambda: {"MSFT": 2, 'A"B': 1}, label="symbol")
+    registry.gauge("lag", "Lag").set(0.5)
+    queued.append(3)
+    lines = render(registry)
+    assert "queued 3" in lines and "lag 0.5" in lines
+    assert lines[lines.index("# TYPE per_symbol gauge") + 1:][:2] == [
+        'per_symbol{symbol="A\\"B"} 1', 'per_symbol{symbol="MSFT"} 2']
+
+def test_registering_a_name_again_returns_the_same_metric():
+    registry = Registry()
+    counter = registry.counter("sent_total", "Messages sent")
+    assert registry.counter("sent_total", "Messages sent") is counter
+    assert isinstance(counter, Counter)
+    with pytest.raises(ValueError):
+        registry.gauge("sent_total", "Messages sent")
+
+def test_worker_states_are_summed_into_the_rendered_values():
+    def worker(trades, observations):
+        registry = Registry()
+        registry.counter("trades_total", "Trades").inc(trades)
+        latency = registry.histogram("latency_seconds", "Latency", buckets=(1.0,))
+        for value in observations:
+            latency.observe(value)
+        registry.gauge("ignored", "Gauges stay local").set(9)
+        return registry.states()
+
+    states = [worker(2, [0.5]), worker(5, [2.0, 0.25])]
+    assert "ignored" not in states[0]
+    merged = merge_states(states)
+    assert merged == {"trades_total": 7, "latency_seconds": ([2, 1], 2.75)}
+    assert states[0]["latency_seconds"] == ([1, 0], 0.5)  # inputs are left as they were
+
+    local = Registry()
+    local.counter("trades_total", "Trades").inc(1)
+    local.histogram("latency_seconds", "Latency", buckets=(1.0,)).observe(0.1)
+    lines = render(local, merged)
+    assert "trades_total 8" in lines
+    assert 'latency_seconds_bucket{le="1.0"} 3' in lines and "latency_seconds_count 4" in lines
@@ -0,0 +1,113 @@
+# test_processor.py
+# Minute bars, day statistics and dashboard indicators built incrementally, against pandas over all trades.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from processor import TradeProcessor
+from timeparse import NS_PER_MINUTE, isoformat_ns
+
+START = 1_593_576_000_000_000_000  # 2020-07-01 04:00
+
+def random_trades(count, seed=0, late_every=50):
+    """Trades over about two hours in arrival order; every ``late_every``-th arrives minutes late"""
+    rng = np.random.default_rng(seed)
+    timestamps = START + np.sort(rng.integers(0, 120 * NS_PER_MINUTE, count))
+    late = np.arange(count) % late_every == late_every - 1
+    timestamps[late] -= rng.integers(1, 5, late.sum()) * NS_PER_MINUTE
+    prices = np.round(100 + rng.normal(0, 1, count).cumsum() * 0.1, 2)
+    quantities = rng.integers(1, 1000, count)
+    return [{'timestamp_ns': int(ts), 'price': float(price), 'quantity': int(qty), 'venue': 'NASDAQ'}
+            for ts, price, qty in zip(timestamps, prices, quantities)]
+
+def ingest_in_batches(processor, trades, seed=0):
+    rng = np.random.default_rng(seed)
+    first = 0
+    while first < len(trades):
+        count = int(rng.integers(1, 200))
+        processor.ingest(trades[first:first + count])
+        first += count
+
+def reference_bars(trades, width=NS_PER_MINUTE):
+    frame = pd.DataFrame(trades)
+    frame['bucket'] = frame['timestamp_ns'] - frame['timestamp_ns'] % width
+    frame['notional'] = frame['price'] * frame['quantity']
+    grouped = frame.groupby('bucket', sort=True)  # keeps arrival order within a bucket
+    return pd.DataFrame({
+        'open_price': grouped['price'].first(), 'close_price': grouped['price'].last(),
+        'max_price': grouped['price'].max(), 'min_price': grouped['price'].min(),
+        'volume': grouped['quantity'].sum(), 'trade_count': grouped['price'].size(),
+        'vwap': grouped['notional'].sum() / grouped['quantity'].sum(),
+    })
+
+def test_minute_bars_match_a_full_recomputation():
+    trades = random_trades(5000)
+    processor = TradeProcessor()
+    ingest_in_batches(processor, trades)
+    expected = reference_bars(trades)
+    bars = processor.get_minute_aggregates()
+    assert processor.minute_keys == expected.index.tolist()
+    assert [bar['minute'] for bar in bars] == [isoformat_ns(key) for key in expected.index]
+    for name in ('open_price', 'close_price', 'max_price', 'min_price', 'volume', 'trade_count'):
+        assert [bar[name] for bar in bars] == expected[name].tolist(), name
+    assert [bar['vwap'] for bar in bars] == pytest.approx(expected['vwap'].tolist())
+
+def test_day_statistics_follow_every_trade():
+    trades = random_trades(2000, seed=1)
+    processor = TradeProcessor()
+    ingest_in_batches(processor, trades, seed=1)
+    prices = [trade['price'] for trade in trades]
+    summary = processor.get_summary()
+    assert (summary['opening_price'], summary['last_price']) == (prices[0], prices[-1])
+    assert (summary['day_high'], summary['day_low']) == (max(prices), min(prices))
+    assert summary['total_volume'] == sum(trade['quantity'] for trade in trades)
+    assert summary['trade_count'] == 2000
+
+def test_malformed_trades_are_skipped_and_not_counted():
+    processor = TradeProcessor()
+    processor.ingest([{'timestamp_ns': START, 'price': 100.0, 'quantity': 5},
+                      {'timestamp_ns': START + 1, 'price': 'n/a', 'quantity': 5},
+                      {'datetime': 'garbage', 'price': 101.0, 'quantity': 5},
+                      {'datetime': '2020-07-01 04:00:30:000', 'price': 102.0, 'quantity': 1}])
+    assert processor.get_summary()['trade_count'] == 2
+    assert processor.get_minute_aggregates()[0]['volume'] == 6
+    assert len(processor.trades) == 2
+
+def test_late_trade_updates_its_own_minute_only():
+    processor = TradeProcessor()
+    processor.ingest([{'timestamp_ns': START + i * NS_PER_MINUTE, 'price': 100.0 + i, 'quantity': 1}
+                      for i in range(5)])
+    processor.collect_delta()
+    processor.ingest([{'timestamp_ns': START + NS_PER_MINUTE + 5, 'price': 90.0, 'quantity': 10}])
+    delta = processor.collect_delta()
+    assert delta['start'] == 1
+    assert delta['minute_aggregates'][0]['min_price'] == 90.0
+    assert delta['minute_aggregates'][0]['volume'] == 11
+    assert len(processor.minute_keys) == 5
+
+def test_moving_averages_and_macd_match_pandas_after_incremental_batches():
+    trades = random_trades(6000, seed=2)
+    processor = TradeProcessor()
+    ingest_in_batches(processor, trades, seed=2)
+    closes = reference_bars(trades)['close_price'].reset_index(drop=True)
+    averages = processor.calculate_moving_averages()
+    for window in TradeProcessor.MA_WINDOWS:
+        expected = closes.rolling(window).mean().dropna().reset_index(drop=True)
+        assert list(averages[f'MA{window}']) == [str(i) for i in range(len(expected))]
+        assert list(averages[f'MA{window}'].values()) == pytest.approx(expected.tolist())
+    fast, slow, signal = TradeProcessor.MACD_PARAMS
+    line = closes.ewm(span=fast, adjust=False).mean() - closes.ewm(span=slow, adjust=False).mean()
+    signal_line = line.ewm(span=signal, adjust=False).mean()
+    macd = processor.calculate_macd()
+    assert list(macd['macd_line'].values()) == pytest.approx(line.tolist())
+    assert list(macd['signal_line'].values()) == pytest.approx(signal_line.tolist())
+    assert list(macd['histogram'].values()) == pytest.approx((line - signal_line).tolist())
+
+def test_indicator_queries_return_only_the_requested_bars():
+    processor = TradeProcessor()
+    ingest_in_batches(processor, random_trades(3000, seed=3), seed=3)
+    full = processor.calculate_macd()
+    part = processor.calculate_macd(first=40, stop=60)
+    assert list(part['histogram']) == [str(i) for i in range(40, 60)]
+    assert all(full['histogram'][key] == value for key, value in part['histogram'].items())
@@ -0,0 +1,105 @@
+# test_replay_cache.py
+# Compiled replay caches (in order or not), merged files and the replay timeline over sessions.
+
+import gc
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import replay_cache
+from replay_cache import load_replay_data, merge_replay_data, open_timeline
+from timeparse import parse_timestamps
+
+def write_csv(path, count, day="2020-07-01", seed=0, shuffle=False, venues=("NASDAQ", "ARCA")):
+    rng = np.random.default_rng(seed)
+    millis = np.sort(rng.integers(0, 600_000, count))  # ten minutes, several trades per second
+    frame = pd.DataFrame({
+        'datetime': [f"{day} 04:{ms // 60000:02d}:{ms // 1000 % 60:02d}:{ms % 1000:03d}" for ms in millis],
+        'price': np.round(100 + rng.normal(0, 1, count), 2),
+        'quantity': rng.integers(1, 500, count),
+        'venue': rng.choice(venues, count),
+    })
+    if shuffle:
+        frame = frame.iloc[rng.permutation(count)]
+    frame.to_csv(path, index=False)
+    return frame
+
+def stable_sorted(frame):
+    timestamps = parse_timestamps(frame['datetime'].to_numpy(dtype=object))
+    order = np.argsort(timestamps, kind='stable')
+    return frame.iloc[order], timestamps[order]
+
+def assert_matches(data, frame, timestamps):
+    assert data.columns["timestamp_ns"].tolist() == timestamps.tolist()
+    assert [value.decode() for value in data.columns["datetime"].tolist()] == frame['datetime'].tolist()
+    assert data.columns["price"].tolist() == frame['price'].tolist()
+    assert [data.venues[code] for code in data.columns["venue"].tolist()] == frame['venue'].tolist()
+    offsets = data.second_offsets
+    for index in range(data.num_seconds):
+        seconds = data.columns["timestamp_ns"][offsets[index]:offsets[index + 1]] // 1_000_000_000
+        assert (seconds * 1_000_000_000 == data.second_starts[index]).all()
+
+def test_in_order_file_compiles_to_the_same_trades(tmp_path):
+    path = str(tmp_path / "AAPL.csv")
+    frame = write_csv(path, 3000)
+    data = load_replay_data(path, "AAPL")
+    assert_matches(data, *stable_sorted(frame))
+    assert data.symbols == ["AAPL"]
+    assert os.path.isdir(path + ".replay")
+
+@pytest.mark.parametrize("chunk_rows", [97, 1000, 10_000])
+def test_out_of_order_file_is_merged_from_sorted_chunks(tmp_path, monkeypatch, chunk_rows):
+    monkeypatch.setattr(replay_cache, "CHUNK_ROWS", chunk_rows)
+    path = str(tmp_path / "AAPL.csv")
+    frame = write_csv(path, 3000, shuffle=True)
+    data = load_replay_data(path, "AAPL")
+    assert_matches(data, *stable_sorted(frame))
+    assert sorted(os.listdir(path + ".replay")) == sorted(
+        [f"{name}.npy" for name in replay_cache.COLUMNS] + ["second_starts.npy", "second_offsets.npy", "meta.json"])
+
+def test_stale_cache_is_recompiled(tmp_path):
+    path = str(tmp_path / "AAPL.csv")
+    write_csv(path, 100)
+    load_replay_data(path, "AAPL")
+    frame = write_csv(path, 200, seed=1)
+    assert_matches(load_replay_data(path, "AAPL"), *stable_sorted(frame))
+
+def test_files_of_one_period_merge_into_one_session(tmp_path, monkeypatch):
+    monkeypatch.setattr(replay_cache, "CHUNK_ROWS", 128)
+    frames = [write_csv(str(tmp_path / "AAPL.csv"), 1500, seed=1),
+              write_csv(str(tmp_path / "MSFT.csv"), 1000, seed=2, venues=("NYSE", "NASDAQ"))]
+    parts = [load_replay_data(str(tmp_path / "AAPL.csv"), "AAPL"),
+             load_replay_data(str(tmp_path / "MSFT.csv"), "MSFT")]
+    merged = merge_replay_data(parts)
+    frame, timestamps = stable_sorted(pd.concat([frames[0].assign(symbol="AAPL"), frames[1].assign(symbol="MSFT")]))
+    assert_matches(merged, frame, timestamps)
+    assert [merged.symbols[code] for code in merged.columns["symbol"].tolist()] == frame['symbol'].tolist()
+    assert isinstance(merged.columns["price"], np.memmap)  # on disk, not in memory
+
+    directory = os.path.dirname(merged.columns["price"].filename)
+    del merged
+    gc.collect()
+    assert not os.path.exists(directory)
+
+def test_timeline_plays_consecutive_days_back_to_back(tmp_path):
+    write_csv(str(tmp_path / "a.csv"), 500)
+    write_csv(str(tmp_path / "b.csv"), 300, day="2020-07-02", seed=1)
+    first = load_replay_data(str(tmp_path / "a.csv"), "AAPL")
+    second = load_replay_data(str(tmp_path / "b.csv"), "AAPL")
+    timeline = open_timeline([second, first])
+    assert len(timeline.sessions) == 2
+    assert len(timeline) == 800
+    assert timeline.is_session_start(500) and not timeline.is_session_start(499)
+
+    records = timeline.records(495, 505, first_seq=1)
+    assert [record['seq'] for record in records] == list(range(1, 11))
+    assert [record['original_datetime'][:10] for record in records] == ["2020-07-01"] * 5 + ["2020-07-02"] * 5
+    columns = timeline.trade_columns(495, 505)
+    assert columns.timestamps.tolist() == [record['timestamp_ns'] for record in records]
+
+    day_two = int(second.columns["timestamp_ns"][0])
+    assert timeline.search(day_two) == 500
+    assert timeline.timestamp(timeline.search(day_two)) == day_two
+    assert timeline.second_offsets[-1] == 800
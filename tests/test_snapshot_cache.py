@@ -0,0 +1,67 @@
+# test_snapshot_cache.py
+# Snapshots encoded once per state version, shared across requests, and revalidated by ETag.
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+from processor import ProcessorPool
+from test_trade_log import trades
+
+@pytest.fixture
+def client(monkeypatch):
+    # A pool without a trade log, and a cache that knows nothing yet
+    monkeypatch.setattr(server, "processors", ProcessorPool(0))
+    monkeypatch.setattr(server, "snapshot_cache", server.SnapshotCache())
+    return TestClient(server.app)  # no startup events: nothing connects to a simulator
+
+def ingest(first, count):
+    asyncio.run(server.processors.ingest({"AAPL": trades(first, count)}))
+
+def test_unchanged_state_revalidates_with_304(client):
+    ingest(0, 100)
+    first = client.get("/data", params={"symbol": "aapl"})
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert client.get("/data", params={"symbol": "AAPL"}).headers["ETag"] == etag
+
+    revalidated = client.get("/data", params={"symbol": "AAPL"}, headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304 and revalidated.content == b""
+    assert client.get("/data", headers={"If-None-Match": f'"other", {etag}'}).status_code == 304
+
+    ingest(100, 10)
+    changed = client.get("/data", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.json()['summary']['trade_count'] == 110
+
+def test_snapshot_is_encoded_once_per_version_and_budget(client):
+    async def scenario():
+        cache = server.SnapshotCache()
+        first = await cache.get("AAPL")
+        again = await cache.get("AAPL")
+        downsampled = await cache.get("AAPL", (None, None, None, None, 64))
+        ranged = await cache.get("AAPL", (None, None, 10, None, None))
+        await server.processors.ingest({"AAPL": trades(1000, 5)})
+        return first, again, downsampled, ranged, await cache.get("AAPL")
+
+    ingest(0, 1000)
+    first, again, downsampled, ranged, after = asyncio.run(scenario())
+    assert again is first
+    assert downsampled is not first and downsampled.etag != first.etag
+    assert ranged.etag != first.etag
+    assert after is not first and after.etag != first.etag
+
+def test_every_query_has_its_own_etag(client):
+    ingest(0, 400)
+    etags = {client.get("/data", params=params).headers["ETag"]
+             for params in ({}, {"limit": 10}, {"since": 5}, {"max_points": 64}, {"symbol": "MSFT"})}
+    assert len(etags) == 5
+
+def test_unknown_symbol_gets_an_empty_snapshot(client):
+    response = client.get("/data", params={"symbol": "NOPE"})
+    assert response.status_code == 200
+    assert response.json()['minute_aggregates'] == []
+    assert "NOPE" not in server.processors.versions
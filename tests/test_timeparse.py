@@ -0,0 +1,72 @@
+# test_timeparse.py
+# Vectorized timestamp parsing and its fallback to per-value parsing.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from processor import batch_timestamps
+from timeparse import parse_timestamp, parse_timestamps
+
+def pandas_ns(value):
+    return pd.Timestamp(value).value
+
+@pytest.mark.parametrize("value, expected", [
+    ("2020-07-01 04:00:00:072", "2020-07-01 04:00:00.072"),
+    ("2020-07-01 04:00:00.072", "2020-07-01 04:00:00.072"),
+    ("2020-07-01T04:00:00.5", "2020-07-01 04:00:00.500"),
+    ("2020-07-01 04:00:00:07", "2020-07-01 04:00:00.070"),
+    ("2020-07-01 04:00:00", "2020-07-01 04:00:00"),
+    ("2020-02-29 23:59:59:999", "2020-02-29 23:59:59.999"),
+])
+def test_fixed_layout_matches_pandas(value, expected):
+    assert parse_timestamp(value) == pandas_ns(expected)
+    assert parse_timestamps([value]).tolist() == [pandas_ns(expected)]
+
+def test_rows_outside_the_layout_fall_back_per_row():
+    values = ["2020-07-01 04:00:00:072",
+              "2020-07-01 04:00:00.123456",  # microseconds: longer than the layout
+              "2020-07-01 04:00:00:1234",  # four fraction digits after ':'
+              "07/01/2020 04:00:01"]
+    assert parse_timestamps(values).tolist() == [
+        pandas_ns("2020-07-01 04:00:00.072"),
+        pandas_ns("2020-07-01 04:00:00.123456"),
+        pandas_ns("2020-07-01 04:00:00.1234"),
+        pandas_ns("2020-07-01 04:00:01"),
+    ]
+
+def test_non_string_columns_are_parsed_value_by_value():
+    timestamp = pd.Timestamp("2020-07-01 04:00:00.072")
+    assert parse_timestamps([timestamp.value, timestamp.to_pydatetime()]).tolist() == [timestamp.value] * 2
+
+@pytest.mark.parametrize("value", [None, float("nan"), "NaT", "", "not a time"])
+def test_missing_or_unparseable_values_raise(value):
+    with pytest.raises(ValueError):
+        parse_timestamp(value)
+    with pytest.raises(ValueError):
+        parse_timestamps(["2020-07-01 04:00:00:072", value])
+
+def test_batch_marks_only_the_unparseable_trades():
+    trades = [{'datetime': "2020-07-01 04:00:00:072"}, {'datetime': None},
+              {'original_datetime': "2020-07-01 04:00:01.500"}, {'datetime': "garbage"}]
+    assert batch_timestamps(trades) == [pandas_ns("2020-07-01 04:00:00.072"), None,
+                                        pandas_ns("2020-07-01 04:00:01.5"), None]
+
+def test_batch_with_epoch_ns_skips_parsing():
+    assert batch_timestamps([{'timestamp_ns': 5}, {'timestamp_ns': 7}]) == [5, 7]
+
+def test_empty_column():
+    assert parse_timestamps([]).dtype == np.int64
+
+@pytest.mark.parametrize("value", [
+    "2020-07-01 04:0a:00:072",  # a letter in a digit field
+    "abcd-ef-gh ij:kl:mn:opq",  # separators in place, no digits at all
+    "2020-13-45 99:99:99:999",  # fields out of range
+    "2021-02-29 00:00:00",  # not a leap year
+    "2020-07-01 24:00:00",
+])
+def test_fixed_layout_lookalikes_raise_on_both_paths(value):
+    with pytest.raises(ValueError):
+        parse_timestamp(value)
+    with pytest.raises(ValueError):
+        parse_timestamps(["2020-07-01 04:00:00:072", value])
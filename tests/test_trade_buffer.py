@@ -0,0 +1,80 @@
+# test_trade_buffer.py
+# Ring buffer retention and range queries, including ranges that wrap around the ring.
+
+import numpy as np
+import pytest
+
+from trade_buffer import TradeRingBuffer
+
+def fill(buffer, timestamps):
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    buffer.extend(timestamps, timestamps * 0.5, timestamps % 100, np.zeros(len(timestamps)))
+
+def test_keeps_only_the_newest_max_trades():
+    buffer = TradeRingBuffer(max_trades=5)
+    fill(buffer, range(3))
+    fill(buffer, range(3, 9))
+    assert len(buffer) == 5
+    assert buffer.slice().timestamp.tolist() == [4, 5, 6, 7, 8]
+    assert buffer.slice().price.tolist() == [2.0, 2.5, 3.0, 3.5, 4.0]
+
+def test_batch_larger_than_capacity_keeps_its_tail():
+    buffer = TradeRingBuffer(max_trades=4)
+    fill(buffer, range(10))
+    assert buffer.slice().timestamp.tolist() == [6, 7, 8, 9]
+
+def test_unwrapped_range_is_a_read_only_view():
+    buffer = TradeRingBuffer(max_trades=10)
+    fill(buffer, range(6))
+    view = buffer.slice(1, 4)
+    assert view.timestamp.tolist() == [1, 2, 3]
+    assert np.shares_memory(view.timestamp, buffer._timestamp)
+    with pytest.raises(ValueError):
+        view.timestamp[0] = 0
+
+def test_wrapped_range_is_copied_in_order():
+    buffer = TradeRingBuffer(max_trades=5)
+    fill(buffer, range(8))  # rows 5, 6, 7 sit at the start of the ring
+    wrapped = buffer.slice()
+    assert wrapped.timestamp.tolist() == [3, 4, 5, 6, 7]
+    assert wrapped.quantity.tolist() == [3, 4, 5, 6, 7]
+    assert not np.shares_memory(wrapped.timestamp, buffer._timestamp)
+    assert buffer.slice(4, 7).timestamp.tolist() == [4, 5, 6]
+    assert buffer.slice(5, 8).timestamp.tolist() == [5, 6, 7]  # entirely after the wrap: a view again
+    assert np.shares_memory(buffer.slice(5, 8).timestamp, buffer._timestamp)
+
+def test_range_bounds_search_both_halves_of_the_ring():
+    buffer = TradeRingBuffer(max_trades=6)
+    fill(buffer, [10, 20, 30, 40])
+    fill(buffer, [50, 60, 70])  # wraps: 70 is stored at index 0
+    assert buffer.slice(35, None).timestamp.tolist() == [40, 50, 60, 70]
+    assert buffer.slice(None, 65).timestamp.tolist() == [20, 30, 40, 50, 60]
+    assert buffer.slice(65, 100).timestamp.tolist() == [70]
+    assert buffer.slice(limit=2).timestamp.tolist() == [60, 70]
+    assert len(buffer.slice(80, 90)) == 0
+
+def test_max_age_drops_trades_older_than_the_newest_minus_the_age():
+    buffer = TradeRingBuffer(max_trades=4, max_age_seconds=2)
+    fill(buffer, [0, 1_000_000_000, 2_000_000_000])
+    fill(buffer, [3_000_000_000, 3_500_000_000])  # wraps
+    assert buffer.slice().timestamp.tolist() == [2_000_000_000, 3_000_000_000, 3_500_000_000]
+
+def test_stores_each_row_once():
+    buffer = TradeRingBuffer(max_trades=1000)
+    assert buffer.capacity_bytes == 1000 * (8 + 8 + 4 + 2)
+    assert buffer.nbytes == 0
+
+def test_nbytes_counts_only_the_retained_trades():
+    buffer = TradeRingBuffer(max_trades=10)
+    fill(buffer, range(4))
+    assert buffer.nbytes == 4 * buffer.row_bytes
+    fill(buffer, range(4, 30))
+    assert buffer.nbytes == buffer.capacity_bytes
+
+def test_columns_round_trip_through_a_wrapped_buffer():
+    buffer = TradeRingBuffer(max_trades=5)
+    fill(buffer, range(8))
+    copy = TradeRingBuffer(max_trades=5)
+    copy.load_columns(buffer.to_columns(), buffer.venues)
+    for name, values in buffer.to_columns().items():
+        assert copy.to_columns()[name].tolist() == values.tolist()
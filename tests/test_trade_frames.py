@@ -0,0 +1,67 @@
+# test_trade_frames.py
+# Binary trade frames: round trips, malformed frames and columnar batches ingested as-is.
+
+import numpy as np
+import pytest
+
+from processor import TradeProcessor
+from trade_frames import TradeColumns, decode_trade_frame, encode_trade_frame
+
+def columns(count=6, first_seq=41):
+    return TradeColumns(np.arange(count, dtype=np.int64) * 1_000_000 + 1_593_576_000_000_000_000,
+                        np.linspace(100.0, 101.0, count), np.arange(1, count + 1, dtype=np.int32),
+                        np.array([0, 1] * (count // 2), dtype=np.int16), np.zeros(count, dtype=np.int16),
+                        ["AAPL", "MSFT"], ["NASDAQ"], first_seq)
+
+def test_frame_round_trips_columns_and_message_fields():
+    trades = columns()
+    message = {"batch_id": 7, "stream": "abc", "emitted_at": 1234.5, "scheduling_lag": 0.25}
+    decoded = decode_trade_frame(encode_trade_frame(trades, message))
+    assert {key: decoded[key] for key in message} == message
+    received = decoded["trades"]
+    for name in ("timestamps", "prices", "quantities", "symbol_codes", "venue_codes"):
+        assert getattr(received, name).tolist() == getattr(trades, name).tolist()
+        assert getattr(received, name).dtype == getattr(trades, name).dtype
+    assert (received.symbols, received.venues, received.first_seq) == (["AAPL", "MSFT"], ["NASDAQ"], 41)
+
+def test_missing_optional_fields_decode_as_none():
+    decoded = decode_trade_frame(encode_trade_frame(columns(first_seq=None), {}))
+    assert (decoded["batch_id"], decoded["stream"], decoded["emitted_at"]) == (None, None, None)
+    assert decoded["trades"].first_seq is None
+
+@pytest.mark.parametrize("cut", [10, 50, -3])
+def test_truncated_frames_are_rejected(cut):
+    frame = encode_trade_frame(columns(), {"stream": "abc"})
+    with pytest.raises(ValueError):
+        decode_trade_frame(frame[:cut])
+
+def test_other_binary_data_is_rejected():
+    with pytest.raises(ValueError):
+        decode_trade_frame(b"X" * 64)
+
+def test_slices_and_symbol_batches_keep_sequence_numbers_and_order():
+    trades = columns()
+    tail = trades[2:]
+    assert (tail.first_seq, tail.timestamps.tolist()) == (43, trades.timestamps[2:].tolist())
+    batches = trades.by_symbol()
+    assert batches["AAPL"].prices.tolist() == trades.prices[0::2].tolist()
+    assert batches["MSFT"].quantities.tolist() == [2, 4, 6]
+
+def test_concatenate_merges_differing_dictionaries():
+    first = columns(2)
+    second = TradeColumns(np.array([5, 6]), np.array([1.0, 2.0]), np.array([1, 1], dtype=np.int32),
+                          np.array([0, 0], dtype=np.int16), np.array([0, 1], dtype=np.int16),
+                          ["MSFT"], ["ARCA", "NASDAQ"])
+    merged = TradeColumns.concatenate([first, second])
+    assert [merged.symbols[code] for code in merged.symbol_codes.tolist()] == ["AAPL", "MSFT", "MSFT", "MSFT"]
+    assert [venue for _, _, _, venue in merged.rows()] == ["NASDAQ", "NASDAQ", "ARCA", "NASDAQ"]
+    assert merged.first_seq == 41
+
+def test_decoded_columns_ingest_like_trade_dicts():
+    decoded = decode_trade_frame(encode_trade_frame(columns(), {}))["trades"].by_symbol()["AAPL"]
+    from_frame, from_dicts = TradeProcessor(), TradeProcessor()
+    from_frame.ingest(decoded)
+    from_dicts.ingest([{'timestamp_ns': ts, 'price': price, 'quantity': quantity, 'venue': venue}
+                       for ts, price, quantity, venue in decoded.rows()])
+    assert from_frame.get_minute_aggregates() == from_dicts.get_minute_aggregates()
+    assert from_frame.get_trades() == from_dicts.get_trades()
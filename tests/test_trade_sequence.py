@@ -0,0 +1,85 @@
+# test_trade_sequence.py
+# Simulator trade numbering: duplicates skipped, streams followed, held trades dropped on resume.
+
+import asyncio
+
+import numpy as np
+
+from server import TradeSequence, drop_held_trades, read_simulator
+from trade_frames import TradeColumns
+
+def numbered(first, last):
+    return [{'seq': seq, 'timestamp_ns': seq * 1000, 'price': 1.0, 'quantity': 1} for seq in range(first, last + 1)]
+
+def columns(first_seq, count):
+    return TradeColumns(np.arange(count, dtype=np.int64), np.ones(count), np.ones(count, dtype=np.int32),
+                        np.zeros(count, dtype=np.int16), np.zeros(count, dtype=np.int16),
+                        ["AAPL"], ["NASDAQ"], first_seq)
+
+def test_overlapping_batches_keep_only_the_new_trades():
+    sequence = TradeSequence()
+    sequence.follow("a")
+    assert [t['seq'] for t in sequence.fresh(numbered(1, 5))] == [1, 2, 3, 4, 5]
+    assert [t['seq'] for t in sequence.fresh(numbered(3, 8))] == [6, 7, 8]
+    assert sequence.fresh(numbered(2, 8)) == []
+    assert sequence.seq == 8
+
+def test_column_batches_are_sliced_by_their_first_sequence_number():
+    sequence = TradeSequence()
+    sequence.fresh(columns(1, 10))
+    fresh = sequence.fresh(columns(6, 10))
+    assert (fresh.first_seq, len(fresh)) == (11, 5)
+
+def test_gaps_are_accepted_and_unnumbered_trades_always_fresh():
+    sequence = TradeSequence()
+    sequence.fresh(numbered(1, 3))
+    assert len(sequence.fresh(numbered(10, 12))) == 3
+    assert sequence.seq == 12
+    unnumbered = [{'price': 1.0}]
+    assert sequence.fresh(unnumbered) == unnumbered
+
+def test_following_a_new_stream_restarts_the_numbering():
+    sequence = TradeSequence()
+    assert not sequence.follow("a")
+    sequence.fresh(numbered(1, 50))
+    assert sequence.follow("a")
+    assert not sequence.follow("b")  # a restarted simulator numbers from 1 again
+    assert len(sequence.fresh(numbered(1, 5))) == 5
+
+def test_resume_drops_trades_held_up_to_the_resume_point():
+    trades = [{'symbol': 'AAPL', 'timestamp_ns': ts} for ts in (10, 20, 20, 20, 30)]
+    trades.append({'symbol': 'MSFT', 'timestamp_ns': 5})
+    kept = drop_held_trades(trades, {'AAPL': (20, 2)})  # holds everything before 20 and two trades at 20
+    assert [(t['symbol'], t['timestamp_ns']) for t in kept] == [('AAPL', 20), ('AAPL', 30), ('MSFT', 5)]
+
+class FakeSocket:
+    def __init__(self, count):
+        self.count = count
+        self.sent = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.sent == self.count:
+            raise StopAsyncIteration
+        self.sent += 1
+        return self.sent
+
+def test_reader_stops_reading_while_the_queue_is_full():
+    async def run():
+        ws = FakeSocket(10)
+        messages = asyncio.Queue(maxsize=3)
+        reader = asyncio.create_task(read_simulator(ws, messages))
+        await asyncio.sleep(0.01)
+        assert ws.sent == 4  # three queued, the fourth waiting for room
+        received = []
+        while True:
+            msg, _ = await messages.get()
+            if msg is None:
+                break
+            received.append(msg)
+        await reader
+        return received
+
+    assert asyncio.run(run()) == list(range(1, 11))
@@ -0,0 +1,121 @@
+# timeparse.py
+# Fast parsing of the trade timestamp format used in the tick files,
+# "YYYY-MM-DD HH:MM:SS:mmm", into int64 epoch nanoseconds.
+# Shared by the simulator (whole CSV columns) and the server (trade batches).
+
+import re
+from datetime import datetime, timedelta
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+NS_PER_SECOND = 1_000_000_000
+NS_PER_MINUTE = 60 * NS_PER_SECOND
+
+_WIDTH = 24  # len("2020-07-01 04:00:00:072") plus one byte to detect longer strings
+_EPOCH = datetime(1970, 1, 1)
+# Byte offsets of the date and time digits in the fixed layout
+_DIGIT_COLUMNS = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]
+_LAYOUT = re.compile(r'(\d{4})-(\d\d)-(\d\d)[ T](\d\d):(\d\d):(\d\d)(?:[:.](\d{0,3}))?', re.ASCII)
+_MONTH_DAYS = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+def _days_from_civil(year, month, day):
+    """Days since 1970-01-01 for a proleptic Gregorian date
+
+    Works element-wise on NumPy arrays as well as on plain ints.
+    """
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * ((month + 9) % 12) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+def _fields_in_range(year, month, day, hour, minute, second):
+    """Whether the fields form a real date and time of day
+
+    Works element-wise on NumPy arrays as well as on plain ints.
+    """
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    month_days = _MONTH_DAYS[np.clip(month - 1, 0, 11)] + ((month == 2) & leap)
+    return ((month >= 1) & (month <= 12) & (day >= 1) & (day <= month_days)
+            & (hour <= 23) & (minute <= 59) & (second <= 59))
+
+def parse_timestamps(values: Iterable) -> np.ndarray:
+    """Parse a column of timestamp strings into int64 epoch nanoseconds
+
+    The fixed layout is decoded with array arithmetic in a single pass; the
+    seconds/fraction separator may be ':' or '.', and the fraction may have
+    up to three digits. Rows in any other format fall back to pandas; a row
+    that is missing or unparseable raises ValueError, as in ``parse_timestamp``.
+    """
+    strings = np.asarray(values, dtype=object)
+    if len(strings) == 0:
+        return np.empty(0, dtype=np.int64)
+    try:
+        raw = strings.astype(f'S{_WIDTH}').view(np.uint8).reshape(-1, _WIDTH)
+    except (TypeError, ValueError, UnicodeEncodeError):
+        return np.fromiter((parse_timestamp(value) for value in strings), dtype=np.int64, count=len(strings))
+
+    def field(start, stop):
+        value = raw[:, start].astype(np.int64) - ord('0')
+        for column in range(start + 1, stop):
+            value = value * 10 + (raw[:, column] - ord('0'))
+        return value
+
+    # Missing fraction digits are NUL padding and count as zero
+    fraction_bytes = raw[:, 20:23]
+    fraction = np.where(fraction_bytes >= ord('0'), fraction_bytes - ord('0'), 0).astype(np.int64)
+    year, month, day = field(0, 4), field(5, 7), field(8, 10)
+    hour, minute, second = field(11, 13), field(14, 16), field(17, 19)
+    days = _days_from_civil(year, month, day)
+    seconds = ((days * 24 + hour) * 60 + minute) * 60 + second
+    millis = fraction[:, 0] * 100 + fraction[:, 1] * 10 + fraction[:, 2]
+    result = seconds * NS_PER_SECOND + millis * 1_000_000
+
+    # Rows that don't match the layout, or whose fields are out of range, are
+    # parsed individually (and raise there if they are not timestamps at all)
+    digits = raw[:, _DIGIT_COLUMNS]
+    valid = ((raw[:, 4] == ord('-')) & (raw[:, 7] == ord('-'))
+             & ((raw[:, 10] == ord(' ')) | (raw[:, 10] == ord('T')))
+             & (raw[:, 13] == ord(':')) & (raw[:, 16] == ord(':'))
+             & ((raw[:, 19] == 0) | (raw[:, 19] == ord(':')) | (raw[:, 19] == ord('.')))
+             & (raw[:, 23] == 0)
+             & ((digits >= ord('0')) & (digits <= ord('9'))).all(axis=1)
+             & (((fraction_bytes >= ord('0')) & (fraction_bytes <= ord('9'))) | (fraction_bytes == 0)).all(axis=1)
+             & _fields_in_range(year, month, day, hour, minute, second))
+    for index in np.flatnonzero(~valid):
+        result[index] = parse_timestamp(strings[index])
+    return result
+
+def parse_timestamp(value) -> int:
+    """Parse a single timestamp (string, datetime or epoch ns int) into epoch ns
+
+    The fixed layout is decoded directly; anything else, including fields out
+    of range, goes to pandas. Raises ValueError for anything that is not a
+    timestamp, including what pandas reads as NaT (None, NaN, "NaT", "").
+    """
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    match = _LAYOUT.fullmatch(value) if isinstance(value, str) else None
+    if match is not None:
+        year, month, day, hour, minute, second = (int(group) for group in match.groups()[:6])
+        if _fields_in_range(year, month, day, hour, minute, second):
+            days = _days_from_civil(year, month, day)
+            seconds = ((days * 24 + hour) * 60 + minute) * 60 + second
+            fraction = match.group(7)
+            millis = int(fraction.ljust(3, '0')) if fraction else 0
+            return seconds * NS_PER_SECOND + millis * 1_000_000
+    if isinstance(value, str) and value.count(':') == 3:
+        # "YYYY-MM-DD HH:MM:SS:fff" with an unusual fraction length
+        head, fraction = value.rsplit(':', 1)
+        value = f"{head}.{fraction}"
+    timestamp = pd.Timestamp(value)
+    if timestamp is pd.NaT:
+        raise ValueError(f"Not a timestamp: {value!r}")
+    return timestamp.value
+
+def isoformat_ns(timestamp_ns: int) -> str:
+    """Naive ISO 8601 string for an epoch-ns timestamp (microsecond precision)"""
+    return (_EPOCH + timedelta(microseconds=int(timestamp_ns) // 1000)).isoformat()
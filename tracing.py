@@ -0,0 +1,113 @@
+# tracing.py
+# Per-stage latency of simulator batches on their way to the browsers. The
+# simulator stamps each message with a batch id and its emit time; the
+# server adds receive, decode, ingest and publish times, passes the origin
+# of each delta on to browsers, and browsers report back when it arrived.
+# All times are wall-clock epoch seconds, since they cross processes.
+
+from collections import deque
+from typing import Dict, List, Optional
+
+# Stage -> (from, to) timestamps of a trace it is measured between
+STAGES = {
+    "transport": ("emitted_at", "received_at"),     # simulator send queue and socket
+    "decode": ("received_at", "decoded_at"),        # JSON parsing
+    "ingest": ("decoded_at", "processed_at"),       # grouping and processor updates
+    "publish": ("processed_at", "published_at"),    # broadcaster wait and delta collection
+    "delivery": ("published_at", "delivered_at"),   # browser send queue, socket and client
+    "end_to_end": ("emitted_at", "delivered_at"),
+}
+# Measured by the simulator itself: how late a batch was emitted
+SCHEDULING = "scheduling"
+
+_ORIGIN_FIELDS = ("batch_id", "emitted_at", "received_at", "decoded_at", "processed_at", "published_at")
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class LatencyTracer:
+    """Follows simulator batches through the server, keeping sampled stage timings
+
+    Every batch is tracked until it is published, so every delta can name its
+    origin; only one in ``sample_every`` batches is kept as a sample, in
+    bounded per-stage windows. Browsers rate-limit their own reports.
+    """
+    def __init__(self, sample_every: int = 10, max_samples: int = 1000):
+        self.sample_every = max(1, sample_every)
+        self.samples: Dict[str, deque] = {stage: deque(maxlen=max_samples)
+                                          for stage in (SCHEDULING, *STAGES)}
+        self.recent: deque = deque(maxlen=100)  # complete server-side traces
+        self.pending: Dict[str, Dict] = {}  # oldest unpublished batch per symbol
+
+    def _sampled(self, batch_id) -> bool:
+        return not isinstance(batch_id, int) or batch_id % self.sample_every == 0
+
+    def _record(self, trace: Dict, stages):
+        for stage in stages:
+            start, end = STAGES[stage]
+            if trace.get(start) is not None and trace.get(end) is not None:
+                self.samples[stage].append(max(0.0, trace[end] - trace[start]))
+
+    def received(self, message: Dict, received_at: float, decoded_at: float) -> Optional[Dict]:
+        """Start a trace for a simulator message, or None if it carries no origin"""
+        emitted_at = message.get("emitted_at")
+        if not isinstance(emitted_at, (int, float)):
+            return None
+        trace = {"batch_id": message.get("batch_id"), "emitted_at": emitted_at,
+                 "received_at": received_at, "decoded_at": decoded_at,
+                 "sampled": self._sampled(message.get("batch_id"))}
+        if trace["sampled"] and isinstance(message.get("scheduling_lag"), (int, float)):
+            self.samples[SCHEDULING].append(message["scheduling_lag"])
+        return trace
+
+    def processed(self, trace: Optional[Dict], symbols, processed_at: float):
+        """Mark a traced batch ingested; it stays pending for ``symbols`` until published"""
+        if trace is None:
+            return
+        trace["processed_at"] = processed_at
+        if trace["sampled"]:
+            self._record(trace, ("transport", "decode", "ingest"))
+        for symbol in symbols:
+            # Deltas coalesce batches; the oldest one is the one that waited longest
+            self.pending.setdefault(symbol, trace)
+
+    def take_origin(self, symbol: str, published_at: float) -> Optional[Dict]:
+        """Origin of the oldest batch in a delta about to be published for ``symbol``"""
+        trace = self.pending.pop(symbol, None)
+        if trace is None:
+            return None
+        if "published_at" not in trace:
+            trace["published_at"] = published_at
+            if trace["sampled"]:
+                self._record(trace, ("publish",))
+                self.recent.append({field: trace.get(field) for field in _ORIGIN_FIELDS})
+        return {field: trace.get(field) for field in _ORIGIN_FIELDS}
+
+    def delivered(self, origin: Dict, delivered_at: float):
+        """Record a browser's report that a delta with ``origin`` arrived at ``delivered_at``"""
+        if not isinstance(origin, dict) or not isinstance(delivered_at, (int, float)):
+            return
+        trace = {field: origin.get(field) for field in ("emitted_at", "published_at")
+                 if isinstance(origin.get(field), (int, float))}
+        trace["delivered_at"] = delivered_at
+        self._record(trace, ("delivery", "end_to_end"))
+
+    def clear(self):
+        self.pending.clear()
+
+    def summary(self) -> Dict[str, Dict]:
+        """Sample count and percentiles in milliseconds per stage"""
+        result = {}
+        for stage, samples in self.samples.items():
+            ordered = sorted(samples)
+            if not ordered:
+                result[stage] = {"count": 0}
+                continue
+            result[stage] = {
+                "count": len(ordered),
+                "p50_ms": _percentile(ordered, 0.5) * 1000,
+                "p90_ms": _percentile(ordered, 0.9) * 1000,
+                "p99_ms": _percentile(ordered, 0.99) * 1000,
+                "max_ms": ordered[-1] * 1000,
+            }
+        return result
@@ -0,0 +1,175 @@
+# trade_buffer.py
+# Bounded, columnar storage for raw trades received by the server
+
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+class TradeSlice(NamedTuple):
+    """Read-only columns of a contiguous run of retained trades
+
+    Unless the run wraps around the end of the ring (then they are copies),
+    the arrays share memory with the buffer: they stay valid until that many
+    newer trades have been appended, so copy them if they must outlive that.
+    """
+    timestamp: np.ndarray  # int64 epoch nanoseconds
+    price: np.ndarray      # float64
+    quantity: np.ndarray   # int32
+    venue: np.ndarray      # int16 codes into ``venues``
+    venues: List[str]
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def to_records(self) -> List[Dict]:
+        """Materialize the slice as trade dicts (copies)"""
+        venues = self.venues
+        return [
+            {'timestamp': int(ts), 'price': float(price), 'quantity': int(qty), 'venue': venues[code]}
+            for ts, price, qty, code in zip(self.timestamp, self.price, self.quantity, self.venue)
+        ]
+
+class TradeRingBuffer:
+    """Ring buffer of trades stored column by column
+
+    Retention is bounded by ``max_trades`` and, optionally, by
+    ``max_age_seconds`` relative to the newest trade. Each row is stored
+    once; a queried range is returned as views, or copied if it wraps around
+    the end of the ring. Trades are expected to arrive in timestamp order.
+    """
+    def __init__(self, max_trades: int = 1_000_000, max_age_seconds: Optional[float] = None):
+        if max_trades <= 0:
+            raise ValueError("max_trades must be positive")
+        self.capacity = max_trades
+        self.max_age_ns = int(max_age_seconds * 1e9) if max_age_seconds else None
+        self._timestamp = np.zeros(max_trades, dtype=np.int64)
+        self._price = np.zeros(max_trades, dtype=np.float64)
+        self._quantity = np.zeros(max_trades, dtype=np.int32)
+        self._venue = np.zeros(max_trades, dtype=np.int16)
+        self.venues: List[str] = []
+        self._venue_codes: Dict[str, int] = {}
+        self._start = 0  # absolute index of the oldest retained trade
+        self._end = 0    # absolute index one past the newest trade
+
+    def __len__(self):
+        return self._end - self._start
+
+    @property
+    def appended(self) -> int:
+        """Trades appended since the buffer was created or cleared, retained or not"""
+        return self._end
+
+    @property
+    def row_bytes(self) -> int:
+        return (self._timestamp.itemsize + self._price.itemsize
+                + self._quantity.itemsize + self._venue.itemsize)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the retained trades"""
+        return len(self) * self.row_bytes
+
+    @property
+    def capacity_bytes(self) -> int:
+        """Bytes allocated for ``capacity`` trades, retained or not"""
+        return self.capacity * self.row_bytes
+
+    def venue_code(self, venue) -> int:
+        """Categorical code for a venue name, assigned on first sight"""
+        code = self._venue_codes.get(venue)
+        if code is None:
+            code = len(self.venues)
+            if code > np.iinfo(np.int16).max:
+                raise ValueError("Too many distinct venues")
+            self._venue_codes[venue] = code
+            self.venues.append(venue)
+        return code
+
+    def extend(self, timestamps, prices, quantities, venue_codes):
+        """Append a batch of trades given as equal-length columns"""
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        count = len(timestamps)
+        if count == 0:
+            return
+        columns = (
+            (self._timestamp, timestamps),
+            (self._price, np.asarray(prices, dtype=np.float64)),
+            (self._quantity, np.asarray(quantities, dtype=np.int32)),
+            (self._venue, np.asarray(venue_codes, dtype=np.int16)),
+        )
+        if count > self.capacity:
+            # Only the newest ``capacity`` trades can be retained
+            skip = count - self.capacity
+            columns = tuple((target, values[skip:]) for target, values in columns)
+            self._end += skip
+            count = self.capacity
+
+        capacity = self.capacity
+        position = self._end % capacity
+        first = min(count, capacity - position)
+        for target, values in columns:
+            # Wrapping around the end of the ring
+            target[position:position + first] = values[:first]
+            target[:count - first] = values[first:]
+        self._end += count
+
+        self._start = max(self._start, self._end - capacity)
+        if self.max_age_ns is not None:
+            cutoff = int(self._timestamp[(self._end - 1) % capacity]) - self.max_age_ns
+            self._start += self._search(cutoff)
+
+    def _search(self, timestamp: int) -> int:
+        """Number of retained trades older than ``timestamp`` (binary search)"""
+        offset = self._start % self.capacity
+        head = self._timestamp[offset:offset + len(self)]
+        wrapped = len(self) - len(head)
+        if wrapped and timestamp > head[-1]:
+            return len(head) + int(np.searchsorted(self._timestamp[:wrapped], timestamp, side='left'))
+        return int(np.searchsorted(head, timestamp, side='left'))
+
+    def _column(self, column: np.ndarray, lo: int, hi: int) -> np.ndarray:
+        """Retained rows ``lo:hi`` of a column: a view, or a copy if they wrap"""
+        offset = (self._start + lo) % self.capacity
+        if offset + hi - lo <= self.capacity:
+            view = column[offset:offset + hi - lo]
+            view.flags.writeable = False
+            return view
+        return np.concatenate((column[offset:], column[:offset + hi - lo - self.capacity]))
+
+    def slice(self, start_ns: Optional[int] = None, end_ns: Optional[int] = None,
+              limit: Optional[int] = None) -> TradeSlice:
+        """Trades with ``start_ns <= timestamp < end_ns``, as views unless they wrap
+
+        With ``limit``, only the newest ``limit`` trades of the range are returned.
+        """
+        lo = self._search(start_ns) if start_ns is not None else 0
+        hi = self._search(end_ns) if end_ns is not None else len(self)
+        if limit is not None:
+            lo = max(lo, hi - limit)
+        lo = min(lo, hi)
+        return TradeSlice(
+            self._column(self._timestamp, lo, hi),
+            self._column(self._price, lo, hi),
+            self._column(self._quantity, lo, hi),
+            self._column(self._venue, lo, hi),
+            self.venues
+        )
+
+    def to_columns(self) -> Dict[str, np.ndarray]:
+        """Copies of the retained trades as columns, e.g. for a checkpoint"""
+        view = self.slice()
+        return {'timestamp': np.array(view.timestamp), 'price': np.array(view.price),
+                'quantity': np.array(view.quantity), 'venue': np.array(view.venue)}
+
+    def load_columns(self, columns: Dict[str, np.ndarray], venues: List[str]):
+        """Replace the contents with trades from ``to_columns``"""
+        self.clear()
+        for venue in venues:
+            self.venue_code(venue)
+        self.extend(columns['timestamp'], columns['price'], columns['quantity'], columns['venue'])
+
+    def clear(self):
+        self._start = 0
+        self._end = 0
+        self.venues = []
+        self._venue_codes = {}
@@ -0,0 +1,166 @@
+# trade_frames.py
+# Compact binary frames for trade batches from the simulator to the server,
+# an alternative to the JSON messages negotiated per connection
+# (/ws?format=binary). A frame holds the batch's trades as columns, with
+# symbols and venues as codes into dictionaries carried in the frame:
+#
+#   header        magic, trade count, first sequence number, batch id,
+#                 emit time and scheduling lag (see _HEADER)
+#   columns       timestamp_ns int64, price float64, quantity int32,
+#                 symbol code int16, venue code int16; little-endian
+#   strings       stream id, then the symbol and venue dictionaries
+#
+# Shared by the simulator (encoding straight from the replay columns) and
+# the server (ingesting the decoded columns without building trade dicts).
+
+import struct
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+FORMATS = ("json", "binary")
+
+MAGIC = b"TRF1"
+# Magic, count, first seq (-1 for none), batch id (-1 for none), emitted_at, scheduling_lag
+_HEADER = struct.Struct('<4sIqqdd')
+_COUNT = struct.Struct('<H')
+_COLUMNS = (("timestamps", '<i8'), ("prices", '<f8'), ("quantities", '<i4'),
+            ("symbol_codes", '<i2'), ("venue_codes", '<i2'))
+
+class TradeColumns:
+    """A batch of trades as columns, in the order they were sent
+
+    Symbols and venues are codes into ``symbols`` and ``venues``; trade ``i``
+    has sequence number ``first_seq + i`` if ``first_seq`` is set.
+    """
+    __slots__ = ('timestamps', 'prices', 'quantities', 'symbol_codes', 'venue_codes',
+                 'symbols', 'venues', 'first_seq')
+
+    def __init__(self, timestamps: np.ndarray, prices: np.ndarray, quantities: np.ndarray,
+                 symbol_codes: np.ndarray, venue_codes: np.ndarray, symbols: List[str],
+                 venues: List[str], first_seq: Optional[int] = None):
+        self.timestamps = timestamps
+        self.prices = prices
+        self.quantities = quantities
+        self.symbol_codes = symbol_codes
+        self.venue_codes = venue_codes
+        self.symbols = symbols
+        self.venues = venues
+        self.first_seq = first_seq
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, index: slice) -> 'TradeColumns':
+        start = index.indices(len(self))[0]
+        return TradeColumns(self.timestamps[index], self.prices[index], self.quantities[index],
+                            self.symbol_codes[index], self.venue_codes[index], self.symbols, self.venues,
+                            self.first_seq + start if self.first_seq is not None else None)
+
+    def by_symbol(self) -> Dict[str, 'TradeColumns']:
+        """The trades of each symbol, in order"""
+        codes = self.symbol_codes
+        if not len(codes):
+            return {}
+        if (codes == codes[0]).all():
+            return {self.symbols[int(codes[0])]: self}
+        order = np.argsort(codes, kind='stable')
+        sorted_codes = codes[order]
+        bounds = np.flatnonzero(np.diff(sorted_codes)) + 1
+        batches = {}
+        for rows in np.split(order, bounds):
+            batches[self.symbols[int(codes[rows[0]])]] = TradeColumns(
+                self.timestamps[rows], self.prices[rows], self.quantities[rows], self.symbol_codes[rows],
+                self.venue_codes[rows], self.symbols, self.venues)
+        return batches
+
+    def rows(self) -> Iterator[Tuple[int, float, int, str]]:
+        """``(timestamp_ns, price, quantity, venue)`` of every trade"""
+        venues = self.venues
+        return zip(self.timestamps.tolist(), self.prices.tolist(), self.quantities.tolist(),
+                   [venues[code] for code in self.venue_codes.tolist()])
+
+    @classmethod
+    def concatenate(cls, parts: List['TradeColumns']) -> 'TradeColumns':
+        """One batch of consecutive parts, whose dictionaries may differ"""
+        if len(parts) == 1:
+            return parts[0]
+        symbols: Dict[str, int] = {}
+        venues: Dict[str, int] = {}
+        symbol_codes, venue_codes = [], []
+        for part in parts:
+            symbol_map = np.array([symbols.setdefault(name, len(symbols)) for name in part.symbols] or [0],
+                                  dtype=np.int16)
+            venue_map = np.array([venues.setdefault(name, len(venues)) for name in part.venues] or [0],
+                                 dtype=np.int16)
+            symbol_codes.append(symbol_map[part.symbol_codes])
+            venue_codes.append(venue_map[part.venue_codes])
+        return cls(np.concatenate([part.timestamps for part in parts]),
+                   np.concatenate([part.prices for part in parts]),
+                   np.concatenate([part.quantities for part in parts]),
+                   np.concatenate(symbol_codes), np.concatenate(venue_codes),
+                   list(symbols), list(venues), parts[0].first_seq)
+
+def _pack_strings(values: List[str]) -> bytes:
+    encoded = [value.encode() for value in values]
+    return _COUNT.pack(len(encoded)) + b"".join(_COUNT.pack(len(value)) + value for value in encoded)
+
+def _unpack_strings(data: bytes, offset: int) -> Tuple[List[str], int]:
+    (count,) = _COUNT.unpack_from(data, offset)
+    offset += _COUNT.size
+    values = []
+    for _ in range(count):
+        (length,) = _COUNT.unpack_from(data, offset)
+        offset += _COUNT.size
+        if offset + length > len(data):
+            raise struct.error("string runs past the end of the frame")
+        values.append(data[offset:offset + length].decode())
+        offset += length
+    return values, offset
+
+def encode_trade_frame(trades: TradeColumns, message: Dict) -> bytes:
+    """Binary frame of a trade message; ``message`` holds its other fields"""
+    first_seq = trades.first_seq if trades.first_seq is not None else -1
+    batch_id = message.get("batch_id")
+    parts = [_HEADER.pack(MAGIC, len(trades), first_seq, batch_id if batch_id is not None else -1,
+                          message.get("emitted_at") or 0.0, message.get("scheduling_lag") or 0.0)]
+    for name, dtype in _COLUMNS:
+        parts.append(np.ascontiguousarray(getattr(trades, name), dtype=dtype).tobytes())
+    parts.append(_pack_strings([message.get("stream") or ""]))
+    parts.append(_pack_strings(trades.symbols))
+    parts.append(_pack_strings(trades.venues))
+    return b"".join(parts)
+
+def decode_trade_frame(data: bytes) -> Dict:
+    """The trade message of a binary frame, with its trades as ``TradeColumns``
+
+    Raises ValueError for anything that is not a trade frame.
+    """
+    if len(data) < _HEADER.size:
+        raise ValueError("Truncated trade frame")
+    magic, count, first_seq, batch_id, emitted_at, scheduling_lag = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a trade frame")
+    offset = _HEADER.size
+    columns = {}
+    for name, dtype in _COLUMNS:
+        size = np.dtype(dtype).itemsize * count
+        if offset + size > len(data):
+            raise ValueError("Truncated trade frame")
+        columns[name] = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+        offset += size
+    try:
+        (stream,), offset = _unpack_strings(data, offset)
+        symbols, offset = _unpack_strings(data, offset)
+        venues, offset = _unpack_strings(data, offset)
+    except struct.error:
+        raise ValueError("Truncated trade frame")
+    trades = TradeColumns(symbols=symbols, venues=venues,
+                          first_seq=first_seq if first_seq >= 0 else None, **columns)
+    return {
+        "batch_id": batch_id if batch_id >= 0 else None,
+        "stream": stream or None,
+        "emitted_at": emitted_at or None,
+        "scheduling_lag": scheduling_lag,
+        "trades": trades,
+    }
@@ -0,0 +1,223 @@
+# trade_log.py
+# Append-only, segmented write-ahead log of ingested trades plus compact
+# checkpoints, so a TradeProcessor can be rebuilt quickly after a restart:
+# load the latest checkpoint, then replay only the records written after it.
+#
+# Layout of a log directory (one per symbol):
+#   segment-000000000001.log ...  records, appended in ingest order
+#   checkpoint.npz                latest checkpoint, replaced atomically
+
+import glob
+import io
+import json
+import logging
+import os
+import struct
+import zlib
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("server")
+
+SEGMENT_PATTERN = "segment-{:012d}.log"
+CHECKPOINT_FILE = "checkpoint.npz"
+
+# Record framing: payload length and CRC32 of the payload
+_FRAME = struct.Struct('<II')
+# Payload header: trade count and number of venue names that follow
+_COUNTS = struct.Struct('<IH')
+_NAME_LENGTH = struct.Struct('<H')
+
+# Position in the log: (segment number, byte offset within the segment)
+LogPosition = Tuple[int, int]
+
+class TradeRecord:
+    """One logged batch of trades, as columns"""
+    __slots__ = ('timestamps', 'prices', 'quantities', 'venue_codes', 'venues')
+
+    def __init__(self, timestamps: np.ndarray, prices: np.ndarray, quantities: np.ndarray,
+                 venue_codes: np.ndarray, venues: List[str]):
+        self.timestamps = timestamps
+        self.prices = prices
+        self.quantities = quantities
+        self.venue_codes = venue_codes
+        self.venues = venues
+
+    def to_trades(self) -> List[Dict]:
+        """Trade dicts in the form accepted by ``TradeProcessor.ingest``"""
+        venues = self.venues
+        return [
+            {'timestamp_ns': ts, 'price': price, 'quantity': quantity, 'venue': venues[code]}
+            for ts, price, quantity, code in zip(self.timestamps.tolist(), self.prices.tolist(),
+                                                 self.quantities.tolist(), self.venue_codes.tolist())
+        ]
+
+def encode_record(timestamps, prices, quantities, venue_codes, venues: List[str]) -> bytes:
+    """Frame a batch of trade columns; ``venue_codes`` index into ``venues``
+
+    Only the venues the batch uses are stored, so every record can be decoded
+    on its own.
+    """
+    codes = np.asarray(venue_codes, dtype=np.int64)
+    used, local_codes = np.unique(codes, return_inverse=True)
+    names = [(venues[code] if venues[code] is not None else "").encode() for code in used.tolist()]
+    parts = [_COUNTS.pack(len(codes), len(names))]
+    for name in names:
+        parts.append(_NAME_LENGTH.pack(len(name)))
+        parts.append(name)
+    parts.append(np.asarray(timestamps, dtype='<i8').tobytes())
+    parts.append(np.asarray(prices, dtype='<f8').tobytes())
+    parts.append(np.asarray(quantities, dtype='<i8').tobytes())
+    parts.append(local_codes.astype('<u2').tobytes())
+    payload = b"".join(parts)
+    return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+def decode_record(payload: bytes) -> TradeRecord:
+    count, name_count = _COUNTS.unpack_from(payload, 0)
+    offset = _COUNTS.size
+    venues = []
+    for _ in range(name_count):
+        (length,) = _NAME_LENGTH.unpack_from(payload, offset)
+        offset += _NAME_LENGTH.size
+        venues.append(payload[offset:offset + length].decode() or None)
+        offset += length
+
+    def column(dtype):
+        nonlocal offset
+        values = np.frombuffer(payload, dtype=dtype, count=count, offset=offset)
+        offset += values.nbytes
+        return values
+
+    return TradeRecord(column('<i8'), column('<f8'), column('<i8'), column('<u2'), venues)
+
+class TradeLog:
+    """Segmented append-only trade log with a single latest checkpoint
+
+    Appends go to the newest segment and start a new one past
+    ``segment_bytes``. A torn record at the end of the log (e.g. after a
+    crash mid-write) fails its length or CRC check; it ends replay and is
+    cut off before the next append.
+    """
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024, fsync: bool = False):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self._file: Optional[io.BufferedWriter] = None
+        self._segment = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, SEGMENT_PATTERN.format(segment))
+
+    def segments(self) -> List[int]:
+        paths = glob.glob(os.path.join(self.directory, "segment-*.log"))
+        return sorted(int(os.path.basename(path)[8:-4]) for path in paths)
+
+    @property
+    def position(self) -> LogPosition:
+        """Position just past the last appended record"""
+        if self._file is None:
+            self._open_for_append()
+        return self._segment, self._file.tell()
+
+    def _open_for_append(self):
+        segments = self.segments()
+        self._segment = segments[-1] if segments else 1
+        path = self._segment_path(self._segment)
+        end = self._valid_length(path) if segments else 0
+        self._file = open(path, 'r+b' if segments else 'wb')
+        self._file.truncate(end)
+        self._file.seek(end)
+
+    def _valid_length(self, path: str) -> int:
+        """Length of the intact prefix of a segment"""
+        offset = 0
+        for offset, _ in self._scan(path, 0):
+            pass
+        return offset
+
+    def _scan(self, path: str, offset: int) -> Iterator[Tuple[int, bytes]]:
+        """Yield ``(end_offset, payload)`` for each intact record from ``offset``"""
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            while True:
+                frame = f.read(_FRAME.size)
+                if len(frame) < _FRAME.size:
+                    return
+                length, crc = _FRAME.unpack(frame)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    logger.warning(f"Ignoring torn record at {path}:{offset}")
+                    return
+                offset += _FRAME.size + length
+                yield offset, payload
+
+    def append(self, timestamps, prices, quantities, venue_codes, venues: List[str]):
+        """Append one batch of trades and flush it to the OS (and disk with ``fsync``)"""
+        if len(timestamps) == 0:
+            return
+        if self._file is None:
+            self._open_for_append()
+        elif self._file.tell() >= self.segment_bytes:
+            self._file.close()
+            self._segment += 1
+            self._file = open(self._segment_path(self._segment), 'wb')
+        self._file.write(encode_record(timestamps, prices, quantities, venue_codes, venues))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def replay(self, start: LogPosition = (0, 0)) -> Iterator[Tuple[LogPosition, TradeRecord]]:
+        """Records after ``start``, each with the position just past it"""
+        for segment in self.segments():
+            if segment < start[0]:
+                continue
+            offset = start[1] if segment == start[0] else 0
+            for end, payload in self._scan(self._segment_path(segment), offset):
+                yield (segment, end), decode_record(payload)
+
+    def write_checkpoint(self, arrays: Dict[str, np.ndarray], meta: Dict):
+        """Atomically replace the checkpoint, then drop segments it covers
+
+        ``meta`` must include the log ``position`` the state corresponds to;
+        with ``trades_from``, segments from that position on are kept too.
+        """
+        path = os.path.join(self.directory, CHECKPOINT_FILE)
+        staging = path + ".tmp"
+        with open(staging, 'wb') as f:
+            np.savez(f, meta=np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8), **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(staging, path)
+        for segment in self.segments():
+            if segment < meta.get("trades_from", meta["position"])[0]:
+                os.remove(self._segment_path(segment))
+
+    def load_checkpoint(self) -> Optional[Tuple[Dict[str, np.ndarray], Dict]]:
+        path = os.path.join(self.directory, CHECKPOINT_FILE)
+        try:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (OSError, ValueError) as e:
+            if os.path.exists(path):
+                logger.error(f"Unreadable checkpoint {path}: {e}")
+            return None
+        meta = json.loads(arrays.pop("meta").tobytes())
+        meta["position"] = tuple(meta["position"])
+        return arrays, meta
+
+    def reset(self):
+        """Delete every segment and the checkpoint"""
+        self.close()
+        for segment in self.segments():
+            os.remove(self._segment_path(segment))
+        for name in (CHECKPOINT_FILE, CHECKPOINT_FILE + ".tmp"):
+            path = os.path.join(self.directory, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None